@@ -0,0 +1,480 @@
+"""
+Análise dos logs de função exportados da Vercel (JSON, como logs_result.json).
+
+Lê o export aos poucos (lista JSON ou JSON Lines, também .gz; exports de
+centenas de MB não são carregados inteiros) e junta os registros de cada
+requisição pelo requestId: o registro com durationMs/maxMemoryUsed e as
+mensagens de log da mesma requisição. Relatório:
+- latência por rota (p50, p95, p99, máximo) e respostas 5xx;
+- cold starts: frequência e custo (Init Duration, quando o log traz, e a
+  diferença entre a duração das requisições frias e das quentes);
+- memória: uso (p95, máximo) contra memorySize, e a folga que sobra;
+- erros agrupados pela assinatura do traceback (exceção + último frame),
+  com números, IDs e caminhos de deploy normalizados;
+- etapas de cada requisição, a partir das linhas "METRICAS {json}" da API
+  (rauberskat_metricas.py): leituras e gravações do armazenamento contra o
+  tempo em Python (pontuação, transição e o resto), e as mais lentas.
+
+Uma requisição conta como fria quando o log traz "Init Duration", quando é a
+primeira de um instanceId no export, ou quando a importação falhou ("Error
+importing"): a importação só acontece ao iniciar a instância.
+
+--comparar A B põe dois deploys lado a lado (rota a rota, com a diferença),
+para atribuir uma mudança de latência a um release. A e B são deploymentId
+(ou o começo dele) presentes nos arquivos, ou outros arquivos de export.
+
+Uso:
+    python analisar_logs.py logs_result.json [outro.json ...]
+    python analisar_logs.py logs.json.gz --comparar dpl_8R5Z dpl_59YY
+    python analisar_logs.py antes.json --comparar antes.json depois.json
+"""
+import argparse
+import array
+import collections
+import gzip
+import heapq
+import json
+import os
+import re
+import sys
+
+from rauberskat_metricas import ETAPAS
+
+# Bloco lido de cada vez do export
+TAMANHO_BLOCO = 1024 * 1024
+# Requisições em aberto esperando outros registros do mesmo requestId (os
+# registros de uma requisição ficam próximos no export)
+JANELA_REQUISICOES = 20000
+# Rotas e assinaturas mostradas no relatório
+MOSTRAR = 20
+# Requisições mais lentas mostradas com as etapas
+MOSTRAR_LENTAS = 10
+
+RE_INIT = re.compile(r"Init Duration:\s*([\d.]+)\s*ms")
+RE_METRICAS = re.compile(r"METRICAS (\{.*\})")
+RE_FRAME = re.compile(r'File "([^"]+)", line \d+, in (\S+)')
+RE_EXCECAO = re.compile(r"^([A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt|Warning|Timeout)\w*)(?::\s*(.*))?$")
+# Segmento de rota que é um ID (partida, token): vira <id>
+RE_ID = re.compile(r"^(?=.*\d)[A-Za-z0-9_-]{8,}$|^[A-Za-z0-9]{20,}$")
+
+
+def ler_registros(caminho):
+    """Objetos do export (lista JSON ou um por linha), decodificados um a um."""
+    if caminho == "-":
+        arquivo = sys.stdin
+    elif caminho.endswith(".gz"):
+        arquivo = gzip.open(caminho, "rt", encoding="utf-8")
+    else:
+        arquivo = open(caminho, encoding="utf-8")
+    decodificador = json.JSONDecoder()
+    with arquivo:
+        texto, pos, terminou = "", 0, False
+        while True:
+            while pos < len(texto) and texto[pos] in " \t\r\n,[]":
+                pos += 1
+            try:
+                if pos == len(texto):
+                    raise ValueError("bloco vazio")
+                registro, pos = decodificador.raw_decode(texto, pos)
+            except ValueError:
+                # Objeto cortado no fim do bloco: lê mais e tenta de novo
+                if terminou:
+                    if pos < len(texto):
+                        raise ValueError(f"{caminho}: JSON inválido perto de {texto[pos:pos + 80]!r}")
+                    return
+                bloco = arquivo.read(TAMANHO_BLOCO)
+                terminou = not bloco
+                texto, pos = texto[pos:] + bloco, 0
+                continue
+            if isinstance(registro, dict):
+                yield registro
+
+
+def _numero(valor):
+    """durationMs, maxMemoryUsed... vêm como número, texto, "" ou -1 (sem dado)."""
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return None
+    return numero if numero >= 0 else None
+
+
+def normalizar_rota(registro):
+    """Caminho sem o host e sem a query, com os IDs trocados por <id>."""
+    caminho = str(registro.get("requestPath") or "")
+    if not caminho.startswith("/"):
+        caminho = "/" + caminho.partition("/")[2]
+    caminho = caminho.split("?")[0]
+    return "/".join("<id>" if RE_ID.match(parte) else parte for parte in caminho.split("/")) or "/"
+
+
+def _normalizar_texto(texto):
+    texto = re.sub(r"/var/task/(_vendor/)?", "", texto)
+    texto = re.sub(r"\b[0-9a-f]{8,}\b|\b(?=\w*\d)[A-Za-z0-9_-]{16,}\b", "<id>", texto)
+    return re.sub(r"\d+", "N", texto).strip()
+
+
+def assinaturas(mensagem):
+    """
+    Assinaturas dos erros de uma mensagem: para cada traceback, a exceção e
+    o último frame; sem traceback, a primeira linha normalizada.
+    """
+    encontradas = []
+    blocos = mensagem.split("Traceback (most recent call last):")
+    for bloco in blocos[1:]:
+        frames = RE_FRAME.findall(bloco)
+        excecao = None
+        for linha in bloco.splitlines():
+            achou = RE_EXCECAO.match(linha.strip())
+            if achou:
+                excecao = achou
+                break
+        tipo = excecao.group(1) if excecao else "Traceback"
+        detalhe = _normalizar_texto(excecao.group(2) or "") if excecao else ""
+        onde = f"{_normalizar_texto(frames[-1][0])}:{frames[-1][1]}" if frames else "?"
+        encontradas.append(f"{tipo} em {onde}" + (f": {detalhe[:160]}" if detalhe else ""))
+    if not encontradas and mensagem.strip():
+        encontradas.append(_normalizar_texto(mensagem.strip().splitlines()[0])[:200])
+    return encontradas
+
+
+class _Requisicao:
+    """Os registros de um requestId, juntos."""
+
+    def __init__(self, registro):
+        self.rota = normalizar_rota(registro)
+        self.deploy = registro.get("deploymentId") or "?"
+        self.tempo = _numero(registro.get("timestampInMs"))
+        self.duracao = self.memoria = self.memoria_total = self.init = self.status = None
+        self.instancia = ""
+        self.falha_na_importacao = False
+        self.erros = set()
+        self.metricas = None
+
+    def acrescentar(self, registro):
+        duracao = _numero(registro.get("durationMs"))
+        if duracao is not None:
+            self.duracao = max(duracao, self.duracao or 0)
+        memoria = _numero(registro.get("maxMemoryUsed"))
+        if memoria is not None:
+            self.memoria = max(memoria, self.memoria or 0)
+        memoria_total = _numero(registro.get("memorySize"))
+        if memoria_total is not None:
+            self.memoria_total = memoria_total
+        status = _numero(registro.get("responseStatusCode"))
+        if status is not None:
+            self.status = max(int(status), self.status or 0)  # Um 500 em qualquer registro vale
+        self.instancia = registro.get("instanceId") or self.instancia
+        mensagem = str(registro.get("message") or "")
+        init = RE_INIT.search(mensagem)
+        if init:
+            self.init = float(init.group(1))
+        if "Error importing" in mensagem:
+            self.falha_na_importacao = True
+        metricas = RE_METRICAS.search(mensagem)
+        if metricas:
+            try:
+                self.metricas = json.loads(metricas.group(1))
+            except ValueError:
+                pass  # Linha cortada pelo limite de tamanho do log
+        if registro.get("level") in ("error", "fatal") or "Traceback (most recent call last)" in mensagem:
+            self.erros.update(assinaturas(mensagem))
+
+
+class _Rota:
+    """Números de uma rota num deploy."""
+
+    def __init__(self):
+        self.requisicoes = 0
+        self.erros_5xx = 0
+        self.com_erro = 0
+        self.duracoes = array.array("d")
+        self.frias = array.array("d")
+        self.quentes = array.array("d")
+        self.inits = array.array("d")
+        self.memorias = array.array("d")
+        self.memoria_total = None
+        self.etapas = collections.defaultdict(lambda: array.array("d"))  # das linhas METRICAS
+
+    def juntar(self, outra):
+        self.requisicoes += outra.requisicoes
+        self.erros_5xx += outra.erros_5xx
+        self.com_erro += outra.com_erro
+        for campo in ("duracoes", "frias", "quentes", "inits", "memorias"):
+            getattr(self, campo).extend(getattr(outra, campo))
+        for etapa, valores in outra.etapas.items():
+            self.etapas[etapa].extend(valores)
+        self.memoria_total = max(filter(None, (self.memoria_total, outra.memoria_total)), default=None)
+
+
+class Analise:
+    """Acumula as requisições por deploy e por rota."""
+
+    def __init__(self):
+        self.registros = 0
+        self.rotas = collections.defaultdict(lambda: collections.defaultdict(_Rota))  # deploy -> rota -> _Rota
+        self.erros = collections.defaultdict(collections.Counter)  # deploy -> assinatura -> requisições
+        self.exemplos = {}  # assinatura -> requestId
+        self.inicio_deploy = {}  # deploy -> primeiro timestampInMs
+        self.lentas = []  # heap (total_ms, requestId, deploy, rota, metricas) das mais lentas
+        self._instancias = set()
+        self._abertas = collections.OrderedDict()
+
+    def ler(self, caminho):
+        for registro in ler_registros(caminho):
+            self.registros += 1
+            chave = registro.get("requestId") or f"sem-id-{self.registros}"
+            requisicao = self._abertas.get(chave)
+            if requisicao is None:
+                requisicao = self._abertas[chave] = _Requisicao(registro)
+            else:
+                self._abertas.move_to_end(chave)
+            requisicao.acrescentar(registro)
+            while len(self._abertas) > JANELA_REQUISICOES:
+                self._fechar(*self._abertas.popitem(last=False))
+        while self._abertas:
+            self._fechar(*self._abertas.popitem(last=False))
+
+    def _fechar(self, chave, requisicao):
+        rota = self.rotas[requisicao.deploy][requisicao.rota]
+        rota.requisicoes += 1
+        if requisicao.tempo is not None:
+            self.inicio_deploy[requisicao.deploy] = min(self.inicio_deploy.get(requisicao.deploy, requisicao.tempo),
+                                                        requisicao.tempo)
+        fria = requisicao.init is not None or requisicao.falha_na_importacao
+        if requisicao.instancia:
+            fria = fria or (requisicao.deploy, requisicao.instancia) not in self._instancias
+            self._instancias.add((requisicao.deploy, requisicao.instancia))
+        if requisicao.duracao is not None:
+            rota.duracoes.append(requisicao.duracao)
+            (rota.frias if fria else rota.quentes).append(requisicao.duracao)
+        elif fria:
+            rota.frias.append(float("nan"))  # Conta a frequência, sem duração
+        if requisicao.init is not None:
+            rota.inits.append(requisicao.init)
+        if requisicao.memoria is not None:
+            rota.memorias.append(requisicao.memoria)
+        if requisicao.metricas is not None:
+            self._somar_etapas(chave, requisicao, rota)
+        if requisicao.memoria_total is not None:
+            rota.memoria_total = max(requisicao.memoria_total, rota.memoria_total or 0)
+        if requisicao.status is not None and requisicao.status >= 500:
+            rota.erros_5xx += 1
+        if requisicao.erros:
+            rota.com_erro += 1
+            for assinatura in requisicao.erros:
+                self.erros[requisicao.deploy][assinatura] += 1
+                self.exemplos.setdefault(assinatura, chave)
+
+    def _somar_etapas(self, chave, requisicao, rota):
+        metricas = requisicao.metricas
+        try:
+            total = float(metricas["total_ms"])
+            tempos = {etapa: float(metricas.get(f"{etapa}_ms", 0)) for etapa in ETAPAS}
+        except (KeyError, TypeError, ValueError):
+            return
+        rota.etapas["total"].append(total)
+        for etapa, tempo in tempos.items():
+            rota.etapas[etapa].append(tempo)
+        # Python: tudo o que não foi ida e volta ao armazenamento
+        rota.etapas["python"].append(max(total - tempos["leitura"] - tempos["escrita"], 0))
+        rota.etapas["bytes"].append(float(metricas.get("bytes") or 0))
+        item = (total, chave, requisicao.deploy, requisicao.rota, metricas)
+        if len(self.lentas) < MOSTRAR_LENTAS:
+            heapq.heappush(self.lentas, item)
+        elif total > self.lentas[0][0]:
+            heapq.heapreplace(self.lentas, item)
+
+    # --- Consultas ---
+
+    def deploys(self):
+        """Deploys na ordem em que aparecem (o release mais antigo primeiro)."""
+        return sorted(self.rotas, key=lambda deploy: self.inicio_deploy.get(deploy, float("inf")))
+
+    def encontrar_deploy(self, prefixo):
+        achados = [deploy for deploy in self.rotas if deploy.startswith(prefixo)]
+        if len(achados) != 1:
+            raise SystemExit(f"Deploy '{prefixo}': {len(achados)} correspondências em {', '.join(self.deploys())}.")
+        return achados[0]
+
+    def por_rota(self, deploys=None):
+        """rota -> _Rota com os deploys informados (todos, se None) somados."""
+        juntas = collections.defaultdict(_Rota)
+        for deploy in deploys or self.rotas:
+            for rota, numeros in self.rotas[deploy].items():
+                juntas[rota].juntar(numeros)
+        return juntas
+
+    def erros_de(self, deploys=None):
+        contagem = collections.Counter()
+        for deploy in deploys or self.erros:
+            contagem.update(self.erros[deploy])
+        return contagem
+
+
+# --- Estatística ---
+
+def percentil(valores, p):
+    valores = sorted(v for v in valores if v == v)  # Sem os NaN
+    if not valores:
+        return None
+    return valores[min(int(len(valores) * p / 100), len(valores) - 1)]
+
+
+def _ms(valor):
+    return "-" if valor is None else f"{valor:.0f}"
+
+
+def _delta(antes, depois):
+    if antes is None or depois is None:
+        return "-"
+    return f"{round(depois - antes):+d}" + (f" ({(depois - antes) / antes:+.0%})" if antes else "")
+
+
+def _pct(parte, total):
+    return f"{parte / total:.1%}" if total else "-"
+
+
+# --- Relatórios ---
+
+def relatorio(analise, deploys=None, titulo="Todos os deploys"):
+    rotas = analise.por_rota(deploys)
+    total = sum(r.requisicoes for r in rotas.values())
+    print(f"\n=== {titulo}: {total} requisições ===")
+
+    print("\nLatência por rota (ms)")
+    print(f"  {'rota':<40} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'máx':>7} {'5xx':>6}")
+    for rota, r in sorted(rotas.items(), key=lambda item: -item[1].requisicoes)[:MOSTRAR]:
+        print(f"  {rota[:40]:<40} {r.requisicoes:>6} {_ms(percentil(r.duracoes, 50)):>7} "
+              f"{_ms(percentil(r.duracoes, 95)):>7} {_ms(percentil(r.duracoes, 99)):>7} "
+              f"{_ms(max(r.duracoes, default=None)):>7} {r.erros_5xx:>6}")
+
+    todas = _Rota()
+    for r in rotas.values():
+        todas.juntar(r)
+    print("\nCold starts")
+    print(f"  frias: {len(todas.frias)} de {total} requisições ({_pct(len(todas.frias), total)})")
+    if todas.inits:
+        print(f"  Init Duration: p50 {_ms(percentil(todas.inits, 50))} ms, p95 {_ms(percentil(todas.inits, 95))} ms, "
+              f"total {sum(todas.inits) / 1000:.1f} s")
+    fria, quente = percentil(todas.frias, 50), percentil(todas.quentes, 50)
+    print(f"  duração p50 (ms): fria {_ms(fria)}, quente {_ms(quente)}, custo {_delta(quente, fria)}")
+
+    print("\nMemória (MB)")
+    com_memoria = [(rota, r) for rota, r in rotas.items() if r.memorias]
+    if not com_memoria:
+        print("  o export não traz maxMemoryUsed")
+    for rota, r in sorted(com_memoria, key=lambda item: -max(item[1].memorias))[:MOSTRAR]:
+        maximo = max(r.memorias)
+        folga = f"{r.memoria_total - maximo:.0f} ({(r.memoria_total - maximo) / r.memoria_total:.0%})" \
+            if r.memoria_total else "-"
+        print(f"  {rota[:40]:<40} p95 {_ms(percentil(r.memorias, 95)):>6}  máx {maximo:>6.0f}  "
+              f"de {_ms(r.memoria_total):>6}  folga mínima {folga}")
+
+    erros = analise.erros_de(deploys)
+    print(f"\nErros por assinatura ({sum(r.com_erro for r in rotas.values())} requisições com erro)")
+    for assinatura, quantidade in erros.most_common(MOSTRAR):
+        print(f"  {quantidade:>6}  {assinatura}")
+        print(f"          ex.: requestId {analise.exemplos[assinatura]}")
+
+    com_etapas = [(rota, r) for rota, r in rotas.items() if r.etapas]
+    if com_etapas:
+        print("\nEtapas por rota (p50 em ms, linhas METRICAS; python = total - leitura - escrita)")
+        print(f"  {'rota':<40} {'n':>6} {'total':>7} {'leitura':>8} {'escrita':>8} {'python':>7} "
+              f"{'pontuação':>9} {'transição':>9} {'bytes':>7} {'banco':>6}")
+        for rota, r in sorted(com_etapas, key=lambda item: -len(item[1].etapas["total"]))[:MOSTRAR]:
+            banco = sum(r.etapas["leitura"]) + sum(r.etapas["escrita"])
+            print(f"  {rota[:40]:<40} {len(r.etapas['total']):>6} {percentil(r.etapas['total'], 50):>7.1f} "
+                  f"{percentil(r.etapas['leitura'], 50):>8.1f} {percentil(r.etapas['escrita'], 50):>8.1f} "
+                  f"{percentil(r.etapas['python'], 50):>7.1f} {percentil(r.etapas['pontuacao'], 50):>9.2f} "
+                  f"{percentil(r.etapas['transicao'], 50):>9.2f} {percentil(r.etapas['bytes'], 50):>7.0f} "
+                  f"{_pct(banco, sum(r.etapas['total'])):>6}")
+        lentas = sorted((item for item in analise.lentas if deploys is None or item[2] in deploys), reverse=True)
+        print("\nMais lentas (ms)")
+        for total, chave, deploy, rota, metricas in lentas:
+            etapas = ", ".join(f"{etapa} {metricas.get(etapa, 0)}x {metricas.get(f'{etapa}_ms', 0)}"
+                               for etapa in ETAPAS if metricas.get(etapa))
+            print(f"  {total:8.1f}  {rota}  {etapas or 'sem etapas'}, {metricas.get('bytes', 0)} bytes"
+                  f"  (requestId {chave})")
+
+
+def comparar(antes, depois, nome_antes, nome_depois):
+    """Dois conjuntos (analise, deploys) lado a lado, rota a rota."""
+    rotas_antes, rotas_depois = antes[0].por_rota(antes[1]), depois[0].por_rota(depois[1])
+    print(f"\n=== {nome_antes}  →  {nome_depois} ===")
+    print(f"\n  {'rota':<34} {'n':>11} {'p50':>18} {'p95':>18} {'p99':>18}")
+    vazia = _Rota()
+    for rota in sorted(set(rotas_antes) | set(rotas_depois),
+                       key=lambda r: -(rotas_antes.get(r, vazia).requisicoes
+                                       + rotas_depois.get(r, vazia).requisicoes))[:MOSTRAR]:
+        a, d = rotas_antes.get(rota, vazia), rotas_depois.get(rota, vazia)
+        colunas = [f"{a.requisicoes}→{d.requisicoes}"]
+        for p in (50, 95, 99):
+            pa, pd = percentil(a.duracoes, p), percentil(d.duracoes, p)
+            colunas.append(f"{_ms(pa)}→{_ms(pd)} {_delta(pa, pd).split(' ')[0]}")
+        print(f"  {rota[:34]:<34} {colunas[0]:>11} {colunas[1]:>18} {colunas[2]:>18} {colunas[3]:>18}")
+
+    for nome, rotas in ((nome_antes, rotas_antes), (nome_depois, rotas_depois)):
+        todas = _Rota()
+        for r in rotas.values():
+            todas.juntar(r)
+        print(f"\n  {nome}: cold starts {_pct(len(todas.frias), todas.requisicoes)}, "
+              f"com erro {_pct(todas.com_erro, todas.requisicoes)}, 5xx {_pct(todas.erros_5xx, todas.requisicoes)}, "
+              f"memória máx {_ms(max(todas.memorias, default=None))} MB")
+        if todas.etapas:
+            medias = {etapa: sum(todas.etapas[etapa]) / len(todas.etapas[etapa])
+                      for etapa in ("leitura", "escrita", "python")}
+            print(f"  {nome}: média por requisição: leitura {medias['leitura']:.1f} ms, "
+                  f"escrita {medias['escrita']:.1f} ms, python {medias['python']:.1f} ms (linhas METRICAS)")
+
+    erros_antes, erros_depois = antes[0].erros_de(antes[1]), depois[0].erros_de(depois[1])
+    for titulo, assinaturas_ in (("Erros novos", set(erros_depois) - set(erros_antes)),
+                                 ("Erros que sumiram", set(erros_antes) - set(erros_depois))):
+        if assinaturas_:
+            print(f"\n  {titulo}:")
+            origem = erros_depois if titulo == "Erros novos" else erros_antes
+            for assinatura in sorted(assinaturas_, key=lambda a: -origem[a])[:MOSTRAR]:
+                print(f"    {origem[assinatura]:>6}  {assinatura}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência, cold starts, memória e erros dos logs da Vercel.")
+    parser.add_argument("arquivos", nargs="+", help="exports JSON ou JSON Lines (.gz aceito; - para stdin)")
+    parser.add_argument("--comparar", nargs=2, metavar=("A", "B"),
+                        help="dois deploys (deploymentId ou prefixo) ou dois arquivos de export")
+    args = parser.parse_args()
+
+    analise = Analise()
+    for caminho in args.arquivos:
+        analise.ler(caminho)
+    print(f"{analise.registros} registros em {len(args.arquivos)} arquivo(s); deploys: {', '.join(analise.deploys())}")
+
+    if not args.comparar:
+        relatorio(analise)
+        if len(analise.rotas) > 1:
+            print("\n=== Por deploy (do mais antigo ao mais novo) ===")
+            for deploy in analise.deploys():
+                rotas = analise.por_rota([deploy]).values()
+                todas = _Rota()
+                for r in rotas:
+                    todas.juntar(r)
+                print(f"  {deploy}: {todas.requisicoes:>6} req  p50 {_ms(percentil(todas.duracoes, 50)):>6}  "
+                      f"p95 {_ms(percentil(todas.duracoes, 95)):>6}  p99 {_ms(percentil(todas.duracoes, 99)):>6}  "
+                      f"frias {_pct(len(todas.frias), todas.requisicoes):>6}  "
+                      f"com erro {_pct(todas.com_erro, todas.requisicoes):>6}")
+        return
+
+    lados = []
+    for alvo in args.comparar:
+        if os.path.exists(alvo):
+            outra = Analise()
+            outra.ler(alvo)
+            lados.append(((outra, None), os.path.basename(alvo)))
+        else:
+            deploy = analise.encontrar_deploy(alvo)
+            lados.append(((analise, [deploy]), deploy))
+    comparar(lados[0][0], lados[1][0], lados[0][1], lados[1][1])
+
+
+if __name__ == "__main__":
+    main()
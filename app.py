@@ -1,42 +1,105 @@
 import os
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
-from flask import Flask, request, jsonify
-from rauberskat_backend_oficial import RauberskatScorekeeper
+import copy
+from flask import Flask, Response, request, jsonify, g
+from rauberskat_backend_oficial import RauberskatScorekeeper, JogadaInvalida
+from rauberskat_storage import (criar_store, ClientePreguicoso, LatenciaSimulada, ConflitoDeVersao,
+                                PartidaArquivada)
+from rauberskat_serializer import SerializadorDePartidas
+from rauberskat_arquivo import ArquivoFrio
+from rauberskat_cache import CacheDePartidas, MAX_PARTIDAS, MAX_BYTES
+from rauberskat_ao_vivo import CanalAoVivo, DURACAO_CONEXAO
+from rauberskat_metricas import Medicao, StoreMedido, ativar, desativar
+from rauberskat_api_comum import (resposta_da_alteracao, chave_de_idempotencia, etag_partida, MAX_JOGADAS_LOTE,
+                                 TAMANHO_MAX_CHAVE, LIMITE_PAGINA_JOGADAS, MAX_PAGINA_JOGADAS)
 from flask_cors import CORS
 
+# --- Armazenamento das partidas ---
+# RAUBERSKAT_STORAGE escolhe o backend: firestore (padrão), sqlite ou memory.
+STORAGE = os.environ.get('RAUBERSKAT_STORAGE', 'firestore').lower()
+
 # --- Inicialização do Firebase ---
-db = None  # Inicializa db como None para evitar NameError
-try:
-    # Tenta carregar as credenciais da variável de ambiente (Vercel/Produção)
-    firebase_creds_json = os.environ.get('FIREBASE_CREDENTIALS')
-
-    if firebase_creds_json:
-        print(f"DEBUG: Encontrei FIREBASE_CREDENTIALS (len={len(firebase_creds_json)})")
-        # Carrega do JSON na variável de ambiente
-        cred_dict = json.loads(firebase_creds_json)
-        cred = credentials.Certificate(cred_dict)
-    elif os.path.exists("firebase-credentials.json"):
-        print("DEBUG: Usando arquivo local firebase-credentials.json")
-        # Fallback para arquivo local (Desenvolvimento)
-        cred = credentials.Certificate("firebase-credentials.json")
-    else:
-        print("CRÍTICO: Nenhuma credencial do Firebase encontrada (Env ou Arquivo)!")
-        cred = None
-
-    if cred:
+def iniciar_firebase():
+    """
+    Conecta ao Firebase e retorna o cliente do Firestore. Chamado no primeiro
+    acesso ao banco, não na importação: o SDK (firebase_admin, gRPC) é pesado
+    e o cold start da Vercel não deve esperar por ele. Falhas sobem para o
+    pedido (resposta 500) e o próximo pedido tenta de novo.
+    """
+    try:
+        # Importado só aqui, junto com a conexão
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        # Tenta carregar as credenciais da variável de ambiente (Vercel/Produção)
+        firebase_creds_json = os.environ.get('FIREBASE_CREDENTIALS')
+
+        if firebase_creds_json:
+            print(f"DEBUG: Encontrei FIREBASE_CREDENTIALS (len={len(firebase_creds_json)})")
+            # Carrega do JSON na variável de ambiente
+            cred_dict = json.loads(firebase_creds_json)
+            cred = credentials.Certificate(cred_dict)
+        elif os.path.exists("firebase-credentials.json"):
+            print("DEBUG: Usando arquivo local firebase-credentials.json")
+            # Fallback para arquivo local (Desenvolvimento)
+            cred = credentials.Certificate("firebase-credentials.json")
+        else:
+            raise RuntimeError("Nenhuma credencial do Firebase encontrada (Env ou Arquivo)!")
+
         try:
             firebase_admin.get_app()
         except ValueError:
             firebase_admin.initialize_app(cred)
-        
-        db = firestore.client()
+
+        client = firestore.client()
         print("SUCESSO: Firebase conectado!")
+        return client
+    except Exception as e:
+        print(f"ERRO FATAL ao iniciar Firebase: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+# O Firebase só é inicializado quando o armazenamento escolhido é o Firestore,
+# e só no primeiro uso (um único cliente por processo, criado sob um lock)
+db = ClientePreguicoso(iniciar_firebase) if STORAGE == 'firestore' else None
+
+store = None
+try:
+    store = criar_store(STORAGE, db=db)
 except Exception as e:
-    print(f"ERRO FATAL ao iniciar Firebase: {str(e)}")
-    import traceback
-    traceback.print_exc()
+    print(f"ERRO FATAL ao iniciar o armazenamento: {str(e)}")
+
+# RAUBERSKAT_LATENCIA_MS: espera antes de cada chamada ao armazenamento, para
+# comparar com app_asgi.py num banco local como se fosse remoto (bench_asgi.py)
+LATENCIA_MS = float(os.environ.get('RAUBERSKAT_LATENCIA_MS', 0))
+if store is not None and LATENCIA_MS > 0:
+    store = LatenciaSimulada(store, LATENCIA_MS / 1000)
+
+# --- Medição por requisição (rauberskat_metricas.py) ---
+# Leituras e gravações contadas logo acima do banco (os acertos do cache não
+# contam), mais pontuação e transição, no header Server-Timing e numa linha
+# "METRICAS {json}" do log. RAUBERSKAT_METRICAS=0 desliga.
+METRICAS = os.environ.get('RAUBERSKAT_METRICAS', '1') != '0'
+if store is not None and METRICAS:
+    store = StoreMedido(store)
+
+# --- Cache de partidas ---
+# LRU por worker (RAUBERSKAT_CACHE partidas, RAUBERSKAT_CACHE_MB megabytes;
+# RAUBERSKAT_CACHE=0 desliga). Leituras conferem só a versão do documento;
+# alterações usam a cópia direto e contam com a gravação condicional.
+CACHE_PARTIDAS = int(os.environ.get('RAUBERSKAT_CACHE', MAX_PARTIDAS))
+CACHE_BYTES = int(os.environ.get('RAUBERSKAT_CACHE_MB', MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+cache = None
+if store is not None and STORAGE != 'memory' and CACHE_PARTIDAS > 0:
+    cache = store = CacheDePartidas(store, CACHE_PARTIDAS, CACHE_BYTES)
+
+# --- Arquivo frio ---
+# Partidas encerradas ou paradas vão para segmentos comprimidos neste diretório
+# (rauberskat_arquivo.py). Sem a variável, nada é arquivado. Precisa ser um
+# disco persistente: o /tmp da Vercel não serve.
+ARQUIVO_DIR = os.environ.get('RAUBERSKAT_ARQUIVO_DIR')
+arquivo = ArquivoFrio(ARQUIVO_DIR) if ARQUIVO_DIR else None
 
 # --- Inicialização do Flask ---
 # --- Inicialização do Flask ---
@@ -45,7 +108,72 @@ app = Flask(__name__)
 
 # --- Configuração do CORS ---
 # Isso permite que requisições de qualquer origem acessem sua API.
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=["ETag"])
+
+@app.before_request
+def iniciar_medicao():
+    if METRICAS:
+        g.medicao = Medicao()
+        g.token_medicao = ativar(g.medicao)
+
+@app.after_request
+def registrar_medicao(resposta):
+    medicao = g.get('medicao')
+    if medicao is None:
+        return resposta
+    resposta.headers['Server-Timing'] = medicao.server_timing()
+    resposta.headers['Timing-Allow-Origin'] = '*'
+    print(medicao.linha_de_log(metodo=request.method,
+                               rota=request.url_rule.rule if request.url_rule else request.path,
+                               status=resposta.status_code,
+                               game_id=(request.view_args or {}).get('game_id')))
+    return resposta
+
+@app.teardown_request
+def encerrar_medicao(erro=None):
+    # Também quando a rota falha sem resposta (after_request não roda)
+    if 'token_medicao' in g:
+        desativar(g.pop('token_medicao'))
+
+# --- Canal ao vivo (GET /api/game/<id>/stream) ---
+# Uma assinatura por partida acompanhada neste processo, repassada a todas as
+# conexões. Cada conexão dura RAUBERSKAT_AO_VIVO_SEGUNDOS e o navegador
+# reconecta sozinho, continuando pelo Last-Event-ID.
+canal = CanalAoVivo(store, duracao=float(os.environ.get('RAUBERSKAT_AO_VIVO_SEGUNDOS', DURACAO_CONEXAO)))
+
+# --- Concorrência entre celulares da mesma mesa ---
+# As alterações de uma mesma partida passam por uma fila (uma por game_id):
+# pedidos simultâneos são aplicados em ordem sobre o mesmo estado e gravados
+# juntos. Entre processos vale o controle de versão (recalcula em conflito).
+# O desfazer (não repetível) confere a versão antes de usar a cópia em cache:
+# outro worker pode ter gravado a partida, e ele não pode ser refeito em conflito
+serializador = SerializadorDePartidas(cache.sem_validacao() if cache is not None else store,
+                                      ao_gravar=canal.avisar, store_validado=cache)
+
+def abrir_para_leitura(game_id, evento=None, versao=None):
+    """
+    Scorekeeper para as rotas de leitura. Partidas arquivadas são lidas do
+    arquivo frio (pelo índice); com evento, reconstrói a partida até ele.
+    versao: a versão que a rota já leu; o cache confere a cópia por ela.
+    """
+    def abrir(fonte):
+        if evento is not None:
+            return RauberskatScorekeeper.reconstruir(fonte, game_id, evento)
+        return RauberskatScorekeeper(fonte, game_id)
+
+    try:
+        return abrir(cache.conferida(game_id, versao) if cache is not None and versao is not None else store)
+    except PartidaArquivada:
+        if arquivo is None:
+            raise
+        return abrir(arquivo.store_da_partida(game_id))
+
+def resposta_com_etag(corpo, status, etag):
+    # no-cache: o navegador guarda a resposta, mas sempre confere com If-None-Match
+    resposta = app.make_response((corpo, status))
+    resposta.set_etag(etag)
+    resposta.headers["Cache-Control"] = "private, no-cache"
+    return resposta
 
 # --- Rotas da API ---
 # A rota '/' (index) foi removida pois o Vercel servirá o index.html da pasta public automaticamente.
@@ -53,7 +181,7 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})
 @app.route('/api/start_game', methods=['POST'])
 def start_game():
     """
-    Cria uma nova partida no Firestore.
+    Cria uma nova partida no armazenamento configurado.
     Recebe: {"player_names": ["Nome1", ...], "date": "...", "venue": "...", ...}
     Retorna: {"game_id": "ID_DA_NOVA_PARTIDA"}
     """
@@ -63,75 +191,91 @@ def start_game():
     if not player_names or len(player_names) not in [3, 4]:
         return jsonify({"error": "A lista de jogadores é inválida."}), 400
 
-    # Cria o estado inicial do jogo
-    initial_state = {
-        "player_names": player_names,
-        "num_players": len(player_names),
-        "scores": {name: 0 for name in player_names},
-        "current_mode": "Bock",
-        "dealer_index": 0,
-        "game_history": [],
-        "previous_states": [],
-        # Novos campos de detalhes da partida
-        "date": data.get("date"),
-        "venue": data.get("venue"),
-        "table": data.get("table"),
-        "start_time": data.get("start_time"),
-        "end_time": data.get("end_time"),
-        # Outros campos de estado do jogo
-        "bock_rounds_played": 0,
-        "ramsch_rounds_played": 0,
-        "last_game_name": "",
-        "ramsch_losses": {name: 0 for name in player_names},
-        "ramsch_scores_count": {name: 0 for name in player_names},
-        "ramsch_ramsch_count": 0,
-        "dealer_turns_count": {name: 0 for name in player_names},
-        "last_scoring_player": None,
-        "awaiting_ramsch_decision": False,
-        "ramsch_candidates": [],
-        "last_was_bonus": False,
-    }
-
-    # Adiciona o novo documento de partida ao Firestore
-    update_time, game_ref = db.collection('partidas').add(initial_state)
+    # Cria a partida (estado inicial) no armazenamento configurado
+    detalhes = {campo: data.get(campo) for campo in ("date", "venue", "table", "start_time", "end_time")}
+    game_id = RauberskatScorekeeper.iniciar_jogo(store, player_names, **detalhes)
     
     # --- Log de Confirmação no Terminal ---
     print("\n" + "="*60)
     print("🎮 JOGO INICIADO!")
-    print(f"👥 Jogadores: {', '.join(initial_state['player_names'])}")
-    print(f"🔄 Rodada inicial: {initial_state['current_mode']}")
+    print(f"👥 Jogadores: {', '.join(player_names)}")
+    print("🔄 Rodada inicial: Bock")
     # O dealer inicial é sempre o jogador no índice 0
-    print(f"🎯 Dealer inicial: {initial_state['player_names'][0]}")
+    print(f"🎯 Dealer inicial: {player_names[0]}")
     print("="*60 + "\n")
 
-    return jsonify({"game_id": game_ref.id}), 201
+    return jsonify({"game_id": game_id}), 201
 
 @app.route('/api/game/<game_id>/calculate', methods=['POST'])
 def calculate(game_id):
     """
     Calcula a pontuação para uma jogada.
     Recebe: dados da jogada (mesmo formato que o frontend enviava antes)
-    Retorna: estado atualizado do jogo.
+    Retorna: estado atualizado do jogo. Com ?delta=1 (vale para todas as
+    rotas de alteração), só o que mudou: veja RauberskatScorekeeper.get_delta.
+    Header opcional Idempotency-Key: repetir o pedido com a mesma chave (nova
+    tentativa depois de um timeout) não pontua a jogada de novo; a resposta
+    é o estado com a jogada original, marcado com "repetida".
     """
     try:
-        scorekeeper = RauberskatScorekeeper(db, game_id)
         dados_jogada = request.get_json()
-        
-        # 1. Calcula a pontuação da jogada
-        scorekeeper.calculate_score(dados_jogada)
-        # 2. Verifica se a rodada deve mudar (ou se deve esperar uma decisão)
-        scorekeeper.check_mode_transition()
-        # 3. Avança o dealer (a menos que uma decisão esteja pendente)
-        if not scorekeeper.awaiting_ramsch_decision:
-            scorekeeper.next_dealer()
-        
-        scorekeeper._save_state() # Salva todas as alterações no banco de dados
-        # Carrega o estado final para retornar ao frontend
-        final_state = scorekeeper.game_ref.get().to_dict()
-        return jsonify(final_state), 200
+        chave = chave_de_idempotencia(request.headers)
+        if chave is not None and len(chave) > TAMANHO_MAX_CHAVE:
+            return jsonify({"error": f"Use uma Idempotency-Key de até {TAMANHO_MAX_CHAVE} caracteres."}), 400
+
+        # Pontuação, transição de rodada e avanço do dealer, tudo em memória;
+        # a resposta é o estado em memória (com a jogada nova), sem reler o documento
+        jogar = resposta_da_alteracao(request.args,
+                                      lambda scorekeeper: scorekeeper.processar_jogada(copy.deepcopy(dados_jogada)),
+                                      chave)
+
+        # Uma única escrita com todas as alterações (refeita se houver conflito)
+        return jsonify(serializador.executar(game_id, jogar)), 200
+
+    except PartidaArquivada as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404 # Jogo não encontrado
+    except ConflitoDeVersao:
+        return jsonify({"error": "A partida está sendo alterada por outro aparelho. Tente novamente."}), 409
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/api/game/<game_id>/calculate_batch', methods=['POST'])
+def calculate_batch(game_id):
+    """
+    Aplica várias jogadas em ordem (fila do aparelho que ficou sem conexão).
+    Recebe: {"jogadas": [dados da jogada, ...]} (mesmo formato de /calculate)
+    Cada jogada passa pelas mesmas transições de rodada e dealer. Tudo ou
+    nada: na primeira jogada inválida nenhuma é aplicada e a resposta diz
+    qual foi ("indice", a partir de 0). O lote é gravado num único commit.
+    Aceita Idempotency-Key como /calculate (uma chave para o lote inteiro).
+    Retorna: estado atualizado do jogo.
+    """
+    try:
+        jogadas = (request.get_json(silent=True) or {}).get('jogadas')
+        if not isinstance(jogadas, list) or not jogadas:
+            return jsonify({"error": "Envie as jogadas em uma lista não vazia ('jogadas')."}), 400
+        if len(jogadas) > MAX_JOGADAS_LOTE:
+            return jsonify({"error": f"No máximo {MAX_JOGADAS_LOTE} jogadas por lote."}), 400
+        chave = chave_de_idempotencia(request.headers)
+        if chave is not None and len(chave) > TAMANHO_MAX_CHAVE:
+            return jsonify({"error": f"Use uma Idempotency-Key de até {TAMANHO_MAX_CHAVE} caracteres."}), 400
+
+        jogar_lote = resposta_da_alteracao(request.args,
+                                           lambda scorekeeper: scorekeeper.processar_jogadas(copy.deepcopy(jogadas)),
+                                           chave)
 
+        return jsonify(serializador.executar(game_id, jogar_lote)), 200
+
+    except JogadaInvalida as e:
+        return jsonify({"error": str(e), "indice": e.indice}), 400
+    except PartidaArquivada as e:
+        return jsonify({"error": str(e)}), 410
     except ValueError as e:
         return jsonify({"error": str(e)}), 404 # Jogo não encontrado
+    except ConflitoDeVersao:
+        return jsonify({"error": "A partida está sendo alterada por outro aparelho. Tente novamente."}), 409
     except Exception as e:
         return jsonify({"error": f"Erro interno: {str(e)}"}), 500
 
@@ -142,14 +286,21 @@ def undo(game_id):
     Retorna: estado atualizado do jogo.
     """
     try:
-        scorekeeper = RauberskatScorekeeper(db, game_id)
-        if scorekeeper.undo_last_game():
-            restored_state = scorekeeper.game_ref.get().to_dict()
-            return jsonify(restored_state), 200
+        desfazer = resposta_da_alteracao(request.args, lambda scorekeeper: scorekeeper.undo_last_game())
+
+        # Não repetível: se outro processo gravou uma jogada nesse meio tempo,
+        # refazer desfaria a jogada errada. O usuário vê o placar novo e decide.
+        estado = serializador.executar(game_id, desfazer, repetivel=False)
+        if estado is not None:
+            return jsonify(estado), 200
         else:
             return jsonify({"error": "Não há jogadas para desfazer."}), 400
+    except PartidaArquivada as e:
+        return jsonify({"error": str(e)}), 410
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
+    except ConflitoDeVersao:
+        return jsonify({"error": "A partida mudou antes de desfazer. Confira o placar e tente novamente."}), 409
     except Exception as e:
         return jsonify({"error": f"Erro interno: {str(e)}"}), 500
 
@@ -157,16 +308,108 @@ def undo(game_id):
 def get_game_state(game_id):
     """
     Obtém o estado atual de uma partida.
-    Retorna: estado atual do jogo.
+    Parâmetro opcional: ?desde=N para receber só as jogadas a partir da N-ésima
+    (o frontend busca o histórico de forma incremental).
+    Parâmetro opcional: ?evento=N para ver a partida como estava após os
+    primeiros N eventos (reconstruída a partir do checkpoint mais próximo).
+    Partidas arquivadas continuam disponíveis (lidas do arquivo frio).
+    Com If-None-Match igual ao ETag atual, responde 304 sem corpo: só a
+    versão do documento é lida, sem carregar a partida nem as jogadas.
+    Retorna: estado atual do jogo, com "game_history" e "historico_desde".
     """
     try:
-        game_ref = db.collection('partidas').document(game_id)
-        game_data = game_ref.get().to_dict()
-        if not game_data:
+        desde = request.args.get('desde', default=0, type=int)
+        evento = request.args.get('evento', type=int)
+        versao = store.carregar_versao(game_id)
+        if versao is None:
             return jsonify({"error": "Partida não encontrada."}), 404
-        return jsonify(game_data), 200
+        etag = etag_partida(versao, desde, evento)
+        if request.if_none_match.contains(etag):
+            return resposta_com_etag("", 304, etag)
+
+        scorekeeper = abrir_para_leitura(game_id, evento, versao)
+        game_data = scorekeeper.get_state()
+        game_data["game_history"] = scorekeeper.carregar_historico(desde)
+        game_data["historico_desde"] = desde
+        # A versão efetivamente lida (pode ter mudado depois da conferência acima)
+        return resposta_com_etag(jsonify(game_data), 200, etag_partida(game_data["version"], desde, evento))
+    except ValueError:
+        return jsonify({"error": "Partida não encontrada."}), 404
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/api/game/<game_id>/plays', methods=['GET'])
+def get_plays(game_id):
+    """
+    Histórico paginado da partida, pelos índices do armazenamento (uma
+    página filtrada não percorre o histórico inteiro).
+    Parâmetros opcionais:
+    - ?cursor=N: começa na jogada de sequência N (o "proximo_cursor" da página anterior);
+    - ?limite=N: jogadas por página (padrão 50, máximo 200);
+    - ?ordem=desc: da mais recente para a mais antiga (padrão: asc);
+    - ?jogador=Nome, ?jogo=grand, ?modo=Ramsch: filtros, combináveis.
+    Retorna: {"game_id": ..., "plays": [...], "proximo_cursor": N ou null}
+    (cada jogada com sua sequência em "seq").
+    """
+    cursor = request.args.get('cursor', type=int)
+    limite = request.args.get('limite', default=LIMITE_PAGINA_JOGADAS, type=int)
+    ordem = request.args.get('ordem', default='asc')
+    if not 1 <= limite <= MAX_PAGINA_JOGADAS or ordem not in ('asc', 'desc'):
+        return jsonify({"error": f"Use limite entre 1 e {MAX_PAGINA_JOGADAS} e ordem 'asc' ou 'desc'."}), 400
+    try:
+        scorekeeper = abrir_para_leitura(game_id)
+    except ValueError:
+        return jsonify({"error": "Partida não encontrada."}), 404
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+    try:
+        jogadas, proximo = scorekeeper.buscar_jogadas(
+            cursor, limite, ordem == 'desc', jogador=request.args.get('jogador'),
+            jogo=request.args.get('jogo'), round_mode=request.args.get('modo'))
+        return jsonify({"game_id": game_id, "plays": jogadas, "proximo_cursor": proximo}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/api/game/<game_id>/events', methods=['GET'])
+def get_events(game_id):
+    """
+    Log de auditoria da partida: jogadas, decisões de Ramsch e desfazer, em ordem.
+    Parâmetro opcional: ?desde=N para receber só os eventos a partir do N-ésimo.
+    Retorna: {"game_id": ..., "events": [...]}
+    """
+    try:
+        desde = request.args.get('desde', default=0, type=int)
+        scorekeeper = abrir_para_leitura(game_id)
+        return jsonify({"game_id": game_id, "events": scorekeeper.carregar_eventos(desde)}), 200
+    except ValueError:
+        return jsonify({"error": "Partida não encontrada."}), 404
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/api/game/<game_id>/stream', methods=['GET'])
+def stream_game(game_id):
+    """
+    Atualizações ao vivo da partida (Server-Sent Events), para telões e
+    aparelhos que só acompanham a mesa. Cada mensagem "partida" traz o estado
+    com as jogadas a partir de "historico_desde" (mesmo formato do GET da
+    partida com ?desde=N); o id da mensagem é o event_count.
+    Na reconexão, o navegador manda Last-Event-ID e recebe só o que mudou
+    desde então; ?ultimo=N faz o mesmo na primeira conexão.
+    """
+    ultimo = request.headers.get('Last-Event-ID', request.args.get('ultimo', ''))
+    try:
+        eventos = canal.ouvir(game_id, int(ultimo) if ultimo.isdigit() else None)
+    except PartidaArquivada as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError:
+        return jsonify({"error": "Partida não encontrada."}), 404
     except Exception as e:
         return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+    # X-Accel-Buffering: proxies (nginx) repassam cada mensagem na hora
+    return Response(eventos, mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route('/api/game/<game_id>/decide_ramsch', methods=['POST'])
 def decide_ramsch(game_id):
@@ -176,20 +419,58 @@ def decide_ramsch(game_id):
     Retorna: estado atualizado do jogo.
     """
     try:
-        scorekeeper = RauberskatScorekeeper(db, game_id)
         data = request.get_json()
+        jogador = data.get('jogador')
+        deseja_nova_rodada = data.get('deseja_nova_rodada', False)
         decisao_em_grupo = data.get('decisao_em_grupo', False)
 
-        scorekeeper.processar_decisao_ramsch(jogador, deseja_nova_rodada, decisao_em_grupo)
-        
-        # O método processar_decisao_ramsch já salva o estado, então apenas o retornamos.
-        final_state = scorekeeper.game_ref.get().to_dict()
-        return jsonify(final_state), 200
+        # Se outro aparelho já decidiu, a decisão repetida não altera nada
+        decidir = resposta_da_alteracao(
+            request.args,
+            lambda scorekeeper: scorekeeper.processar_decisao_ramsch(jogador, deseja_nova_rodada, decisao_em_grupo))
+
+        return jsonify(serializador.executar(game_id, decidir)), 200
+    except PartidaArquivada as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except ConflitoDeVersao:
+        return jsonify({"error": "A partida está sendo alterada por outro aparelho. Tente novamente."}), 409
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/api/game/<game_id>/finish', methods=['POST'])
+def finish(game_id):
+    """
+    Encerra a partida. Ela continua legível e, na próxima varredura
+    (rauberskat_arquivo.py), vai para o arquivo frio.
+    Retorna: estado atualizado do jogo, com "finished_at".
+    """
+    try:
+        encerrar = resposta_da_alteracao(request.args, lambda scorekeeper: scorekeeper.encerrar())
+
+        return jsonify(serializador.executar(game_id, encerrar)), 200
+    except PartidaArquivada as e:
+        return jsonify({"error": str(e)}), 410
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
+    except ConflitoDeVersao:
+        return jsonify({"error": "A partida está sendo alterada por outro aparelho. Tente novamente."}), 409
     except Exception as e:
         return jsonify({"error": f"Erro interno: {str(e)}"}), 500
 
+@app.route('/api/stats/cache', methods=['GET'])
+def cache_stats():
+    """Acertos, faltas e ocupação do cache de partidas deste worker."""
+    if cache is None:
+        return jsonify({"ativo": False}), 200
+    return jsonify(dict(cache.estatisticas(), ativo=True)), 200
+
+@app.route('/api/stats/ao_vivo', methods=['GET'])
+def ao_vivo_stats():
+    """Partidas acompanhadas (uma assinatura cada) e conexões abertas neste worker."""
+    return jsonify(canal.estatisticas()), 200
+
 if __name__ == '__main__':
     # O host='0.0.0.0' torna o servidor acessível na sua rede local
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,356 @@
+"""
+Variante ASGI da API (Quart): as mesmas rotas de app.py, com o
+armazenamento assíncrono de rauberskat_async.py.
+
+No app.py cada requisição ocupa um thread do gunicorn durante todas as idas
+e voltas ao Firestore; com 1 worker e 8 threads, 8 jogadas esperando o
+banco travam o container. Aqui a requisição que espera o banco libera o
+loop para as outras, e um processo atende centenas ao mesmo tempo. As
+regras (RauberskatScorekeeper) são as mesmas, sem nenhuma cópia.
+
+Uso:
+    pip install -r requirements-asgi.txt
+    uvicorn app_asgi:app --host 0.0.0.0 --port 5000
+
+Diferenças em relação ao app.py: não há cache de partidas nem group
+commit (as alterações de uma partida passam por uma trava asyncio e cada
+uma grava o seu commit), e o canal ao vivo consulta a versão em vez de
+usar o listener do Firestore. Comparação: bench_asgi.py.
+"""
+import os
+import json
+import copy
+import asyncio
+from quart import Quart, Response, request, jsonify, g
+from quart_cors import cors
+from rauberskat_backend_oficial import RauberskatScorekeeper, JogadaInvalida
+from rauberskat_storage import (MemoryGameStore, SQLiteGameStore, ClientePreguicoso, ConflitoDeVersao,
+                                PartidaArquivada)
+from rauberskat_arquivo import ArquivoFrio
+from rauberskat_async import (ExecutorAssincrono, StoreAssincrono, StoreAssincronoMedido, AsyncFirestoreGameStore,
+                              CanalAoVivoAssincrono)
+from rauberskat_ao_vivo import DURACAO_CONEXAO
+from rauberskat_metricas import Medicao, ativar, desativar
+from rauberskat_api_comum import (resposta_da_alteracao, chave_de_idempotencia, etag_partida, MAX_JOGADAS_LOTE,
+                                 TAMANHO_MAX_CHAVE, LIMITE_PAGINA_JOGADAS, MAX_PAGINA_JOGADAS)
+
+# --- Armazenamento das partidas ---
+# Mesmas variáveis do app.py: RAUBERSKAT_STORAGE (firestore, sqlite ou memory)
+# e RAUBERSKAT_SQLITE_PATH. RAUBERSKAT_LATENCIA_MS simula a latência de um
+# banco remoto em cada chamada (só para benchmarks; veja bench_asgi.py).
+STORAGE = os.environ.get('RAUBERSKAT_STORAGE', 'firestore').lower()
+LATENCIA = float(os.environ.get('RAUBERSKAT_LATENCIA_MS', 0)) / 1000
+
+def iniciar_firestore():
+    """
+    Cliente assíncrono do Firestore, com as mesmas credenciais do app.py.
+    Como lá, só é criado no primeiro acesso ao banco (ClientePreguicoso).
+    """
+    try:
+        from firebase_admin import credentials
+        from google.cloud import firestore
+
+        firebase_creds_json = os.environ.get('FIREBASE_CREDENTIALS')
+        if firebase_creds_json:
+            cred = credentials.Certificate(json.loads(firebase_creds_json))
+        elif os.path.exists("firebase-credentials.json"):
+            cred = credentials.Certificate("firebase-credentials.json")
+        else:
+            raise RuntimeError("Nenhuma credencial do Firebase encontrada (Env ou Arquivo)!")
+
+        client = firestore.AsyncClient(project=cred.project_id, credentials=cred.get_credential())
+        print("SUCESSO: Firestore assíncrono conectado!")
+        return client
+    except Exception as e:
+        print(f"ERRO FATAL ao iniciar Firebase: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+def criar_store_assincrono(tipo):
+    """GameStore com métodos assíncronos para o tipo de armazenamento escolhido."""
+    if tipo == 'firestore':
+        return AsyncFirestoreGameStore(ClientePreguicoso(iniciar_firestore))
+    if tipo == 'sqlite':
+        caminho = os.environ.get('RAUBERSKAT_SQLITE_PATH', 'rauberskat.db')
+        return StoreAssincrono(SQLiteGameStore(caminho), latencia=LATENCIA)
+    if tipo == 'memory':
+        # Em memória não há E/S: roda direto no loop, sem thread
+        return StoreAssincrono(MemoryGameStore(), em_thread=False, latencia=LATENCIA)
+    raise ValueError(f"Armazenamento desconhecido: '{tipo}'. Use firestore, sqlite ou memory.")
+
+store = None
+try:
+    store = criar_store_assincrono(STORAGE)
+except Exception as e:
+    print(f"ERRO FATAL ao iniciar o armazenamento: {str(e)}")
+
+# --- Medição por requisição (como no app.py; RAUBERSKAT_METRICAS=0 desliga) ---
+# As regras rodam de novo a cada leitura que faltava no espelho: pontuação e
+# transição somam todas as passadas, que são o Python gasto de fato.
+METRICAS = os.environ.get('RAUBERSKAT_METRICAS', '1') != '0'
+if store is not None and METRICAS:
+    store = StoreAssincronoMedido(store)
+
+# --- Arquivo frio (mesma configuração do app.py) ---
+ARQUIVO_DIR = os.environ.get('RAUBERSKAT_ARQUIVO_DIR')
+arquivo = ArquivoFrio(ARQUIVO_DIR) if ARQUIVO_DIR else None
+
+# --- Inicialização do Quart ---
+app = Quart(__name__)
+app = cors(app, allow_origin="*", expose_headers=["ETag"])
+
+@app.before_request
+async def iniciar_medicao():
+    if METRICAS:
+        g.medicao = Medicao()
+        g.token_medicao = ativar(g.medicao)
+
+@app.after_request
+async def registrar_medicao(resposta):
+    medicao = g.get('medicao')
+    if medicao is None:
+        return resposta
+    resposta.headers['Server-Timing'] = medicao.server_timing()
+    resposta.headers['Timing-Allow-Origin'] = '*'
+    print(medicao.linha_de_log(metodo=request.method,
+                               rota=request.url_rule.rule if request.url_rule else request.path,
+                               status=resposta.status_code,
+                               game_id=(request.view_args or {}).get('game_id')))
+    return resposta
+
+@app.teardown_request
+async def encerrar_medicao(erro=None):
+    if 'token_medicao' in g:
+        desativar(g.pop('token_medicao'))
+
+# --- Concorrência ---
+# Alterações de uma partida passam por uma trava por game_id neste processo;
+# entre processos vale o controle de versão (refaz em conflito), como no app.py.
+# O canal ao vivo é avisado a cada gravação deste processo.
+executor = ExecutorAssincrono(store)
+canal = CanalAoVivoAssincrono(executor, duracao=float(os.environ.get('RAUBERSKAT_AO_VIVO_SEGUNDOS',
+                                                                     DURACAO_CONEXAO)))
+executor.ao_gravar = canal.avisar
+
+async def ler_partida(game_id, operacao, evento=None):
+    """
+    operacao(scorekeeper) para as rotas de leitura. Partidas arquivadas são
+    lidas do arquivo frio (o segmento é lido num thread); com evento,
+    reconstrói a partida até ele.
+    """
+    def abrir(fonte):
+        if evento is not None:
+            return RauberskatScorekeeper.reconstruir(fonte, game_id, evento)
+        return RauberskatScorekeeper(fonte, game_id)
+
+    try:
+        return await executor.rodar(lambda espelho: operacao(abrir(espelho)))
+    except PartidaArquivada:
+        if arquivo is None:
+            raise
+        memoria = await asyncio.get_running_loop().run_in_executor(None, arquivo.store_da_partida, game_id)
+        return operacao(abrir(memoria))
+
+async def resposta_com_etag(corpo, status, etag):
+    resposta = await app.make_response((corpo, status))
+    resposta.set_etag(etag)
+    resposta.headers["Cache-Control"] = "private, no-cache"
+    return resposta
+
+def erro_de_alteracao(e, conflito="A partida está sendo alterada por outro aparelho. Tente novamente."):
+    """Resposta de erro das rotas de alteração (mesmos códigos do app.py)."""
+    if isinstance(e, JogadaInvalida):
+        return jsonify({"error": str(e), "indice": e.indice}), 400
+    if isinstance(e, PartidaArquivada):
+        return jsonify({"error": str(e)}), 410
+    if isinstance(e, ValueError):
+        return jsonify({"error": str(e)}), 404
+    if isinstance(e, ConflitoDeVersao):
+        return jsonify({"error": conflito}), 409
+    return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+# --- Rotas da API ---
+
+@app.route('/api/start_game', methods=['POST'])
+async def start_game():
+    """Cria uma nova partida (mesmo contrato de app.start_game)."""
+    data = await request.get_json()
+    player_names = data.get('player_names')
+
+    if not player_names or len(player_names) not in [3, 4]:
+        return jsonify({"error": "A lista de jogadores é inválida."}), 400
+
+    detalhes = {campo: data.get(campo) for campo in ("date", "venue", "table", "start_time", "end_time")}
+    game_id = await executor.criar_partida(player_names, **detalhes)
+
+    print(f"🎮 JOGO INICIADO! {game_id}: {', '.join(player_names)} (dealer inicial: {player_names[0]})")
+    return jsonify({"game_id": game_id}), 201
+
+@app.route('/api/game/<game_id>/calculate', methods=['POST'])
+async def calculate(game_id):
+    """Calcula a pontuação de uma jogada (mesmo contrato de app.calculate)."""
+    try:
+        dados_jogada = await request.get_json()
+        chave = chave_de_idempotencia(request.headers)
+        if chave is not None and len(chave) > TAMANHO_MAX_CHAVE:
+            return jsonify({"error": f"Use uma Idempotency-Key de até {TAMANHO_MAX_CHAVE} caracteres."}), 400
+        # Cópia a cada execução: a operação é refeita quando falta uma leitura
+        jogar = resposta_da_alteracao(request.args,
+                                      lambda scorekeeper: scorekeeper.processar_jogada(copy.deepcopy(dados_jogada)),
+                                      chave)
+        return jsonify(await executor.executar(game_id, jogar)), 200
+    except Exception as e:
+        return erro_de_alteracao(e)
+
+@app.route('/api/game/<game_id>/calculate_batch', methods=['POST'])
+async def calculate_batch(game_id):
+    """Aplica várias jogadas em ordem, tudo ou nada (mesmo contrato de app.calculate_batch)."""
+    try:
+        jogadas = (await request.get_json(silent=True) or {}).get('jogadas')
+        if not isinstance(jogadas, list) or not jogadas:
+            return jsonify({"error": "Envie as jogadas em uma lista não vazia ('jogadas')."}), 400
+        if len(jogadas) > MAX_JOGADAS_LOTE:
+            return jsonify({"error": f"No máximo {MAX_JOGADAS_LOTE} jogadas por lote."}), 400
+        chave = chave_de_idempotencia(request.headers)
+        if chave is not None and len(chave) > TAMANHO_MAX_CHAVE:
+            return jsonify({"error": f"Use uma Idempotency-Key de até {TAMANHO_MAX_CHAVE} caracteres."}), 400
+
+        jogar_lote = resposta_da_alteracao(request.args,
+                                           lambda scorekeeper: scorekeeper.processar_jogadas(copy.deepcopy(jogadas)),
+                                           chave)
+        return jsonify(await executor.executar(game_id, jogar_lote)), 200
+    except Exception as e:
+        return erro_de_alteracao(e)
+
+@app.route('/api/game/<game_id>/undo', methods=['POST'])
+async def undo(game_id):
+    """Desfaz a última jogada (não repetível em conflito, como em app.undo)."""
+    try:
+        desfazer = resposta_da_alteracao(request.args, lambda scorekeeper: scorekeeper.undo_last_game())
+        estado = await executor.executar(game_id, desfazer, repetivel=False)
+        if estado is not None:
+            return jsonify(estado), 200
+        return jsonify({"error": "Não há jogadas para desfazer."}), 400
+    except Exception as e:
+        return erro_de_alteracao(e, "A partida mudou antes de desfazer. Confira o placar e tente novamente.")
+
+@app.route('/api/game/<game_id>', methods=['GET'])
+async def get_game_state(game_id):
+    """Estado da partida, com ?desde, ?evento e ETag (mesmo contrato de app.get_game_state)."""
+    try:
+        desde = request.args.get('desde', default=0, type=int)
+        evento = request.args.get('evento', type=int)
+        versao = await store.carregar_versao(game_id)
+        if versao is None:
+            return jsonify({"error": "Partida não encontrada."}), 404
+        etag = etag_partida(versao, desde, evento)
+        if request.if_none_match.contains(etag):
+            return await resposta_com_etag("", 304, etag)
+
+        def ler(scorekeeper):
+            game_data = scorekeeper.get_state()
+            game_data["game_history"] = scorekeeper.carregar_historico(desde)
+            game_data["historico_desde"] = desde
+            return game_data
+
+        game_data = await ler_partida(game_id, ler, evento)
+        return await resposta_com_etag(jsonify(game_data), 200, etag_partida(game_data["version"], desde, evento))
+    except ValueError:
+        return jsonify({"error": "Partida não encontrada."}), 404
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/api/game/<game_id>/plays', methods=['GET'])
+async def get_plays(game_id):
+    """Histórico paginado e filtrável (mesmo contrato de app.get_plays)."""
+    cursor = request.args.get('cursor', type=int)
+    limite = request.args.get('limite', default=LIMITE_PAGINA_JOGADAS, type=int)
+    ordem = request.args.get('ordem', default='asc')
+    if not 1 <= limite <= MAX_PAGINA_JOGADAS or ordem not in ('asc', 'desc'):
+        return jsonify({"error": f"Use limite entre 1 e {MAX_PAGINA_JOGADAS} e ordem 'asc' ou 'desc'."}), 400
+    filtros = {"jogador": request.args.get('jogador'), "jogo": request.args.get('jogo'),
+               "round_mode": request.args.get('modo')}
+    try:
+        versao = await store.carregar_versao(game_id)
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+    if versao is None:
+        return jsonify({"error": "Partida não encontrada."}), 404
+    try:
+        jogadas, proximo = await ler_partida(
+            game_id, lambda scorekeeper: scorekeeper.buscar_jogadas(cursor, limite, ordem == 'desc', **filtros))
+        return jsonify({"game_id": game_id, "plays": jogadas, "proximo_cursor": proximo}), 200
+    except ValueError as e:
+        # Partida existente: o ValueError é do filtro (jogador desconhecido)
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/api/game/<game_id>/events', methods=['GET'])
+async def get_events(game_id):
+    """Log de auditoria da partida (mesmo contrato de app.get_events)."""
+    try:
+        desde = request.args.get('desde', default=0, type=int)
+        eventos = await ler_partida(game_id, lambda scorekeeper: scorekeeper.carregar_eventos(desde))
+        return jsonify({"game_id": game_id, "events": eventos}), 200
+    except ValueError:
+        return jsonify({"error": "Partida não encontrada."}), 404
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+
+@app.route('/api/game/<game_id>/stream', methods=['GET'])
+async def stream_game(game_id):
+    """Atualizações ao vivo (Server-Sent Events), como em app.stream_game."""
+    ultimo = request.headers.get('Last-Event-ID', request.args.get('ultimo', ''))
+    try:
+        eventos = await canal.ouvir(game_id, int(ultimo) if ultimo.isdigit() else None)
+    except PartidaArquivada as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError:
+        return jsonify({"error": "Partida não encontrada."}), 404
+    except Exception as e:
+        return jsonify({"error": f"Erro interno: {str(e)}"}), 500
+    resposta = Response(eventos, mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # A conexão dura RAUBERSKAT_AO_VIVO_SEGUNDOS, não o limite padrão de resposta do Quart
+    resposta.timeout = None
+    return resposta
+
+@app.route('/api/game/<game_id>/decide_ramsch', methods=['POST'])
+async def decide_ramsch(game_id):
+    """Decisão sobre uma nova rodada de Ramsch (mesmo contrato de app.decide_ramsch)."""
+    try:
+        data = await request.get_json()
+        jogador = data.get('jogador')
+        deseja_nova_rodada = data.get('deseja_nova_rodada', False)
+        decisao_em_grupo = data.get('decisao_em_grupo', False)
+
+        decidir = resposta_da_alteracao(
+            request.args,
+            lambda scorekeeper: scorekeeper.processar_decisao_ramsch(jogador, deseja_nova_rodada, decisao_em_grupo))
+        return jsonify(await executor.executar(game_id, decidir)), 200
+    except Exception as e:
+        return erro_de_alteracao(e)
+
+@app.route('/api/game/<game_id>/finish', methods=['POST'])
+async def finish(game_id):
+    """Encerra a partida (mesmo contrato de app.finish)."""
+    try:
+        encerrar = resposta_da_alteracao(request.args, lambda scorekeeper: scorekeeper.encerrar())
+        return jsonify(await executor.executar(game_id, encerrar)), 200
+    except Exception as e:
+        return erro_de_alteracao(e)
+
+@app.route('/api/stats/cache', methods=['GET'])
+async def cache_stats():
+    """A variante ASGI não tem cache de partidas (mantida pela compatibilidade com app.py)."""
+    return jsonify({"ativo": False}), 200
+
+@app.route('/api/stats/ao_vivo', methods=['GET'])
+async def ao_vivo_stats():
+    """Partidas acompanhadas e conexões abertas neste processo."""
+    return jsonify(canal.estatisticas()), 200
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,146 @@
+"""
+Benchmark da API por HTTP: app.py (gunicorn, threads) contra app_asgi.py (uvicorn).
+
+Várias mesas jogando ao mesmo tempo, cada uma numa conexão keep-alive: a
+mesa cria a partida e manda jogadas (/calculate?delta=1, ou a decisão de
+Ramsch quando pendente) uma depois da outra. Mede requisições por segundo,
+a latência (p50, p95, p99) e os erros por código de resposta. O cliente é
+só asyncio, então centenas de mesas não precisam de centenas de threads.
+
+Com RAUBERSKAT_LATENCIA_MS os dois servidores esperam esse tempo em cada
+chamada ao armazenamento (SQLite ou memória se comportando como um banco
+remoto). RAUBERSKAT_CACHE=0 deixa o app.py sem cache de partidas, como o
+app_asgi.py. Exemplo com a configuração do Dockerfile (1 worker, 8 threads):
+
+    RAUBERSKAT_STORAGE=sqlite RAUBERSKAT_LATENCIA_MS=30 RAUBERSKAT_CACHE=0 \\
+        gunicorn -w 1 --threads 8 -b 127.0.0.1:5000 app:app
+    python bench_asgi.py http://127.0.0.1:5000 200 4000
+
+    RAUBERSKAT_STORAGE=sqlite RAUBERSKAT_LATENCIA_MS=30 \\
+        uvicorn app_asgi:app --host 127.0.0.1 --port 5001
+    python bench_asgi.py http://127.0.0.1:5001 200 4000
+
+Uso:
+    python bench_asgi.py URL [mesas] [requisicoes]
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+import collections
+import urllib.parse
+
+from bench_storage import jogada_aleatoria
+
+
+class Conexao:
+    """Uma conexão HTTP/1.1 keep-alive (reaberta se o servidor fechar)."""
+
+    def __init__(self, url):
+        partes = urllib.parse.urlsplit(url)
+        self.host = partes.hostname
+        self.porta = partes.port or 80
+        self.prefixo = partes.path.rstrip("/")
+        self.leitor = self.escritor = None
+
+    async def enviar(self, metodo, caminho, corpo=None):
+        """Retorna (status, corpo decodificado do JSON ou None)."""
+        if self.escritor is None:
+            self.leitor, self.escritor = await asyncio.open_connection(self.host, self.porta)
+        dados = json.dumps(corpo).encode() if corpo is not None else b""
+        self.escritor.write((f"{metodo} {self.prefixo}{caminho} HTTP/1.1\r\nHost: {self.host}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(dados)}\r\n\r\n").encode()
+                            + dados)
+        await self.escritor.drain()
+
+        status = int((await self.leitor.readline()).split()[1])
+        cabecalhos = {}
+        while True:
+            linha = (await self.leitor.readline()).decode("latin-1").strip()
+            if not linha:
+                break
+            nome, _, valor = linha.partition(":")
+            cabecalhos[nome.strip().lower()] = valor.strip().lower()
+        if cabecalhos.get("transfer-encoding") == "chunked":
+            resposta = b""
+            while True:
+                tamanho = int((await self.leitor.readline()).split(b";")[0], 16)
+                resposta += await self.leitor.readexactly(tamanho)
+                await self.leitor.readexactly(2)  # \r\n depois de cada pedaço
+                if tamanho == 0:
+                    break
+        else:
+            resposta = await self.leitor.readexactly(int(cabecalhos.get("content-length", 0)))
+        if cabecalhos.get("connection") == "close":
+            self.fechar()
+        return status, json.loads(resposta) if resposta.strip() else None
+
+    def fechar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+        self.leitor = self.escritor = None
+
+
+def percentil(valores, p):
+    return valores[min(int(len(valores) * p / 100), len(valores) - 1)]
+
+
+async def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:5000"
+    mesas = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    requisicoes = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    nomes = ["Ana", "Bruno", "Carla", "Davi"]
+
+    restantes = [requisicoes]
+    latencias = []
+    erros = collections.Counter()
+
+    async def mesa(i):
+        rng = random.Random(i)
+        conexao = Conexao(url)
+        try:
+            status, corpo = await conexao.enviar("POST", "/api/start_game", {"player_names": nomes})
+            if status != 201:
+                erros[status] += 1
+                return
+            game_id = corpo["game_id"]
+            estado = {}
+            while restantes[0] > 0:
+                restantes[0] -= 1
+                if estado.get("awaiting_ramsch_decision"):
+                    caminho = f"/api/game/{game_id}/decide_ramsch?delta=1"
+                    corpo = {"jogador": estado["ramsch_candidates"][0], "deseja_nova_rodada": False}
+                else:
+                    caminho, corpo = f"/api/game/{game_id}/calculate?delta=1", jogada_aleatoria(rng, nomes)
+                inicio = time.perf_counter()
+                try:
+                    status, resposta = await conexao.enviar("POST", caminho, corpo)
+                except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                    erros[type(e).__name__] += 1
+                    conexao.fechar()
+                    continue
+                latencias.append(time.perf_counter() - inicio)
+                if status == 200:
+                    estado.update(resposta)
+                else:
+                    erros[status] += 1
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            erros[type(e).__name__] += 1
+        finally:
+            conexao.fechar()
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(mesa(i) for i in range(mesas)))
+    tempo = time.perf_counter() - inicio
+
+    latencias.sort()
+    print(f"{url}: {mesas} mesas, {len(latencias)} requisições em {tempo:.1f} s")
+    if latencias:
+        print(f"  {len(latencias) / tempo:9.0f} req/s")
+        print("  latência: " + ", ".join(f"p{p} {percentil(latencias, p) * 1000:.0f} ms" for p in (50, 95, 99)))
+    print(f"  erros: {dict(erros) if erros else 0}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
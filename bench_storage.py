@@ -0,0 +1,90 @@
+"""
+Benchmark do armazenamento das partidas.
+
+Simula várias mesas jogando ao mesmo tempo (uma thread por mesa, como os
+threads do gunicorn) e mede jogadas por segundo em dois níveis:
+- "gravacao": só a escrita de uma jogada (uma transação por jogada);
+- "requisicao": o caminho completo de /calculate (carrega a partida,
+  calcula, grava uma vez).
+
+Uso:
+    python bench_storage.py [sqlite|memory] [mesas] [jogadas_por_mesa]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from rauberskat_backend_oficial import RauberskatScorekeeper
+from rauberskat_storage import criar_store
+
+JOGOS = ["ouros", "copas", "espadas", "paus", "null", "grand", "ramsch"]
+FLAGS = ["hand", "ouvert", "schneider", "kontra", "reh", "bock", "perdeu"]
+
+
+def jogada_aleatoria(rng, nomes):
+    dados = {"jogador": rng.choice(nomes), "jogo": rng.choice(JOGOS),
+             "com_sem": str(rng.randint(1, 4)), "pontos_ramsch": str(rng.randint(0, 120)),
+             "info": {"skat_empurrado": rng.randint(0, 3)}}
+    for flag in FLAGS:
+        dados[flag] = rng.random() < 0.2
+    return dados
+
+
+def medir(mesas, funcao):
+    """Roda funcao(indice_da_mesa) em paralelo e retorna o tempo total."""
+    threads = [threading.Thread(target=funcao, args=(i,)) for i in range(mesas)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - inicio
+
+
+def main():
+    tipo = sys.argv[1] if len(sys.argv) > 1 else "sqlite"
+    mesas = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    jogadas = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    nomes = ["Ana", "Bruno", "Carla", "Davi"]
+
+    with tempfile.TemporaryDirectory() as pasta:
+        store = criar_store(tipo, caminho=os.path.join(pasta, "bench.db"))
+
+        # 1) Só a escrita: um registro de jogada + campos do documento por transação
+        ids = [RauberskatScorekeeper.iniciar_jogo(store, nomes) for _ in range(mesas)]
+
+        def gravar_mesa(i):
+            rng = random.Random(i)
+            for seq in range(jogadas):
+                jogada = jogada_aleatoria(rng, nomes)
+                jogada.update(seq=seq, result={"points": rng.randint(-200, 200)})
+                store.gravar(ids[i], campos={"play_count": seq + 1, "dealer_index": seq % 4}, jogadas=[jogada])
+
+        tempo = medir(mesas, gravar_mesa)
+        print(f"[{tipo}] gravacao:   {mesas * jogadas / tempo:9.0f} jogadas/s ({mesas} mesas x {jogadas})")
+
+        # 2) Requisição completa, como em /api/game/<id>/calculate
+        ids = [RauberskatScorekeeper.iniciar_jogo(store, nomes) for _ in range(mesas)]
+
+        def jogar_mesa(i):
+            rng = random.Random(1000 + i)
+            for _ in range(jogadas):
+                scorekeeper = RauberskatScorekeeper(store, ids[i])
+                if scorekeeper.awaiting_ramsch_decision:
+                    scorekeeper.processar_decisao_ramsch(scorekeeper.ramsch_candidates[0], False)
+                else:
+                    scorekeeper.processar_jogada(jogada_aleatoria(rng, nomes))
+                scorekeeper._save_state()
+
+        with contextlib.redirect_stdout(io.StringIO()):  # O motor imprime o placar a cada jogada
+            tempo = medir(mesas, jogar_mesa)
+        print(f"[{tipo}] requisicao: {mesas * jogadas / tempo:9.0f} jogadas/s ({mesas} mesas x {jogadas})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Perfil do tempo de importação da API (cold start da Vercel).
+
+Importa o módulo (padrão: app) em processos novos com "python -X importtime",
+várias vezes, e mostra a mediana de cada módulo:
+- o total e a partida do interpretador até o fim da importação;
+- os imports diretos do módulo, com o custo acumulado de cada um;
+- os pacotes onde o tempo é gasto de fato (tempo próprio somado por pacote).
+
+Sai com código 1 se a importação passar do orçamento (RAUBERSKAT_ORCAMENTO_MS,
+padrão ORCAMENTO_MS) e 2 se ela falhar, então serve de verificação no CI.
+As variáveis de ambiente valem como no servidor (RAUBERSKAT_STORAGE etc.).
+A primeira execução só grava os .pyc, como no deploy.
+
+Uso:
+    python perfil_importacao.py [modulo] [orcamento_ms] [execucoes]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ORCAMENTO_MS = float(os.environ.get("RAUBERSKAT_ORCAMENTO_MS", 350))
+MOSTRAR = 15
+
+
+def importar(modulo, ambiente):
+    """
+    Uma importação num processo novo: (segundos até sair, {módulo: (próprio,
+    acumulado, nível)} em µs), só com o módulo e o que ele importou (o que o
+    interpretador já carrega ao iniciar fica de fora).
+    """
+    inicio = time.perf_counter()
+    processo = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                              capture_output=True, text=True, env=ambiente)
+    duracao = time.perf_counter() - inicio
+    if processo.returncode != 0:
+        print(f"❌ 'import {modulo}' falhou:")
+        print("\n".join(linha for linha in processo.stderr.splitlines() if not linha.startswith("import time:")))
+        sys.exit(2)
+    # Cada módulo aparece depois dos que ele importou: a árvore de um módulo
+    # de nível 0 são as linhas desde o módulo de nível 0 anterior
+    tempos = {}
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith("import time:") or "[us]" in linha:
+            continue
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2
+        tempos[nome.strip()] = (int(proprio), int(acumulado), nivel)
+        if nivel == 0:
+            if nome.strip() == modulo:
+                break
+            tempos = {}
+    return duracao, tempos
+
+
+def main():
+    modulo = sys.argv[1] if len(sys.argv) > 1 else "app"
+    orcamento = float(sys.argv[2]) if len(sys.argv) > 2 else ORCAMENTO_MS
+    execucoes = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    ambiente = dict(os.environ)
+    ambiente.pop("PYTHONDONTWRITEBYTECODE", None)
+    importar(modulo, ambiente)  # Grava os .pyc
+
+    duracoes, medidas = [], {}
+    for _ in range(execucoes):
+        duracao, tempos = importar(modulo, ambiente)
+        duracoes.append(duracao)
+        for nome, valores in tempos.items():
+            medidas.setdefault(nome, []).append(valores)
+
+    def mediana(nome, indice):
+        return statistics.median(valores[indice] for valores in medidas[nome]) / 1000
+
+    total = mediana(modulo, 1)
+    print(f"import {modulo}: {total:.0f} ms (mediana de {execucoes}; "
+          f"processo completo {statistics.median(duracoes) * 1000:.0f} ms; orçamento {orcamento:.0f} ms)")
+
+    diretos = sorted((nome for nome, valores in medidas.items() if valores[0][2] == 1),
+                     key=lambda nome: -mediana(nome, 1))
+    print(f"\nImports diretos de {modulo} (acumulado):")
+    for nome in diretos[:MOSTRAR]:
+        print(f"  {mediana(nome, 1):8.1f} ms  {nome}")
+
+    pacotes = {}
+    for nome in medidas:
+        pacote = nome.split(".")[0]
+        pacotes[pacote] = pacotes.get(pacote, 0) + mediana(nome, 0)
+    print("\nTempo próprio por pacote:")
+    for pacote, tempo in sorted(pacotes.items(), key=lambda item: -item[1])[:MOSTRAR]:
+        print(f"  {tempo:8.1f} ms  {pacote}")
+
+    if total > orcamento:
+        print(f"\n❌ Acima do orçamento: {total:.0f} ms > {orcamento:.0f} ms")
+        sys.exit(1)
+    print(f"\n✅ Dentro do orçamento ({total:.0f} de {orcamento:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
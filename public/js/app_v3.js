@@ -5,6 +5,7 @@
 const API_URL = '';
 let currentGameId = null;
 let currentGameState = null; // Store latest state for export
+let gameStream = null; // Live updates of the current game (EventSource)
 
 // DOM Elements
 const startGameBtn = document.getElementById('start-game-btn');
@@ -121,7 +122,7 @@ document.addEventListener('DOMContentLoaded', function () {
     if (existingGameId) {
         console.log("Found Game ID in URL:", existingGameId);
         currentGameId = existingGameId;
-        fetchAndRenderGameState(existingGameId);
+        fetchAndRenderGameState(existingGameId).then(() => watchGame(existingGameId));
     } else {
         console.log("App initialized - No active game");
     }
@@ -192,6 +193,7 @@ async function startGame() {
             window.history.pushState({ path: newUrl }, '', newUrl);
 
             await fetchAndRenderGameState(currentGameId);
+            watchGame(currentGameId);
         } else {
             console.error("Error starting game:", result.error);
             showMessage(result.error || 'Erro ao criar jogo.', 'error');
@@ -250,11 +252,7 @@ async function calculateScore() {
     }
 
     try {
-        const response = await fetch(`${API_URL}/api/game/${currentGameId}/calculate`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(dados)
-        });
+        const response = await postWithRetry(`${API_URL}/api/game/${currentGameId}/calculate?delta=1`, dados);
 
         const contentType = response.headers.get("content-type");
         if (!contentType || !contentType.includes("application/json")) {
@@ -264,7 +262,8 @@ async function calculateScore() {
         const updatedGameState = await response.json();
 
         if (response.ok) {
-            renderGameState(updatedGameState);
+            const fullState = applyStateDelta(updatedGameState);
+            if (fullState) renderGameState(fullState);
         } else {
             console.error("Calculation error:", updatedGameState.error);
             showMessage(updatedGameState.error || 'Erro ao calcular.', 'error');
@@ -279,14 +278,49 @@ async function calculateScore() {
     }
 }
 
+// Scoring requests carry an Idempotency-Key and are retried with the same key after a
+// timeout, a dropped connection, a 409 or a 5xx: the server answers a repeated key with
+// the original result instead of scoring the play twice.
+const REQUEST_TIMEOUT_MS = 8000;
+const RETRY_DELAYS_MS = [250, 1000, 3000];
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+async function postWithRetry(url, body) {
+    const key = newIdempotencyKey();
+    for (let attempt = 0; ; attempt++) {
+        const controller = new AbortController();
+        const timer = setTimeout(() => controller.abort(), REQUEST_TIMEOUT_MS);
+        try {
+            const response = await fetch(url, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+                body: JSON.stringify(body),
+                signal: controller.signal
+            });
+            const retryable = response.status === 409 || response.status >= 500;
+            if (!retryable || attempt >= RETRY_DELAYS_MS.length) return response;
+        } catch (error) {
+            if (attempt >= RETRY_DELAYS_MS.length) throw error;
+        } finally {
+            clearTimeout(timer);
+        }
+        await new Promise(resolve => setTimeout(resolve, RETRY_DELAYS_MS[attempt]));
+    }
+}
+
 async function undoLastMove() {
     if (!confirm('Desfazer a última jogada?')) return;
 
     try {
-        const response = await fetch(`${API_URL}/api/game/${currentGameId}/undo`, { method: 'POST' });
+        const response = await fetch(`${API_URL}/api/game/${currentGameId}/undo?delta=1`, { method: 'POST' });
         const result = await response.json();
         if (response.ok) {
-            renderGameState(result);
+            const fullState = applyStateDelta(result);
+            if (fullState) renderGameState(fullState);
             showMessage('Jogada desfeita!', 'success');
         } else {
             showMessage(result.error, 'error');
@@ -353,9 +387,9 @@ function exportResults() {
 
 // --- Rendering & Logic ---
 
-async function fetchAndRenderGameState(gameId) {
+async function fetchAndRenderGameState(gameId, desde = 0) {
     try {
-        const res = await fetch(`${API_URL}/api/game/${gameId}`);
+        const res = await fetch(`${API_URL}/api/game/${gameId}?desde=${desde}`);
         const data = await res.json();
         if (res.ok) renderGameState(data);
         else showMessage(data.error, 'error');
@@ -364,7 +398,52 @@ async function fetchAndRenderGameState(gameId) {
     }
 }
 
+// Live updates: plays made on other devices (or watched on a spectator screen) arrive through
+// Server-Sent Events instead of polling. Each message has the plays from `historico_desde` on,
+// like GET ?desde=N; the browser reconnects by itself and resumes from the last event id.
+function watchGame(gameId) {
+    if (gameStream) gameStream.close();
+    if (typeof EventSource === 'undefined' || !currentGameState) return;
+    gameStream = new EventSource(`${API_URL}/api/game/${gameId}/stream?ultimo=${currentGameState.event_count}`);
+    gameStream.addEventListener('partida', (e) => {
+        const state = JSON.parse(e.data);
+        // This device's own changes were already rendered from the POST response
+        if (currentGameId === gameId && state.version > currentGameState.version) renderGameState(state);
+    });
+}
+
+// Mutating endpoints are called with ?delta=1: the answer holds only what changed since
+// `versao_base`. Applies it over the state on screen, or reloads everything when this
+// client was on another version. Returns the full state, or null while reloading.
+// An `intermediaria` answer comes from the middle of a batch of simultaneous plays: it is
+// shown, and the stored state (with the other devices' plays) is loaded right after.
+function applyStateDelta(delta) {
+    if (delta.delta && (!currentGameState || currentGameState.version !== delta.versao_base)) {
+        fetchAndRenderGameState(currentGameId);
+        return null;
+    }
+    if (delta.intermediaria) fetchAndRenderGameState(currentGameId);
+    if (!delta.delta) return delta;
+    const { delta: _, versao_base, intermediaria, repetida, ...changes } = delta;
+    return { ...currentGameState, ...changes };
+}
+
+// The backend only sends the plays from `historico_desde` on (new plays, or none after an undo).
+// Completes them with the history already on screen; returns false if a refetch was needed.
+function mergeGameHistory(gameState) {
+    if (gameState.historico_desde === undefined) return true;
+    const known = (currentGameState && currentGameState.game_history) || [];
+    if (known.length < gameState.historico_desde) {
+        fetchAndRenderGameState(currentGameId, known.length);
+        return false;
+    }
+    gameState.game_history = known.slice(0, gameState.historico_desde).concat(gameState.game_history)
+        .slice(0, gameState.play_count);
+    return true;
+}
+
 function renderGameState(gameState) {
+    if (!mergeGameHistory(gameState)) return;
     currentGameState = gameState; // Update global state reference
     console.log("Rendering state:", gameState);
     document.body.classList.add('game-active'); // Enable fixed layout
@@ -434,30 +513,21 @@ function renderScoreboard(gameState) {
     });
     header.innerHTML += '<th>Spiel</th>';
 
-    // Rows
-    const initialScores = {};
-    gameState.player_names.forEach(n => initialScores[n] = 0);
-    let cumulative = { ...initialScores };
-
+    // Rows: each play carries every player's running total ("totais"), computed by the backend
     gameState.game_history.forEach((play, idx) => {
         const points = play.result.points;
         const scorer = play.jogador;
-
-        cumulative[scorer] += points;
-        if (play.jogo === 'ramsch' && play.houve_empate && play.empates) {
-            // Empates logic handles simple string or array in backend, adapt here ideally
-            const empatePlayer = play.empates;
-            cumulative[empatePlayer] += points;
-        }
+        const totals = play.totais || {};
 
         const tr = document.createElement('tr');
         tr.innerHTML = `<td>${idx + 1}</td>`;
 
-        const isEmpateScorer = (name) => play.jogo === 'ramsch' && play.houve_empate && play.empates === name;
+        // Ramsch ties score for everyone in "empates" (a name or a list), as in the backend
+        const tied = play.jogo === 'ramsch' && play.empates ? [].concat(play.empates) : [];
 
         gameState.player_names.forEach(name => {
-            const score = cumulative[name];
-            const isScorer = name === scorer || isEmpateScorer(name);
+            const score = totals[name] || 0;
+            const isScorer = name === scorer || tied.includes(name);
             const scoreClass = score > 0 ? 'score-positive' : (score < 0 ? 'score-negative' : 'score-zero');
             const bgClass = isScorer ? ' highlight-scorer' : '';
             tr.innerHTML += `<td class="${scoreClass}${bgClass}">${score}</td>`;
@@ -979,6 +1049,6 @@ async function handleRamschDecision(gameState) {
                 body: JSON.stringify({ jogador: gameState.ramsch_candidates[0], deseja_nova_rodada: false })
             });
         }
-        fetchAndRenderGameState(currentGameId); // Refresh after all votes
+        fetchAndRenderGameState(currentGameId, currentGameState.game_history.length); // Refresh after all votes
     }
 }
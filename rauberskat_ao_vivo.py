@@ -0,0 +1,178 @@
+"""
+Canal ao vivo das partidas (Server-Sent Events, GET /api/game/<id>/stream).
+
+Telões e aparelhos que só acompanham a mesa recebem cada alteração em vez
+de ficar consultando o GET da partida. Por processo, cada partida
+acompanhada tem uma única assinatura no armazenamento (o listener do
+Firestore, ou uma consulta da versão no SQLite/memória) e um único thread
+que lê a alteração uma vez e a repassa, já serializada, a todas as conexões:
+50 telões na mesa da final custam o mesmo que um.
+
+Cada mensagem ("event: partida") traz o estado com as jogadas a partir de
+"historico_desde" (RauberskatScorekeeper.atualizacao_desde), e o id é o
+event_count: ao reconectar, o navegador manda Last-Event-ID e a conexão
+continua de onde parou.
+"""
+import json
+import time
+import queue
+import threading
+
+from rauberskat_backend_oficial import RauberskatScorekeeper
+
+# Intervalo da consulta de versão quando o armazenamento não avisa (segundos)
+INTERVALO_CONSULTA = 1.0
+# Comentário enviado em silêncio: mantém proxies abertos e detecta quem saiu
+INTERVALO_PING = 15
+# Duração de cada conexão; o navegador reconecta sozinho e continua pelo id
+DURACAO_CONEXAO = 300
+# Mensagens acumuladas para uma conexão lenta antes de ela ser encerrada
+MAX_PENDENTES = 64
+
+
+def _mensagem(estado):
+    return f"id: {estado['event_count']}\nevent: partida\ndata: {json.dumps(estado, separators=(',', ':'))}\n\n"
+
+
+class _Assinatura:
+    """Uma partida acompanhada: o thread que lê as alterações e as filas das conexões."""
+
+    def __init__(self, game_id, mudou):
+        self.game_id = game_id
+        self.filas = set()
+        self.mudou = mudou  # threading.Event ou asyncio.Event
+        self.ativa = True
+        self.versao = None
+        self.evento = None  # event_count do último estado repassado
+
+
+class CanalAoVivo:
+    """Assinaturas por partida, compartilhadas pelas conexões do processo."""
+
+    def __init__(self, store, intervalo=INTERVALO_CONSULTA, ping=INTERVALO_PING, duracao=DURACAO_CONEXAO):
+        self.store = store
+        self.intervalo = intervalo
+        self.ping = ping
+        self.duracao = duracao
+        self._assinaturas = {}
+        self._lock = threading.Lock()
+
+    def avisar(self, game_id):
+        """A partida pode ter mudado (gravação neste processo ou aviso do armazenamento)."""
+        with self._lock:
+            assinatura = self._assinaturas.get(game_id)
+        if assinatura is not None:
+            assinatura.mudou.set()
+
+    def estatisticas(self):
+        with self._lock:
+            return {"partidas": len(self._assinaturas),
+                    "conexoes": sum(len(a.filas) for a in self._assinaturas.values())}
+
+    def ouvir(self, game_id, ultimo=None):
+        """
+        Abre uma conexão: lê já o estado inicial (ou, com ultimo, o que mudou
+        desde esse event_count), então partida inexistente ou arquivada sobe
+        aqui, antes da resposta começar. Retorna o gerador das mensagens.
+        """
+        fila = queue.Queue()
+        # A fila entra antes da leitura: o que mudar depois dela chega pela fila
+        assinatura, nova = self._entrar(game_id, fila)
+        try:
+            scorekeeper = RauberskatScorekeeper(self.store, game_id)
+            inicial = None
+            if ultimo != scorekeeper.event_count:
+                inicial = scorekeeper.atualizacao_desde(ultimo)
+        except Exception:
+            self._sair(assinatura, fila, encerrar=nova)
+            raise
+        if nova:
+            # A leitura desta conexão é o ponto de partida do thread da partida
+            assinatura.versao, assinatura.evento = scorekeeper.version, scorekeeper.event_count
+            threading.Thread(target=self._acompanhar, args=(assinatura,), daemon=True,
+                             name=f"ao-vivo-{game_id}").start()
+        return self._transmitir(assinatura, fila, inicial, scorekeeper.event_count)
+
+    def _transmitir(self, assinatura, fila, inicial, evento):
+        try:
+            yield f"retry: {int(self.intervalo * 1000) + 1000}\n\n"
+            if inicial is not None:
+                yield _mensagem(inicial)
+            fim = time.monotonic() + self.duracao
+            while time.monotonic() < fim:
+                try:
+                    base, atual, mensagem = fila.get(timeout=max(min(self.ping, fim - time.monotonic()), 0))
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if mensagem is None:
+                    return  # Ficou para trás ou o canal caiu: reconecta e continua pelo id
+                if atual <= evento:
+                    continue
+                if base != evento:
+                    # Esta conexão começou de outro ponto: a diferença é lida só para ela
+                    estado = RauberskatScorekeeper(self.store, assinatura.game_id).atualizacao_desde(evento)
+                    mensagem, atual = _mensagem(estado), estado["event_count"]
+                evento = atual
+                yield mensagem
+        finally:
+            self._sair(assinatura, fila)
+
+    def _entrar(self, game_id, fila):
+        """Registra a conexão; retorna a assinatura e se ela acabou de ser criada."""
+        with self._lock:
+            assinatura = self._assinaturas.get(game_id)
+            nova = assinatura is None
+            if nova:
+                assinatura = self._assinaturas[game_id] = _Assinatura(game_id, self._novo_aviso())
+            assinatura.filas.add(fila)
+            return assinatura, nova
+
+    def _novo_aviso(self):
+        return threading.Event()
+
+    def _sair(self, assinatura, fila, encerrar=False):
+        with self._lock:
+            assinatura.filas.discard(fila)
+            if not (encerrar or not assinatura.filas):
+                return
+            if self._assinaturas.get(assinatura.game_id) is assinatura:
+                del self._assinaturas[assinatura.game_id]
+            assinatura.ativa = False
+            filas = list(assinatura.filas)
+        assinatura.mudou.set()
+        for outra in filas:
+            outra.put_nowait((None, None, None))
+
+    def _acompanhar(self, assinatura):
+        """Thread da partida: uma assinatura no armazenamento, uma leitura por alteração."""
+        cancelar = None
+        try:
+            cancelar = self.store.observar(assinatura.game_id, assinatura.mudou.set)
+            while assinatura.ativa:
+                # Sem aviso do armazenamento, a versão é consultada a cada intervalo
+                if not assinatura.mudou.wait(None if cancelar is not None else self.intervalo):
+                    if self.store.carregar_versao(assinatura.game_id) == assinatura.versao:
+                        continue
+                assinatura.mudou.clear()
+                if not assinatura.ativa:
+                    break
+                scorekeeper = RauberskatScorekeeper(self.store, assinatura.game_id)
+                if scorekeeper.version == assinatura.versao:
+                    continue
+                estado = scorekeeper.atualizacao_desde(assinatura.evento)
+                item = (assinatura.evento, estado["event_count"], _mensagem(estado))
+                assinatura.versao, assinatura.evento = estado["version"], estado["event_count"]
+                with self._lock:
+                    filas = list(assinatura.filas)
+                for fila in filas:
+                    # Conexão que não acompanha: é encerrada em vez de acumular
+                    fila.put_nowait(item if fila.qsize() < MAX_PENDENTES else (None, None, None))
+        except Exception as e:
+            # Partida arquivada ou falha do armazenamento: encerra as conexões (elas reconectam)
+            print(f"⚠️  Canal ao vivo da partida {assinatura.game_id}: {e}")
+            self._sair(assinatura, None, encerrar=True)
+        finally:
+            if cancelar is not None:
+                cancelar()
+
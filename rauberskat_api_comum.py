@@ -0,0 +1,62 @@
+"""
+Partes da API que não dependem do framework, usadas pelo app.py (Flask) e
+pelo app_asgi.py (Quart): limites dos pedidos, a operação de alteração
+entregue ao serializador/executor, a chave de idempotência e o ETag do GET.
+Os parâmetros e headers do pedido chegam como argumento (request.args e
+request.headers de cada framework).
+"""
+
+# Jogadas por pedido em /calculate_batch. Cada uma grava o registro e o evento
+# (200 jogadas: umas 400 escritas e 100 a 200 KB, mais com um histórico longo),
+# tudo numa transação do Firestore, limitada a 10 MiB por requisição. O
+# serializador junta pedidos num commit só até LIMITE_EVENTOS_COMMIT e
+# LIMITE_BYTES_COMMIT (rauberskat_serializer.py)
+MAX_JOGADAS_LOTE = 200
+
+# Tamanho máximo do header Idempotency-Key (a chave fica no documento da partida)
+TAMANHO_MAX_CHAVE = 128
+
+# Tamanho de página de /plays (padrão e máximo)
+LIMITE_PAGINA_JOGADAS = 50
+MAX_PAGINA_JOGADAS = 200
+
+
+def resposta_da_alteracao(args, alterar, chave=None):
+    """
+    Operação para o serializador: aplica alterar(scorekeeper) e responde com
+    o estado e as jogadas novas ou, com ?delta=1, só o que mudou (get_delta).
+    alterar retorna False quando não havia o que alterar (a resposta é None).
+    Com chave (Idempotency-Key), um pedido repetido não é aplicado de novo:
+    a resposta é o estado atual da partida, no mesmo formato (completo ou
+    delta) e marcada com "repetida" (RauberskatScorekeeper.resposta_repetida).
+    """
+    # Lido aqui: a operação pode rodar no thread de outro pedido (group commit)
+    enxuta = args.get('delta') in ('1', 'true')
+
+    def operacao(scorekeeper):
+        if chave is not None:
+            repetida = scorekeeper.resposta_repetida(chave, enxuta)
+            if repetida is not None:
+                return repetida
+            scorekeeper.lembrar_chave(chave)
+        if alterar(scorekeeper) is False:
+            return None
+        return scorekeeper.get_delta() if enxuta else scorekeeper.get_state(incluir_historico=True)
+    return operacao
+
+
+def chave_de_idempotencia(headers):
+    """
+    Chave de idempotência do pedido (header Idempotency-Key), ou None. O
+    aparelho manda a mesma chave em todas as tentativas da mesma jogada.
+    """
+    return headers.get('Idempotency-Key') or None
+
+
+def etag_partida(versao, desde, evento=None):
+    """
+    ETag forte do GET da partida: a resposta só muda quando a partida é
+    gravada (version) ou quando os parâmetros mudam. O mesmo nos dois
+    servidores, então um navegador pode alternar entre eles.
+    """
+    return f"v{versao}-d{desde}" + (f"-e{evento}" if evento is not None else "")
@@ -9,6 +9,7 @@ from PyQt6 import QtWidgets
 from PyQt6.QtGui import QFont, QBrush, QColor
 from PyQt6.QtCore import Qt, QDate, QTime
 from rauberskat_backend_oficial import RauberskatScorekeeper
+from rauberskat_storage import criar_store
 
 
 def resource_path(relative_path):
@@ -26,6 +27,7 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.scorekeeper = None
+        self.store = None  # Armazenamento das partidas, criado no primeiro jogo
         self.game_state = "setup" # "setup", "playing", "ended"
 
         self.setWindowTitle("Räuberskat Scorekeeper")
@@ -596,8 +598,6 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Erro", "Por favor, preencha todos os nomes dos jogadores.")
             return
 
-        self.scorekeeper = RauberskatScorekeeper(nomes)
-
         # Salva os detalhes da partida
         self.game_date = self.date_edit.date().toString("dd/MM/yyyy")
         self.game_venue = self.venue_edit.text()
@@ -605,6 +605,16 @@ class MainWindow(QMainWindow):
         self.game_start_time = self.start_time_edit.time().toString("HH:mm")
         self.game_end_time = self.end_time_edit.time().toString("HH:mm")
 
+        # Mesmo motor da API web. Por padrão a partida fica só em memória;
+        # RAUBERSKAT_STORAGE=sqlite guarda as partidas num arquivo local.
+        if self.store is None:
+            self.store = criar_store(os.environ.get("RAUBERSKAT_STORAGE", "memory"))
+        self.scorekeeper = RauberskatScorekeeper.nova_partida(
+            self.store, nomes,
+            date=self.game_date, venue=self.game_venue, table=self.game_table_name,
+            start_time=self.game_start_time, end_time=self.game_end_time,
+        )
+
         self.configurar_colunas_tabela_resumo()
         
         # Inicializa o acumulador de pontuação dos jogadores
@@ -721,13 +731,9 @@ class MainWindow(QMainWindow):
             self.atualizar_visibilidade_schneider_e_schwartz()
             self.atualizar_visibilidade_multiplicadores()
 
-    def adicionar_resultado_tabela_resumo(self, jogadores_pontuadores, pontos_rodada, rodada_atual):
-        # Atualiza o acumulado para os jogadores que pontuaram
-        for jogador in jogadores_pontuadores:
-            if jogador in self.pontuacao_acumulada:
-                self.pontuacao_acumulada[jogador] += pontos_rodada
-            else:
-                self.pontuacao_acumulada[jogador] = pontos_rodada
+    def adicionar_resultado_tabela_resumo(self, jogadores_pontuadores, pontos_rodada, rodada_atual, totais):
+        # O acumulado vem pronto do backend ("totais" da jogada), já com os empates do Ramsch
+        self.pontuacao_acumulada = dict(totais)
 
         linha = self.tabela_resumo_partida.rowCount()
         self.tabela_resumo_partida.insertRow(linha)
@@ -861,8 +867,9 @@ class MainWindow(QMainWindow):
             if info:
                 dados["info"] = info
 
-            # Enviar para o backend calcular a pontuação e atualizar o estado
-            resultado = self.scorekeeper.calculate_score(dados)
+            # Enviar para o backend: pontuação, transição de rodada e dealer, como na API
+            # (processar_jogada registra o evento da jogada, usado no desfazer e na reconstrução)
+            resultado = self.scorekeeper.processar_jogada(dados)
             if resultado is not None:
                 pontuacao_final, fator_total, base_score = resultado
             else:
@@ -884,11 +891,9 @@ class MainWindow(QMainWindow):
                 # Atualiza a pontuação acumulada do jogador que empatou
                 # A pontuação já é adicionada no backend, não precisa fazer aqui.
 
-            self.adicionar_resultado_tabela_resumo(jogadores_pontuadores, pontuacao_final, rodada_atual)
+            totais = self.scorekeeper.game_history[-1].get("totais", self.scorekeeper.scores)
+            self.adicionar_resultado_tabela_resumo(jogadores_pontuadores, pontuacao_final, rodada_atual, totais)
 
-            # Avançar para a próxima rodada e dealer
-            self.scorekeeper.check_mode_transition()
-            
             # Verificar se o backend está aguardando uma decisão sobre a rodada de Ramsch
             if self.scorekeeper.awaiting_ramsch_decision and self.scorekeeper.ramsch_candidates:
                 # Itera sobre a cópia da lista de candidatos
@@ -910,14 +915,14 @@ class MainWindow(QMainWindow):
                         break # Interrompe o loop de perguntas
 
                 # Se a decisão foi por uma nova rodada de Ramsch, a rodada atual não muda. Se não, o backend já terá mudado para Bock.
-                # Apenas precisamos atualizar a interface.
+                # O backend também já avançou o dealer: apenas precisamos gravar e atualizar a interface.
+                self.scorekeeper._save_state()
                 self.atualizar_rodada_atual()
-                self.scorekeeper.next_dealer()
                 self.atualizar_dealer()
                 return # A lógica de avanço já foi tratada
 
-            # Atualizar o dealer
-            self.scorekeeper.next_dealer()
+            # O backend já avançou a rodada e o dealer
+            self.scorekeeper._save_state()
             # Atualizar exibição da rodada atual
             self.atualizar_rodada_atual()
             #Atualizar a exibição do dealer atual
@@ -1020,6 +1025,7 @@ class MainWindow(QMainWindow):
         if resposta == QMessageBox.StandardButton.Yes:
             sucesso = self.scorekeeper.undo_last_game()
             if sucesso:
+                self.scorekeeper._save_state()
                 self.atualizar_rodada_atual()
                 self.atualizar_dealer()
                 # Remove a última linha da tabela lateral
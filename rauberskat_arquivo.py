@@ -0,0 +1,193 @@
+"""
+Arquivo frio das partidas encerradas ou paradas há muito tempo.
+
+As partidas saem do armazenamento "quente" (Firestore/SQLite) e vão para
+segmentos JSONL comprimidos, só acrescentados, num diretório:
+
+    segmento-00000.jsonl.gz   uma partida por linha; cada linha é um membro
+    segmento-00001.jsonl.gz   gzip próprio (o arquivo inteiro abre com zcat)
+    indice.jsonl              {"game_id", "segmento", "offset", "tamanho"}
+
+O índice diz onde está cada partida: a leitura faz um seek e descomprime só
+aquela linha. No armazenamento fica uma lápide pequena (jogadores, placar,
+detalhes da mesa e "arquivada"), então as consultas e o custo da coleção
+viva não crescem com os anos de noites do clube.
+
+Varredura (cron no servidor do clube):
+    RAUBERSKAT_ARQUIVO_DIR=/var/lib/rauberskat/arquivo python rauberskat_arquivo.py [dias_inativa] [horas_encerrada] [--legado]
+
+--legado inclui as partidas gravadas antes do campo "updated_at" (ver
+GameStore.listar_para_arquivar). Basta uma vez, pelo menos dias_inativa
+depois da implantação: até lá, uma partida sem o campo pode ainda estar em
+jogo no SQLite, que não sabe quando o documento foi escrito.
+"""
+import os
+import sys
+import gzip
+import json
+import datetime
+import threading
+import contextlib
+
+try:
+    import fcntl  # Trava entre processos (vários workers ou o cron)
+except ImportError:
+    fcntl = None
+
+from rauberskat_storage import MemoryGameStore, ConflitoDeVersao
+
+# Tamanho a partir do qual um segmento novo é aberto
+LIMITE_SEGMENTO = 64 * 1024 * 1024
+# Partidas sem alteração há tantos dias são arquivadas mesmo sem encerrar
+DIAS_INATIVA = 30
+# Partidas encerradas esperam um pouco (ainda dá para desfazer a última jogada)
+HORAS_ENCERRADA = 1
+
+# Campos do documento que continuam na lápide, para listagens sem abrir o arquivo
+CAMPOS_LAPIDE = [
+    "game_id", "player_names", "num_players", "scores", "play_count", "event_count", "finished_at",
+    "date", "venue", "table", "start_time", "end_time",
+]
+
+
+def _agora_utc():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class ArquivoFrio:
+    """Segmentos gzip só acrescentados, com índice de posição por partida."""
+
+    def __init__(self, diretorio, limite_segmento=LIMITE_SEGMENTO):
+        os.makedirs(diretorio, exist_ok=True)
+        self.diretorio = diretorio
+        self.limite_segmento = limite_segmento
+        self._indice = {}
+        self._indice_lido = 0  # Até onde indice.jsonl já foi lido
+        self._lock = threading.Lock()
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    @contextlib.contextmanager
+    def _exclusivo(self):
+        """Uma escrita por vez no diretório, entre threads e entre processos."""
+        with self._lock, open(self._caminho(".lock"), "a") as trava:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(trava, fcntl.LOCK_UN)
+
+    def _ler_indice(self):
+        """Lê as linhas novas do índice (outros processos podem ter acrescentado)."""
+        caminho = self._caminho("indice.jsonl")
+        if not os.path.exists(caminho):
+            return
+        with open(caminho, "rb") as f:
+            f.seek(self._indice_lido)
+            for linha in f:
+                if not linha.endswith(b"\n"):
+                    break  # Linha ainda sendo escrita
+                entrada = json.loads(linha)
+                self._indice[entrada["game_id"]] = entrada  # A última entrada de uma partida vale
+                self._indice_lido += len(linha)
+
+    def _segmento_para(self, tamanho):
+        segmentos = sorted(nome for nome in os.listdir(self.diretorio) if nome.startswith("segmento-"))
+        if segmentos and os.path.getsize(self._caminho(segmentos[-1])) + tamanho <= self.limite_segmento:
+            return segmentos[-1]
+        return f"segmento-{len(segmentos):05d}.jsonl.gz"
+
+    def anexar(self, game_id, pacote):
+        """Acrescenta a partida ao segmento atual e ao índice; retorna a entrada do índice."""
+        bloco = gzip.compress((json.dumps(pacote, separators=(",", ":")) + "\n").encode("utf-8"))
+        with self._exclusivo():
+            segmento = self._segmento_para(len(bloco))
+            with open(self._caminho(segmento), "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(bloco)
+                f.flush()
+                os.fsync(f.fileno())
+            entrada = {"game_id": game_id, "segmento": segmento, "offset": offset, "tamanho": len(bloco)}
+            # O índice só é escrito com o segmento já no disco
+            with open(self._caminho("indice.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entrada) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._ler_indice()
+        return entrada
+
+    def localizar(self, game_id):
+        """Entrada do índice da partida, ou None."""
+        with self._lock:
+            if game_id not in self._indice:
+                self._ler_indice()
+            return self._indice.get(game_id)
+
+    def carregar(self, game_id):
+        """Retorna a partida arquivada ({"documento", "jogadas", "eventos", "checkpoints"})."""
+        entrada = self.localizar(game_id)
+        if entrada is None:
+            raise ValueError(f"Partida com ID '{game_id}' não está no arquivo frio.")
+        with open(self._caminho(entrada["segmento"]), "rb") as f:
+            f.seek(entrada["offset"])
+            bloco = f.read(entrada["tamanho"])
+        return json.loads(gzip.decompress(bloco))
+
+    def store_da_partida(self, game_id):
+        """Armazenamento em memória só com a partida arquivada, para ser lida pelo Scorekeeper."""
+        memoria = MemoryGameStore()
+        memoria.importar_partida(game_id, self.carregar(game_id))
+        return memoria
+
+
+def arquivar_partida(store, arquivo, game_id):
+    """
+    Move uma partida para o arquivo frio e deixa a lápide no lugar.
+    Retorna False se ela mudou no meio do caminho (continua no armazenamento;
+    a cópia já anexada fica órfã no segmento e é ignorada).
+    """
+    pacote = store.exportar_partida(game_id)
+    if pacote is None or "arquivada" in pacote["documento"]:
+        return False
+    documento = pacote["documento"]
+    versao = documento.get("version", 0)
+    quando = _agora_utc().isoformat(timespec="seconds")
+    # A lápide muda a versão (caches e gravações condicionais dos outros
+    # workers percebem a troca); a cópia arquivada leva a mesma versão, para
+    # o ETag do GET (lido da cópia) bater com o conferido (lido da lápide)
+    documento = dict(documento, version=versao + 1)
+    entrada = arquivo.anexar(game_id, dict(pacote, documento=documento, game_id=game_id, arquivada_em=quando))
+
+    lapide = {campo: documento.get(campo) for campo in CAMPOS_LAPIDE}
+    lapide.update(game_id=game_id, version=versao + 1,
+                  arquivada={"em": quando, "segmento": entrada["segmento"]})
+    try:
+        store.substituir_por_lapide(game_id, lapide, versao)
+    except ConflitoDeVersao as e:
+        print(f"⚠️  {e} Fica para a próxima varredura.")
+        return False
+    return True
+
+
+def arquivar_partidas(store, arquivo, dias_inativa=DIAS_INATIVA, horas_encerrada=HORAS_ENCERRADA, legado=False):
+    """Varredura: arquiva as partidas encerradas e as paradas há muito tempo. Retorna os IDs arquivados."""
+    agora = _agora_utc()
+    inativas_ate = (agora - datetime.timedelta(days=dias_inativa)).isoformat(timespec="seconds")
+    encerradas_ate = (agora - datetime.timedelta(hours=horas_encerrada)).isoformat(timespec="seconds")
+    candidatas = store.listar_para_arquivar(inativas_ate, encerradas_ate, legado)
+    arquivadas = [game_id for game_id in candidatas if arquivar_partida(store, arquivo, game_id)]
+    print(f"🧊 {len(arquivadas)} de {len(candidatas)} partidas movidas para o arquivo frio.")
+    return arquivadas
+
+
+if __name__ == "__main__":
+    # Mesmo armazenamento e diretório configurados para a API
+    from app import store, arquivo
+    if arquivo is None:
+        print("Defina RAUBERSKAT_ARQUIVO_DIR com o diretório do arquivo frio.")
+        sys.exit(1)
+    argumentos = [valor for valor in sys.argv[1:] if valor != "--legado"]
+    arquivar_partidas(store, arquivo, *[float(valor) for valor in argumentos[:2]], legado="--legado" in sys.argv)
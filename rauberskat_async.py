@@ -0,0 +1,382 @@
+"""
+Armazenamento assíncrono para a API ASGI (app_asgi.py).
+
+O RauberskatScorekeeper é síncrono e lê o armazenamento no meio das regras
+(o documento ao carregar, a jogada anterior no desfazer, as jogadas vivas
+no checkpoint...). Aqui ele roda sem mudança nenhuma sobre um
+EspelhoDeLeituras: um GameStore síncrono que só responde com o que já foi
+lido. Quando falta uma leitura, o espelho interrompe a operação
+(LeituraPendente); o executor faz essa leitura com await e roda a operação
+de novo, desde o início. Até a gravação tudo é feito em memória, então
+repetir é seguro (como as repetições do serializador em conflito). As
+gravações pedidas ficam guardadas no espelho e são feitas no fim, também
+com await.
+
+Enquanto uma requisição espera o Firestore, o processo atende as outras:
+centenas de pedidos em andamento sem um thread para cada um.
+"""
+import copy
+import json
+import time
+import random
+import asyncio
+import contextlib
+import contextvars
+
+from rauberskat_backend_oficial import RauberskatScorekeeper
+from rauberskat_ao_vivo import (CanalAoVivo, INTERVALO_CONSULTA, INTERVALO_PING, DURACAO_CONEXAO, MAX_PENDENTES,
+                                _mensagem)
+from rauberskat_storage import (GameStore, FirestoreGameStore, ConflitoDeVersao, _versao, _juntar_checkpoint,
+                                _tamanho, _lotes)
+from rauberskat_metricas import CHAMADAS, medir, contar_bytes
+from rauberskat_serializer import TENTATIVAS_CONFLITO
+
+
+class LeituraPendente(BaseException):
+    """
+    O espelho não tem esta leitura. BaseException de propósito: os
+    "except Exception" das regras (ex.: lote de jogadas) não a engolem.
+    """
+
+    def __init__(self, chave, metodo, args):
+        super().__init__(metodo)
+        self.chave = chave
+        self.metodo = metodo
+        self.args = args
+
+
+class EspelhoDeLeituras(GameStore):
+    """GameStore síncrono com as leituras já feitas; gravações ficam guardadas para o executor."""
+
+    def __init__(self):
+        self.lidos = {}
+        self.gravacoes = []
+
+    def _ler(self, metodo, *args, chave=None):
+        if chave is None:
+            chave = (metodo, json.dumps(args, sort_keys=True, default=str))
+        if chave not in self.lidos:
+            raise LeituraPendente(chave, metodo, args)
+        return copy.deepcopy(self.lidos[chave])
+
+    def criar_partida(self, estado):
+        # Uma criação por operação: ao repetir, o mesmo ID (o estado tem horário e muda)
+        return self._ler("criar_partida", estado, chave=("criar_partida",))
+
+    def carregar_partida(self, game_id):
+        return self._ler("carregar_partida", game_id)
+
+    def carregar_versao(self, game_id):
+        return self._ler("carregar_versao", game_id)
+
+    def carregar_jogada(self, game_id, seq):
+        return self._ler("carregar_jogada", game_id, seq)
+
+    def listar_jogadas(self, game_id, desde=0, ate=None):
+        return self._ler("listar_jogadas", game_id, desde, ate)
+
+    def buscar_jogadas(self, game_id, cursor=None, limite=50, decrescente=False, filtros=None):
+        return self._ler("buscar_jogadas", game_id, cursor, limite, decrescente, filtros)
+
+    def listar_eventos(self, game_id, desde=0, ate=None):
+        return self._ler("listar_eventos", game_id, desde, ate)
+
+    def carregar_checkpoint(self, game_id, ate=None):
+        return self._ler("carregar_checkpoint", game_id, ate)
+
+    def gravar(self, game_id, **alteracoes):
+        self.gravacoes.append((game_id, alteracoes))
+
+
+class ExecutorAssincrono:
+    """
+    Roda as regras do Scorekeeper com leituras e gravações assíncronas.
+
+    As alterações de uma mesma partida passam por uma trava (asyncio.Lock)
+    por game_id dentro do processo; entre processos vale o controle de
+    versão, e um conflito refaz a operação sobre o estado novo.
+
+    ao_gravar(game_id), se informado, é chamado depois de cada gravação.
+    """
+
+    def __init__(self, store, ao_gravar=None):
+        self.store = store
+        self.ao_gravar = ao_gravar
+        self._travas = {}  # game_id -> [trava, usuários]
+
+    async def rodar(self, funcao):
+        """
+        funcao(espelho), com as leituras que faltarem feitas com await; depois,
+        as gravações que ela pediu. Retorna o que funcao retornar.
+        """
+        espelho = EspelhoDeLeituras()
+        while True:
+            espelho.gravacoes = []
+            try:
+                resultado = funcao(espelho)
+                break
+            except LeituraPendente as falta:
+                espelho.lidos[falta.chave] = await getattr(self.store, falta.metodo)(*falta.args)
+        for game_id, alteracoes in espelho.gravacoes:
+            await self.store.gravar(game_id, **alteracoes)
+        return resultado
+
+    async def ler(self, game_id, operacao):
+        """operacao(scorekeeper) sobre a partida carregada, sem gravar."""
+        return await self.rodar(lambda espelho: operacao(RauberskatScorekeeper(espelho, game_id)))
+
+    async def criar_partida(self, nome_jogadores, **detalhes):
+        """Cria a partida (documento e checkpoint inicial) e retorna o ID."""
+        return await self.rodar(lambda espelho: RauberskatScorekeeper.iniciar_jogo(espelho, nome_jogadores,
+                                                                                  **detalhes))
+
+    async def executar(self, game_id, operacao, repetivel=True):
+        """
+        Aplica operacao(scorekeeper) e grava, como SerializadorDePartidas.executar.
+        repetivel=False (desfazer): em conflito, ConflitoDeVersao sobe em vez
+        de a operação ser refeita sobre outro estado.
+        """
+        def aplicar(espelho):
+            scorekeeper = RauberskatScorekeeper(espelho, game_id)
+            resultado = operacao(scorekeeper)
+            scorekeeper._save_state()
+            return resultado, scorekeeper
+
+        async with self._trava(game_id):
+            for tentativa in range(TENTATIVAS_CONFLITO):
+                try:
+                    resultado, scorekeeper = await self.rodar(aplicar)
+                except ConflitoDeVersao as e:
+                    if not repetivel or tentativa == TENTATIVAS_CONFLITO - 1:
+                        raise
+                    print(f"⚠️  {e} Tentativa {tentativa + 1} de {TENTATIVAS_CONFLITO}.")
+                    await asyncio.sleep(random.uniform(0, 0.005 * 2 ** min(tentativa, 5)))
+                    continue
+                if isinstance(resultado, dict) and "version" in resultado:
+                    resultado.update(version=scorekeeper.version, updated_at=scorekeeper.updated_at,
+                                     checkpoint=scorekeeper.checkpoint)
+                if self.ao_gravar is not None:
+                    self.ao_gravar(game_id)
+                return resultado
+
+    @contextlib.asynccontextmanager
+    async def _trava(self, game_id):
+        entrada = self._travas.setdefault(game_id, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0]:
+                yield
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del self._travas[game_id]
+
+
+class StoreAssincrono:
+    """
+    Versão assíncrona de um GameStore síncrono (SQLite, memória): cada
+    chamada roda num thread do executor padrão do asyncio (a memória roda
+    direto, em_thread=False). latencia (segundos, só para benchmarks)
+    simula a ida e volta de um banco remoto sem ocupar thread nenhum.
+    """
+
+    def __init__(self, store, em_thread=True, latencia=0.0):
+        self.store = store
+        self.em_thread = em_thread
+        self.latencia = latencia
+
+    def __getattr__(self, nome):
+        metodo = getattr(self.store, nome)
+
+        async def chamar(*args, **kwargs):
+            if self.latencia:
+                await asyncio.sleep(self.latencia)
+            if self.em_thread:
+                # O thread roda no contexto da requisição: os bytes gravados entram na medição dela
+                contexto = contextvars.copy_context()
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: contexto.run(metodo, *args, **kwargs))
+            return metodo(*args, **kwargs)
+        return chamar
+
+
+class StoreAssincronoMedido:
+    """StoreMedido (rauberskat_metricas.py) para um armazenamento assíncrono."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, nome):
+        metodo = getattr(self.store, nome)
+        etapa = CHAMADAS.get(nome)
+        if etapa is None:
+            return metodo
+
+        async def medido(*args, **kwargs):
+            with medir(etapa):
+                return await metodo(*args, **kwargs)
+        return medido
+
+
+class AsyncFirestoreGameStore(FirestoreGameStore):
+    """
+    FirestoreGameStore sobre o cliente assíncrono (google.cloud.firestore.AsyncClient):
+    mesmos documentos e mesmas operações de gravação, com await.
+    """
+
+    async def _checkpoint_do_doc(self, doc):
+        checkpoint = doc.to_dict()
+        if checkpoint is not None and "partes" in checkpoint:
+            partes = [parte.to_dict() async for parte in doc.reference.collection('partes').order_by('parte').stream()]
+            checkpoint = _juntar_checkpoint(checkpoint, partes)
+        return checkpoint
+
+    async def criar_partida(self, estado):
+        contar_bytes(_tamanho(estado))
+        update_time, game_ref = await self.db.collection('partidas').add(estado)
+        return game_ref.id
+
+    async def carregar_partida(self, game_id):
+        return (await self._game_ref(game_id).get()).to_dict()
+
+    async def carregar_versao(self, game_id):
+        doc = await self._game_ref(game_id).get(field_paths=["version"])
+        return _versao(doc.to_dict()) if doc.exists else None
+
+    async def carregar_jogada(self, game_id, seq):
+        return (await self._jogada_ref(game_id, seq).get()).to_dict()
+
+    async def listar_jogadas(self, game_id, desde=0, ate=None):
+        consulta = self._game_ref(game_id).collection('jogadas').where('seq', '>=', desde)
+        if ate is not None:
+            consulta = consulta.where('seq', '<', ate)
+        return [doc.to_dict() async for doc in consulta.order_by('seq').stream()]
+
+    async def buscar_jogadas(self, game_id, cursor=None, limite=50, decrescente=False, filtros=None):
+        consulta = self._consulta_jogadas(game_id, cursor, decrescente, filtros)
+        if consulta is None:
+            return []
+        return [doc.to_dict() async for doc in consulta.limit(limite).stream()]
+
+    async def listar_eventos(self, game_id, desde=0, ate=None):
+        consulta = self._game_ref(game_id).collection('eventos').where('n', '>=', desde)
+        if ate is not None:
+            consulta = consulta.where('n', '<', ate)
+        return [doc.to_dict() async for doc in consulta.order_by('n').stream()]
+
+    async def carregar_checkpoint(self, game_id, ate=None):
+        consulta = self._game_ref(game_id).collection('checkpoints')
+        if ate is not None:
+            consulta = consulta.where('n', '<=', ate)
+        async for doc in consulta.order_by('n', direction='DESCENDING').limit(1).stream():
+            return await self._checkpoint_do_doc(doc)
+        return None
+
+    async def gravar(self, game_id, documento=None, campos=None, jogadas=(), removidas=(), undos=None,
+                     versao=None, eventos=(), checkpoint=None):
+        operacoes = self._operacoes(game_id, documento, campos, jogadas, removidas, undos, eventos, checkpoint)
+        if versao is not None:
+            await self._commit_condicional(game_id, versao, operacoes)  # Tudo numa transação, como no síncrono
+            return
+        for lote in _lotes(operacoes):
+            batch = self.db.batch()
+            self._aplicar(batch, lote)
+            await batch.commit()
+
+    async def _commit_condicional(self, game_id, versao, operacoes):
+        from google.cloud import firestore
+        game_ref = self._game_ref(game_id)
+
+        @firestore.async_transactional
+        async def aplicar(transacao):
+            atual = (await game_ref.get(transaction=transacao)).to_dict()
+            if atual is None:
+                raise ValueError(f"Partida com ID '{game_id}' não encontrada.")
+            if _versao(atual) != versao:
+                raise ConflitoDeVersao(game_id, versao, _versao(atual))
+            FirestoreGameStore._aplicar(transacao, operacoes)
+
+        await aplicar(self.db.transaction())
+
+
+class CanalAoVivoAssincrono(CanalAoVivo):
+    """
+    O canal de rauberskat_ao_vivo.py na API ASGI (app_asgi.py): uma tarefa
+    asyncio por partida acompanhada em vez de um thread, com as leituras pelo
+    ExecutorAssincrono. O cliente assíncrono do Firestore não tem listener,
+    então a versão é consultada a cada intervalo; as gravações do próprio
+    processo avisam na hora. Tudo roda no loop do servidor. (Fica neste
+    módulo para o app.py não importar o asyncio.)
+    """
+
+    def __init__(self, executor, intervalo=INTERVALO_CONSULTA, ping=INTERVALO_PING, duracao=DURACAO_CONEXAO):
+        super().__init__(executor.store, intervalo, ping, duracao)
+        self.executor = executor
+
+    def _novo_aviso(self):
+        return asyncio.Event()
+
+    async def ouvir(self, game_id, ultimo=None):
+        fila = asyncio.Queue()
+        assinatura, nova = self._entrar(game_id, fila)
+        try:
+            versao, evento, inicial = await self.executor.ler(game_id, lambda scorekeeper: (
+                scorekeeper.version, scorekeeper.event_count,
+                scorekeeper.atualizacao_desde(ultimo) if ultimo != scorekeeper.event_count else None))
+        except Exception:
+            self._sair(assinatura, fila, encerrar=nova)
+            raise
+        if nova:
+            assinatura.versao, assinatura.evento = versao, evento
+            asyncio.get_running_loop().create_task(self._acompanhar(assinatura))
+        return self._transmitir(assinatura, fila, inicial, evento)
+
+    async def _transmitir(self, assinatura, fila, inicial, evento):
+        try:
+            yield f"retry: {int(self.intervalo * 1000) + 1000}\n\n"
+            if inicial is not None:
+                yield _mensagem(inicial)
+            fim = time.monotonic() + self.duracao
+            while time.monotonic() < fim:
+                try:
+                    base, atual, mensagem = await asyncio.wait_for(
+                        fila.get(), max(min(self.ping, fim - time.monotonic()), 0))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if mensagem is None:
+                    return
+                if atual <= evento:
+                    continue
+                if base != evento:
+                    estado = await self.executor.ler(assinatura.game_id,
+                                                     lambda scorekeeper: scorekeeper.atualizacao_desde(evento))
+                    mensagem, atual = _mensagem(estado), estado["event_count"]
+                evento = atual
+                yield mensagem
+        finally:
+            self._sair(assinatura, fila)
+
+    async def _acompanhar(self, assinatura):
+        try:
+            while assinatura.ativa:
+                try:
+                    await asyncio.wait_for(assinatura.mudou.wait(), self.intervalo)
+                except asyncio.TimeoutError:
+                    if await self.store.carregar_versao(assinatura.game_id) == assinatura.versao:
+                        continue
+                assinatura.mudou.clear()
+                if not assinatura.ativa:
+                    break
+                estado = await self.executor.ler(assinatura.game_id, lambda scorekeeper: (
+                    scorekeeper.atualizacao_desde(assinatura.evento)
+                    if scorekeeper.version != assinatura.versao else None))
+                if estado is None:
+                    continue
+                item = (assinatura.evento, estado["event_count"], _mensagem(estado))
+                assinatura.versao, assinatura.evento = estado["version"], estado["event_count"]
+                for fila in list(assinatura.filas):
+                    fila.put_nowait(item if fila.qsize() < MAX_PENDENTES else (None, None, None))
+        except Exception as e:
+            print(f"⚠️  Canal ao vivo da partida {assinatura.game_id}: {e}")
+            self._sair(assinatura, None, encerrar=True)
@@ -3,42 +3,89 @@ import random
 import math
 import copy
 
+from rauberskat_storage import MemoryGameStore, PartidaArquivada
+from rauberskat_codec import codificar_jogada, decodificar_jogada, codificar_delta, JOGOS, MODOS
+from rauberskat_pontuacao import PONTOS_BASE, JOGOS_NULL, chave_jogada, pontuar, tipo_null
+from rauberskat_metricas import medir
+
+# Campos do estado da partida que uma jogada (ou uma decisão de Ramsch) pode
+# alterar, com seus valores padrão. O diário de desfazer guarda apenas os
+# valores anteriores dos campos que realmente mudaram.
+CAMPOS_DESFAZER = {
+    "scores": {},
+    "current_mode": "Bock",
+    "bock_rounds_played": 0,
+    "ramsch_rounds_played": 0,
+    "last_game_name": "",
+    "last_scoring_player": None,
+    "dealer_index": 0,
+    "awaiting_ramsch_decision": False,
+    "ramsch_candidates": [],
+    "ramsch_losses": {},
+    "ramsch_scores_count": {},
+    "ramsch_ramsch_count": 0,
+    "dealer_turns_count": {},
+    "bonus_turns": 0,
+    "last_was_bonus": False,
+}
+
+# Campos do documento principal da partida (partidas/<id>).
+# Detalhes da mesa (data, sede, mesa, horários) também ficam aqui.
+CAMPOS_DETALHES = ["date", "venue", "table", "start_time", "end_time"]
+CAMPOS_DOCUMENTO = [
+    "game_id", "player_names", "num_players", "scores", "current_mode", "dealer_index",
+    "bock_rounds_played", "ramsch_rounds_played", "last_game_name", "ramsch_losses",
+    "ramsch_scores_count", "ramsch_ramsch_count", "dealer_turns_count", "last_scoring_player",
+    "awaiting_ramsch_decision", "ramsch_candidates", "last_was_bonus", "play_count", "version",
+    "event_count", "checkpoint", "updated_at", "finished_at",
+] + CAMPOS_DETALHES
+
+# A cada quantos eventos o estado derivado é gravado como checkpoint
+INTERVALO_CHECKPOINT = 50
+
+# Chaves de idempotência lembradas por partida (as mais recentes, no documento).
+# Não vão nas respostas: ficam fora de CAMPOS_DOCUMENTO.
+MAX_CHAVES_IDEMPOTENCIA = 32
+
+
+class JogadaInvalida(ValueError):
+    """Uma jogada de um lote foi rejeitada; nenhuma jogada do lote é aplicada."""
+
+    def __init__(self, indice, erro):
+        super().__init__(f"Jogada {indice + 1} do lote rejeitada: {erro}")
+        self.indice = indice
+        self.erro = erro
+
+
+def _agora_utc():
+    # "updated_at"/"finished_at": ISO em UTC, comparável como texto na varredura do arquivo frio
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
 class RauberskatScorekeeper:
-    # Modificado para integração com Firebase
-    def __init__(self, db, game_id):
+    # O armazenamento é plugável: Firestore (web), SQLite ou memória (desktop)
+    base_scores = PONTOS_BASE  # Tabela única do módulo, não é refeita por partida
+
+    def __init__(self, store, game_id):
         """
-        Inicializa o Scorekeeper com uma referência ao banco de dados e um ID de partida.
-        O estado do jogo será carregado do Firestore.
+        Inicializa o Scorekeeper com um armazenamento (GameStore) e um ID de partida.
+        O estado do jogo será carregado do armazenamento.
         """
-        self.db = db
+        self.store = store
         self.game_id = game_id
-        self.game_ref = self.db.collection('partidas').document(self.game_id)
         
-        # Carrega os dados do jogo do Firestore.
+        # Carrega os dados do jogo do armazenamento.
         # Os atributos da classe (self.scores, self.current_mode, etc.)
         # serão definidos pelo método _load_state().
         self._load_state()
 
-        self.base_scores = {
-                "ouros": 9,
-                "grand hand": 24,
-                "copas": 10,
-                "espadas": 11,
-                "paus": 12,
-                "null": 23,
-                "grand": 24,
-                "null hand": 35,
-                "null ouvert": 46,
-                "null hand ouvert": 59,
-                "null revolution": 92,
-                "durchmarsch": 120
-            }
-
     def _load_state(self):
-        """Carrega o estado do jogo do Firestore para os atributos da classe."""
-        game_data = self.game_ref.get().to_dict()
+        """Carrega o estado do jogo do armazenamento para os atributos da classe."""
+        game_data = self.store.carregar_partida(self.game_id)
         if not game_data:
-            raise ValueError(f"Partida com ID '{self.game_id}' não encontrada no Firestore.")
+            raise ValueError(f"Partida com ID '{self.game_id}' não encontrada.")
+        if "arquivada" in game_data:
+            # Só a lápide ficou no armazenamento; a leitura é feita no arquivo frio
+            raise PartidaArquivada(self.game_id, game_data)
         
         # Define os atributos da instância com base nos dados do DB
         self.scores = game_data.get("scores", {})
@@ -49,31 +96,467 @@ class RauberskatScorekeeper:
         self.bock_rounds_played = game_data.get("bock_rounds_played", 0)
         self.ramsch_rounds_played = game_data.get("ramsch_rounds_played", 0)
         self.last_game_name = game_data.get("last_game_name", "")
-        self.previous_states = game_data.get("previous_states", [])
         self.ramsch_losses = game_data.get("ramsch_losses", {})
         self.ramsch_scores_count = game_data.get("ramsch_scores_count", {})
         self.ramsch_ramsch_count = game_data.get("ramsch_ramsch_count", 0)
         self.dealer_turns_count = game_data.get("dealer_turns_count", {})
         self.last_scoring_player = game_data.get("last_scoring_player", None)
-        self.game_history = game_data.get("game_history", [])
         self.awaiting_ramsch_decision = game_data.get("awaiting_ramsch_decision", False)
         self.ramsch_candidates = game_data.get("ramsch_candidates", [])
         self.last_was_bonus = game_data.get("last_was_bonus", False)
+        for campo in CAMPOS_DETALHES:
+            setattr(self, campo, game_data.get(campo))
+        self.chaves_recentes = game_data.get("chaves_recentes", [])
+
+        # Cópia do que está no DB: o save grava apenas os campos que mudaram
+        self._estado_carregado = copy.deepcopy({k: v for k, v in game_data.items()
+                                                if k in CAMPOS_DOCUMENTO or k == "chaves_recentes"})
+        self._gravacao_completa = False
+
+        # O histórico não fica no documento principal: cada jogada é um registro
+        # próprio no armazenamento, com o delta de desfazer junto ("undo").
+        # Em memória, game_history guarda só as jogadas desde o carregamento;
+        # a jogada game_history[i] tem a sequência _historico_desde + i.
+        self.play_count = game_data.get("play_count", 0)
+        # Versão do documento lido: cada gravação só vale se ninguém gravou antes
+        self.version = game_data.get("version", 0)
+        # Fluxo de eventos: quantos já existem e o último checkpoint gravado
+        # (None em partidas anteriores aos eventos, que ainda não têm checkpoint)
+        self.event_count = game_data.get("event_count", 0)
+        self.checkpoint = game_data.get("checkpoint")
+        self._eventos_novos = []
+        # Última gravação e encerramento: a varredura do arquivo frio usa os dois
+        self.updated_at = game_data.get("updated_at")
+        self.finished_at = game_data.get("finished_at")
+        self.game_history = []
+        self._historico_desde = self.play_count
+        self._jogadas_gravadas = 0  # Quantas de game_history já estão no DB
+        self._jogadas_removidas = set()
+        self._undo_atualizado = {}
+        self._estado_antes = None
+        self._historico_antes = 0
+
+        if "game_history" in game_data:
+            # Partida no formato antigo, com o histórico dentro do documento.
+            # Os snapshots de "previous_states" (ou o "undo_journal") viram
+            # deltas presos a cada jogada, e tudo é regravado no próximo save.
+            self.game_history = game_data["game_history"]
+            self._historico_desde = 0
+            self._gravacao_completa = True  # Regrava o documento sem os campos antigos
+            journal = game_data.get("undo_journal")
+            if journal is None:
+                journal = self._migrar_previous_states(game_data.get("previous_states", []))
+            for jogada, entrada in zip(reversed(self.game_history), reversed(journal)):
+                if entrada.get("jogadas", 1) == 1:
+                    jogada["undo"] = {"campos": entrada["campos"], "chaves": entrada["chaves"]}
+            self.game_history = self._preencher_totais(self.game_history)
+
+    def get_state(self, incluir_historico=False):
+        """
+        Retorna o estado atual em memória, no mesmo formato do documento salvo.
+        Com incluir_historico=True, acrescenta as jogadas feitas desde o
+        carregamento ("game_history") e a sequência da primeira delas
+        ("historico_desde"), para o frontend completar o histórico que já tem.
+        """
+        self._fechar_delta()
+        self.play_count = self._historico_desde + len(self.game_history)
+        current_state = {campo: getattr(self, campo) for campo in CAMPOS_DOCUMENTO}
+        if incluir_historico:
+            current_state['game_history'] = [self._jogada_publica(j) for j in self.game_history]
+            current_state['historico_desde'] = self._historico_desde
+        return current_state
+
+    def get_delta(self):
+        """
+        Resposta enxuta das alterações: só os campos do documento que mudaram
+        desde a leitura, mais as jogadas feitas desde então ("game_history" a
+        partir de "historico_desde", com os totais; depois de um desfazer,
+        play_count menor). "versao_base" é a versão lida: o cliente que está
+        nela aplica o delta sobre o que tem. O tamanho não cresce com a partida.
+        """
+        estado = self.get_state(incluir_historico=True)
+        delta = {k: v for k, v in estado.items()
+                 if k not in self._estado_carregado or self._estado_carregado[k] != v}
+        for campo in ("game_id", "version", "play_count", "game_history", "historico_desde"):
+            delta[campo] = estado[campo]
+        delta["versao_base"] = self.version
+        delta["delta"] = True
+        return delta
+
+    # --- Idempotência ---
+
+    def _entrada_da_chave(self, chave):
+        for entrada in self.chaves_recentes:
+            if entrada["chave"] == chave:
+                return entrada
+        return None
+
+    def lembrar_chave(self, chave):
+        """
+        Registra a chave de idempotência da alteração que vai ser aplicada
+        (chamado antes dela), junto com a sequência da sua primeira jogada.
+        Vai para o documento no mesmo commit da alteração: com a gravação
+        condicional, dois pedidos com a mesma chave nunca são aplicados os dois.
+        """
+        entrada = {"chave": chave, "desde": self._historico_desde + len(self.game_history)}
+        self.chaves_recentes = (self.chaves_recentes + [entrada])[-MAX_CHAVES_IDEMPOTENCIA:]
+
+    def resposta_repetida(self, chave, enxuta=False):
+        """
+        Resposta para um pedido repetido (mesma chave de uma alteração já
+        aplicada), sem pontuar nem gravar nada: o estado atual (se a partida
+        mudou depois do pedido original, já com essas mudanças) com as jogadas
+        a partir da primeira daquele pedido, marcado com "repetida". Com
+        enxuta (?delta=1), no formato de get_delta, como a resposta original:
+        "versao_base" é a versão atual, então o cliente que ainda não a tem
+        busca a partida. None se a chave não foi vista.
+        """
+        entrada = self._entrada_da_chave(chave)
+        if entrada is None:
+            return None
+        if enxuta:
+            return dict(self.get_delta(), repetida=True)
+        estado = self.get_state()
+        desde = min(entrada["desde"], estado["play_count"])
+        estado["game_history"] = self.carregar_historico(desde)
+        estado["historico_desde"] = desde
+        estado["repetida"] = True
+        return estado
+
+    def atualizacao_desde(self, evento=None):
+        """
+        Estado para quem acompanha a partida ao vivo, que já viu os primeiros
+        'evento' eventos: o documento e as jogadas a partir da primeira que
+        pode ter mudado desde então ("historico_desde", no formato do GET com
+        ?desde=N). Ela sai dos eventos seguintes: cada jogada acrescenta uma e
+        cada desfazer remove a última. Sem evento (ou um que a partida não
+        tem), vai o histórico inteiro.
+        """
+        desde = 0
+        if evento is not None and 0 <= evento <= self.event_count:
+            contagem = desde = self.play_count
+            for registro in reversed(self.store.listar_eventos(self.game_id, evento)):
+                contagem -= {"jogada": 1, "desfazer": -1}.get(registro["tipo"], 0)
+                desde = min(desde, contagem)
+            desde = max(desde, 0)
+        estado = self.get_state()
+        estado["game_history"] = self.carregar_historico(desde)
+        estado["historico_desde"] = desde
+        return estado
+
+    @staticmethod
+    def _jogada_publica(jogada):
+        """Remove da jogada os campos internos de armazenamento."""
+        return {k: v for k, v in jogada.items() if k not in ("seq", "undo")}
+
+    def _carregar_jogada(self, seq):
+        """Lê um único registro de jogada do armazenamento."""
+        return self._decodificar(self.store.carregar_jogada(self.game_id, seq))
+
+    # As jogadas são gravadas no formato compacto (rauberskat_codec) e
+    # decodificadas ao ler: fora do armazenamento, tudo continua igual.
+    def _codificar(self, jogada):
+        return codificar_jogada(jogada, self.player_names)
+
+    def _decodificar(self, registro):
+        return decodificar_jogada(registro, self.player_names)
+
+    def carregar_eventos(self, desde=0):
+        """Retorna os eventos a partir do n-ésimo, com as jogadas decodificadas."""
+        return [self._decodificar_evento(evento) for evento in self.store.listar_eventos(self.game_id, desde)]
+
+    def _decodificar_evento(self, evento):
+        if "dados" in evento:
+            evento["dados"] = self._decodificar(evento["dados"])
+        return evento
+
+    def carregar_historico(self, desde=0):
+        """Retorna as jogadas a partir da sequência 'desde', no formato enviado ao frontend."""
+        jogadas = []
+        if desde < self._historico_desde:
+            jogadas = [self._decodificar(j) for j in self.store.listar_jogadas(self.game_id, desde, self._historico_desde)]
+        jogadas += self.game_history[max(desde - self._historico_desde, 0):]
+        if any("totais" not in jogada for jogada in jogadas):
+            if desde > 0:
+                # Jogadas gravadas antes dos totais: o acumulado vem desde o início
+                return self.carregar_historico(0)[desde:]
+            jogadas = self._preencher_totais(jogadas)
+        return [self._jogada_publica(j) for j in jogadas]
+
+    def _preencher_totais(self, jogadas):
+        """
+        Completa o placar acumulado ("totais") das jogadas gravadas antes dele,
+        somando os resultados desde a primeira jogada da partida.
+        """
+        totais = {nome: 0 for nome in self.player_names}
+        completas = []
+        for jogada in jogadas:
+            if "totais" not in jogada:
+                jogada = dict(jogada, totais=self._somar_resultado(totais, jogada))
+            totais = jogada["totais"]
+            completas.append(jogada)
+        return completas
+
+    def buscar_jogadas(self, cursor=None, limite=50, decrescente=False, jogador=None, jogo=None, round_mode=None):
+        """
+        Uma página do histórico, pelos índices do armazenamento: jogadas a
+        partir da sequência "cursor" (decrescente: do cursor para trás),
+        opcionalmente só de um jogador, de um jogo e/ou de um modo de rodada.
+        Retorna (jogadas, próximo cursor); as jogadas mantêm "seq" e o cursor
+        é None na última página.
+        """
+        filtros = {}
+        if jogador is not None:
+            if jogador not in self.player_names:
+                raise ValueError(f"Jogador '{jogador}' não está na partida.")
+            filtros["jogador"] = [self.player_names.index(jogador), jogador]
+        # Registros compactos guardam o código; os antigos, o nome
+        for coluna, valor, lista in (("jogo", jogo, JOGOS), ("round_mode", round_mode, MODOS)):
+            if valor is not None:
+                filtros[coluna] = ([lista.index(valor)] if valor in lista else []) + [valor]
+
+        fonte = self.store
+        if self._jogadas_gravadas < len(self.game_history):
+            # Partida no formato antigo: o histórico ainda está só no documento
+            fonte = MemoryGameStore()
+            fonte.gravar(self.game_id, jogadas=[self._codificar(dict(jogada, seq=i))
+                                                for i, jogada in enumerate(self.game_history)])
+        # Um registro a mais diz se há próxima página
+        registros = fonte.buscar_jogadas(self.game_id, cursor, limite + 1, decrescente, filtros)
+        proximo = registros.pop()["seq"] if len(registros) > limite else None
+
+        jogadas = [self._decodificar(registro) for registro in registros]
+        if any("totais" not in jogada for jogada in jogadas):
+            historico = self.carregar_historico(0)
+            jogadas = [dict(jogada, totais=historico[jogada["seq"]]["totais"]) if "totais" not in jogada else jogada
+                       for jogada in jogadas]
+        return [{k: v for k, v in jogada.items() if k != "undo"} for jogada in jogadas], proximo
+
+    @staticmethod
+    def _somar_resultado(totais, jogada):
+        """Placar depois da jogada: os pontos vão para o jogador e, no Ramsch, para quem empatou."""
+        totais = dict(totais)
+        pontos = jogada.get("result", {}).get("points", 0)
+        if jogada.get("jogador") in totais:
+            totais[jogada["jogador"]] += pontos
+        if str(jogada.get("jogo", "")).strip().lower() == "ramsch":
+            empates = jogada.get("empates") or []
+            for jogador_empatado in [empates] if isinstance(empates, str) else empates:
+                if jogador_empatado in totais:
+                    totais[jogador_empatado] += pontos
+        return totais
 
     def _save_state(self):
-        """Salva o estado atual da instância da classe de volta no Firestore."""
-        current_state = self.__dict__.copy()
-        # Remove atributos que não devem ser serializados (referência ao DB)
-        del current_state['db']
-        del current_state['game_ref']
-        del current_state['base_scores'] # É constante, não precisa salvar
-        self.game_ref.set(current_state)
+        """
+        Salva o estado atual da instância da classe de volta no armazenamento.
+        Os métodos de regra (check_mode_transition, next_dealer, undo_last_game,
+        processar_decisao_ramsch) só alteram o estado em memória; quem chama
+        decide o momento de gravar, com uma única escrita por requisição.
+        O documento principal recebe só os campos alterados; a escrita
+        completa fica para a migração do formato antigo.
+        A gravação é condicional à versão lida: se outra requisição gravou a
+        partida nesse meio tempo, o armazenamento levanta ConflitoDeVersao e
+        nada é gravado (o chamador recarrega a partida e tenta de novo).
+        Os eventos da requisição vão no mesmo commit, com um checkpoint a
+        cada INTERVALO_CHECKPOINT eventos.
+        """
+        checkpoint = None
+        if self._eventos_novos and (self.checkpoint is None
+                                    or self.event_count - self.checkpoint >= INTERVALO_CHECKPOINT):
+            checkpoint = self._montar_checkpoint()
+            self.checkpoint = checkpoint["n"]
+        estado = self.get_state()
+        if self.chaves_recentes:
+            estado["chaves_recentes"] = self.chaves_recentes
+        novas = range(self._jogadas_gravadas, len(self.game_history))
+        jogadas = [self._codificar(dict(self.game_history[i], seq=self._historico_desde + i)) for i in novas]
+        seqs_novas = {j["seq"] for j in jogadas}
+
+        documento, campos = None, None
+        if self._gravacao_completa:
+            documento = estado
+        else:
+            campos = {k: v for k, v in estado.items()
+                      if k not in self._estado_carregado or self._estado_carregado[k] != v}
+
+        if documento is not None or campos or jogadas or self._jogadas_removidas or self._undo_atualizado:
+            estado["version"] = self.version + 1
+            estado["updated_at"] = _agora_utc()
+            if campos is not None:
+                campos["version"] = estado["version"]
+                campos["updated_at"] = estado["updated_at"]
+            self.store.gravar(self.game_id, documento=documento, campos=campos, jogadas=jogadas,
+                              removidas=sorted(self._jogadas_removidas - seqs_novas),
+                              undos={seq: codificar_delta(delta, self.player_names)
+                                     for seq, delta in self._undo_atualizado.items()},
+                              versao=self.version,
+                              eventos=self._eventos_novos, checkpoint=checkpoint)
+            self.version = estado["version"]
+            self.updated_at = estado["updated_at"]
+
+        self._jogadas_gravadas = len(self.game_history)
+        self._jogadas_removidas = set()
+        self._undo_atualizado = {}
+        self._eventos_novos = []
+        self._estado_carregado = copy.deepcopy(estado)
+        self._gravacao_completa = False
+
+    def processar_jogada(self, dados):
+        """
+        Pipeline completo de uma jogada, todo em memória:
+        calcula a pontuação, verifica a transição de rodada e avança o dealer
+        (a menos que uma decisão de Ramsch esteja pendente).
+        Não grava nada: o chamador faz um único _save_state() ao final.
+        """
+        evento = copy.deepcopy(dados)
+        with medir("pontuacao"):
+            resultado = self.calculate_score(dados)
+        with medir("transicao"):
+            self.check_mode_transition()
+            if not self.awaiting_ramsch_decision:
+                self.next_dealer()
+        self._registrar_evento("jogada", dados=self._codificar(evento))
+        return resultado
+
+    def processar_jogadas(self, jogadas):
+        """
+        Aplica uma lista de jogadas em ordem, cada uma como processar_jogada
+        (mesmas transições de rodada e de dealer). Para na primeira inválida
+        com JogadaInvalida: o estado em memória fica pela metade, então quem
+        chama descarta esta instância (o serializador recarrega a partida).
+        Retorna os resultados de cada jogada.
+        """
+        resultados = []
+        for indice, dados in enumerate(jogadas):
+            try:
+                resultados.append(self.processar_jogada(dados))
+            except Exception as e:
+                raise JogadaInvalida(indice, e) from e
+        return resultados
+
+    # --- Fluxo de eventos ---
+
+    def _registrar_evento(self, tipo, **dados):
+        """Acrescenta um evento ao fluxo da partida; é gravado no próximo _save_state()."""
+        self._eventos_novos.append({"n": self.event_count, "tipo": tipo,
+                                    "em": datetime.datetime.now().isoformat(timespec="seconds"), **dados})
+        self.event_count += 1
+
+    def _aplicar_evento(self, evento):
+        """Reaplica um evento gravado, com as mesmas regras usadas ao vivo."""
+        tipo = evento["tipo"]
+        if tipo == "jogada":
+            self.processar_jogada(copy.deepcopy(evento["dados"]))
+        elif tipo == "decisao_ramsch":
+            self.processar_decisao_ramsch(evento["jogador"], evento["deseja_nova_rodada"],
+                                          evento.get("decisao_em_grupo", False))
+        elif tipo == "desfazer":
+            self.undo_last_game()
+        elif tipo == "encerrar":
+            self.encerrar(evento["finished_at"])
+        else:
+            raise ValueError(f"Evento desconhecido: '{tipo}'.")
+
+    def encerrar(self, quando=None):
+        """
+        Marca a partida como encerrada (uma vez só). Partidas encerradas vão
+        para o arquivo frio na próxima varredura (rauberskat_arquivo.py).
+        """
+        if self.finished_at is None:
+            self.finished_at = quando or _agora_utc()
+            self._registrar_evento("encerrar", finished_at=self.finished_at)
+
+    def _montar_checkpoint(self):
+        """
+        Estado derivado após o último evento, com todas as jogadas vivas (e
+        seus deltas de desfazer): a partir dele, os eventos seguintes podem
+        ser reaplicados sem voltar ao início da partida.
+        """
+        # get_state() antes de codificar as jogadas: ele fecha o delta da
+        # última, e sem ele um desfazer depois do checkpoint não teria efeito
+        estado = self.get_state()
+        jogadas = self.store.listar_jogadas(self.game_id, 0, self._historico_desde)
+        for jogada in jogadas:
+            if jogada["seq"] in self._undo_atualizado:
+                jogada["undo"] = codificar_delta(self._undo_atualizado[jogada["seq"]], self.player_names)
+        jogadas += [self._codificar(dict(jogada, seq=self._historico_desde + i))
+                    for i, jogada in enumerate(self.game_history)]
+        return {"n": self.event_count, "estado": estado, "jogadas": jogadas}
+
+    @classmethod
+    def reconstruir(cls, store, game_id, ate=None):
+        """
+        Reconstrói a partida como estava após os primeiros 'ate' eventos (todos,
+        se None): parte do checkpoint mais recente e reaplica os eventos
+        seguintes. Retorna um Scorekeeper em memória, desligado do armazenamento.
+        """
+        documento = store.carregar_partida(game_id)
+        if not documento:
+            raise ValueError(f"Partida com ID '{game_id}' não encontrada.")
+        if "arquivada" in documento:
+            raise PartidaArquivada(game_id, documento)
+        total = documento.get("event_count", 0)
+        ate = total if ate is None else max(0, min(ate, total))
+        checkpoint = store.carregar_checkpoint(game_id, ate)
+        if checkpoint is None:
+            raise ValueError(f"A partida '{game_id}' não tem checkpoint até o evento {ate}.")
+
+        memoria = MemoryGameStore()
+        # A versão é a do documento lido (a do checkpoint é antiga): é ela que o ETag do GET confere
+        base = dict(checkpoint["estado"], play_count=len(checkpoint["jogadas"]),
+                    event_count=checkpoint["n"], checkpoint=checkpoint["n"], version=documento.get("version", 0))
+        memoria.gravar(game_id, documento=base, jogadas=checkpoint["jogadas"])
+        scorekeeper = cls(memoria, game_id)
+        for evento in store.listar_eventos(game_id, checkpoint["n"], ate):
+            scorekeeper._aplicar_evento(scorekeeper._decodificar_evento(evento))
+        return scorekeeper
+
+    @staticmethod
+    def estado_inicial(nome_jogadores, **detalhes):
+        """Documento inicial de uma partida nova."""
+        return {
+            "player_names": nome_jogadores,
+            "num_players": len(nome_jogadores),
+            "scores": {name: 0 for name in nome_jogadores},
+            "current_mode": "Bock",
+            "dealer_index": 0,
+            "play_count": 0,  # As jogadas ficam em registros próprios no armazenamento
+            "version": 0,
+            "event_count": 0,
+            "checkpoint": 0,  # O checkpoint 0 (estado inicial) é gravado na criação
+            "updated_at": _agora_utc(),
+            "finished_at": None,
+            # Detalhes da partida
+            **{campo: detalhes.get(campo) for campo in CAMPOS_DETALHES},
+            # Outros campos de estado do jogo
+            "bock_rounds_played": 0,
+            "ramsch_rounds_played": 0,
+            "last_game_name": "",
+            "ramsch_losses": {name: 0 for name in nome_jogadores},
+            "ramsch_scores_count": {name: 0 for name in nome_jogadores},
+            "ramsch_ramsch_count": 0,
+            "dealer_turns_count": {name: 0 for name in nome_jogadores},
+            "last_scoring_player": None,
+            "awaiting_ramsch_decision": False,
+            "ramsch_candidates": [],
+            "last_was_bonus": False,
+        }
 
     @staticmethod
-    def iniciar_jogo(db, nome_jogadores):
+    def iniciar_jogo(store, nome_jogadores, **detalhes):
+        """Cria uma partida nova no armazenamento e retorna o seu ID."""
         num_players = len(nome_jogadores)
         if num_players not in [3, 4]:
             raise ValueError("Número de jogadores deve ser 3 ou 4.")
+        estado = RauberskatScorekeeper.estado_inicial(nome_jogadores, **detalhes)
+        game_id = store.criar_partida(estado)
+        store.gravar(game_id, checkpoint={"n": 0, "estado": dict(estado, game_id=game_id), "jogadas": []})
+        return game_id
+
+    @classmethod
+    def nova_partida(cls, store, nome_jogadores, **detalhes):
+        """Cria uma partida nova e retorna o Scorekeeper já carregado."""
+        return cls(store, cls.iniciar_jogo(store, nome_jogadores, **detalhes))
 
     def get_winners(self):
         max_score = max(self.scores.values())
@@ -92,54 +575,92 @@ class RauberskatScorekeeper:
         self.ramsch_ramsch_count = 0
         self.dealer_turns_count = {player: 0 for player in self.player_names}
             
+    def _capturar_estado(self):
+        """Cópia rasa dos campos desfazíveis (todos pequenos: números, nomes e dicts por jogador)."""
+        return {campo: copy.copy(getattr(self, campo, padrao)) for campo, padrao in CAMPOS_DESFAZER.items()}
+
+    @staticmethod
+    def _calcular_delta(antes, depois):
+        """
+        Monta a entrada do diário com os valores de 'antes' que diferem de 'depois'.
+        Dicts por jogador com as mesmas chaves guardam só as chaves alteradas.
+        """
+        delta = {"campos": {}, "chaves": {}}
+        for campo, valor_antes in antes.items():
+            valor_depois = depois.get(campo)
+            if valor_antes == valor_depois:
+                continue
+            if isinstance(valor_antes, dict) and isinstance(valor_depois, dict) and valor_antes.keys() == valor_depois.keys():
+                delta["chaves"][campo] = {k: v for k, v in valor_antes.items() if valor_depois[k] != v}
+            else:
+                delta["campos"][campo] = valor_antes
+        return delta
+
+    def _migrar_previous_states(self, previous_states):
+        """Converte os snapshots completos do formato antigo em entradas de delta."""
+        journal = []
+        depois = self._capturar_estado()
+        historico_depois = len(self.game_history)
+        for snapshot in reversed(previous_states):
+            antes = {campo: snapshot.get(campo, padrao) for campo, padrao in CAMPOS_DESFAZER.items()}
+            historico_antes = len(snapshot.get("game_history", []))
+            entrada = self._calcular_delta(antes, depois)
+            entrada["jogadas"] = max(historico_depois - historico_antes, 0)
+            journal.append(entrada)
+            depois, historico_depois = antes, historico_antes
+        journal.reverse()
+        return journal
+
     def save_previous_state(self):
-        state = {
-            "scores": self.scores.copy(),
-            "current_mode": self.current_mode,
-            "bock_rounds_played": self.bock_rounds_played,
-            "ramsch_rounds_played": self.ramsch_rounds_played,
-            "last_game_name": self.last_game_name,
-            "last_scoring_player": self.last_scoring_player,
-            "dealer_index": self.dealer_index,
-            "awaiting_ramsch_decision": self.awaiting_ramsch_decision,
-            "ramsch_candidates": self.ramsch_candidates.copy(),
-            "ramsch_losses": self.ramsch_losses.copy(),
-            "ramsch_scores_count": self.ramsch_scores_count.copy(),
-            "ramsch_ramsch_count": self.ramsch_ramsch_count,
-            "dealer_turns_count": self.dealer_turns_count.copy(),
-            "bonus_turns": getattr(self, "bonus_turns", 0),
-            "last_was_bonus": getattr(self, "last_was_bonus", False),
-            "game_history": self.game_history.copy(),  # Salva histórico            
-        }
-        self.previous_states.append(state)
+        """
+        Marca o início de uma jogada. O delta só é calculado quando a jogada
+        termina (transição de rodada e dealer incluídos), em _fechar_delta().
+        """
+        self._fechar_delta()
+        self._estado_antes = self._capturar_estado()
+        self._historico_antes = len(self.game_history)
+
+    def _fechar_delta(self):
+        """Prende à jogada em andamento, se houver, o delta para desfazê-la."""
+        if self._estado_antes is None:
+            return
+        if len(self.game_history) == self._historico_antes + 1:
+            self.game_history[-1]["undo"] = self._calcular_delta(self._estado_antes, self._capturar_estado())
+        self._estado_antes = None
+
+    def _aplicar_delta(self, entrada):
+        """Aplica o inverso de um delta de desfazer (restaura os valores anteriores)."""
+        for campo, valor in entrada.get("campos", {}).items():
+            setattr(self, campo, valor)
+        for campo, valores in entrada.get("chaves", {}).items():
+            getattr(self, campo).update(valores)
 
     def undo_last_game(self):
-        if not self.previous_states:
+        self._fechar_delta()
+        if self.game_history:
+            jogada = self.game_history[-1]
+        elif self._historico_desde > 0:
+            jogada = self._carregar_jogada(self._historico_desde - 1)
+        else:
+            jogada = None
+        if not jogada or "undo" not in jogada:
             print("❌ Não há jogos para desfazer!")            
             return False
-        
-        last_state = self.previous_states.pop()
-
-        self.scores = last_state["scores"]
-        self.current_mode = last_state["current_mode"]
-        self.bock_rounds_played = last_state["bock_rounds_played"]
-        self.ramsch_rounds_played = last_state["ramsch_rounds_played"]
-        self.last_game_name = last_state["last_game_name"]
-        self.last_scoring_player = last_state["last_scoring_player"]
-        self.dealer_index = last_state["dealer_index"]
-        self.awaiting_ramsch_decision = last_state.get("awaiting_ramsch_decision", False)
-        self.ramsch_candidates = last_state.get("ramsch_candidates", [])
-        self.ramsch_losses = last_state.get("ramsch_losses", {})
-        self.ramsch_scores_count = last_state.get("ramsch_scores_count", {})
-        self.ramsch_ramsch_count = last_state.get("ramsch_ramsch_count", 0)
-        self.dealer_turns_count = last_state.get("dealer_turns_count", {})
-        self.bonus_turns = last_state.get("bonus_turns", 0)
-        self.last_was_bonus = last_state.get("last_was_bonus", False)
-        self.game_history = last_state.get("game_history", [])  # Restaura histórico
+
+        if self.game_history:
+            self.game_history.pop()
+            if self._jogadas_gravadas > len(self.game_history):
+                self._jogadas_gravadas -= 1
+                self._jogadas_removidas.add(self._historico_desde + len(self.game_history))
+        else:
+            self._historico_desde -= 1
+            self._jogadas_removidas.add(self._historico_desde)
+        self._undo_atualizado.pop(self._historico_desde + len(self.game_history), None)
+        self._aplicar_delta(jogada["undo"])
+        self._registrar_evento("desfazer")
 
         print("↩️  JOGO DESFEITO! Estado anterior restaurado.")
         self.display_scoreboard() # Mostra placar após desfazer
-        self._save_state() # Salva o estado restaurado no DB
         return True
 
     def add_empate(self, jogador_que_empatou, jogador_principal):
@@ -158,10 +679,6 @@ class RauberskatScorekeeper:
     def calculate_score(self, dados):
         jogador_nome = dados.get("jogador")
         game_name = dados.get("jogo", "").lower().strip()
-        pontos = 0
-        multiplicador = 1
-        base_score = 0
-        fator_total = 1
 
         print(f"🎯 Dealer: {self.get_current_dealer()}")
         print(f"🔄 Rodada: {self.current_mode}")
@@ -174,76 +691,39 @@ class RauberskatScorekeeper:
             self.game_history.append({"erro": "Nenhum dado recebido para calcular pontuação."})
             self.save_previous_state() # Salva o estado mesmo em erro para poder desfazer.
             raise ValueError("Nenhum dado recebido para calcular pontuação.")
-        
-        # Jogos Ouros, Copas, Espadas, Paus, Grand
-        kontra = dados.get("kontra", False)
-        reh = dados.get("reh", False)
-        bock = dados.get("bock", False)
-        rursch = dados.get("rursch", False)
-        is_hand = dados.get("hand", False)
-        jogador_perdedor = dados.get("perdeu", False)
-
-        multiplicadores = 1
-        if kontra:
-            multiplicadores *= 2
-        if reh:
-            multiplicadores *= 2
-
-        # Bock (independente do Bock declarado)
-        if self.current_mode == "Bock":
-            multiplicadores *= 2
-        
+
         # O estado é carregado na inicialização.
         # A lógica de salvar o estado anterior agora é feita dentro do calculate_score
         # e o estado final é salvo no final do método.
         self.save_previous_state()
 
-        jogador_nome = dados.get("jogador")
         if jogador_nome not in self.scores:
             raise ValueError(f"Jogador '{jogador_nome}' não encontrado nos jogadores cadastrados.")
 
-        player_index = self.player_names.index(jogador_nome)
         game_name = str(dados.get("jogo", "")).strip().lower()
-        
+
+        # As regras estão pré-calculadas em rauberskat_pontuacao.TABELA: aqui só
+        # validamos o payload, montamos a chave e aplicamos o resultado ao estado.
+
         # RAMSCH - Tratamento especial
-        if game_name == "ramsch":           
-            info = dados.get("info", {})
-            skat_empurrado = info.get("skat_empurrado", 0)
-            multiplicador = 2 ** skat_empurrado  # 0 → 1, 1 → 2, 2 → 4, 3 → 8
-            
+        if game_name == "ramsch":
+            skat_empurrado = dados.get("info", {}).get("skat_empurrado", 0)
+            chave = chave_jogada(game_name, self.current_mode, dados, skat_empurrado=skat_empurrado)
+            _, multiplicadores_totais, por_ponto = pontuar(chave)
+
             try:
-                pontos_ramsch = int(dados.get("pontos_ramsch", 0))
+                pontos_inseridos = int(dados.get("pontos_ramsch", 0))
             except ValueError:
-                pontos_ramsch = 0
-            
-            #Armazenar os pontos inseridos para exibição
-            pontos_inseridos = pontos_ramsch
-
-            jungfrau = dados.get("jungfrau", False)
+                pontos_inseridos = 0
+            pontos_ramsch = pontos_inseridos * por_ponto  # Sempre negativo
 
             print(f"   📝 Pontos inseridos: {pontos_inseridos}")
-            print(f"   📤 Skat empurrado: {skat_empurrado}x (multiplicador: {multiplicador})")            
-
-            # Calcular os multiplicadores totais para exibição
-            multiplicadores_totais = multiplicador  # Skat empurrado
-            if jungfrau:
-                pontos_ramsch *= 2
-                multiplicadores_totais *= 2
-                print("   👩 Jüngfrau (x2)")
-
-            if self.current_mode == "Bock":
-                pontos_ramsch *= 2
-                multiplicadores_totais *= 2
-                print("   🔥 Bock ativo (x2)")                
-
-            pontos_ramsch *= multiplicador #Quantidade de vezes que o skat foi empurrado
-            pontos_ramsch *= -1  # Sempre negativo
-
-            self.scores[jogador_nome] += pontos_ramsch
-
+            print(f"   📤 Skat empurrado: {skat_empurrado}x")
             print(f"   🔢 Multiplicadores: {multiplicadores_totais}")
             print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos_ramsch}")
 
+            self.scores[jogador_nome] += pontos_ramsch
+
             # Incrementa contador de derrotas para o jogador principal
             self.ramsch_scores_count[jogador_nome] = self.ramsch_scores_count.get(jogador_nome, 0) + 1
 
@@ -260,10 +740,10 @@ class RauberskatScorekeeper:
                         self.scores[jogador_empatado] = pontos_ramsch
                     else:
                         self.scores[jogador_empatado] += pontos_ramsch
-                    
+
                     # Incrementa contador de derrotas para quem empatou também
                     self.ramsch_scores_count[jogador_empatado] = self.ramsch_scores_count.get(jogador_empatado, 0) + 1
-                    
+
                     print(f"   🤝 Empate aplicado para {jogador_empatado}: {pontos_ramsch}")
 
             self.last_game_name = "ramsch"
@@ -272,338 +752,109 @@ class RauberskatScorekeeper:
             self.display_scoreboard()
 
             # Salva o resultado no histórico
-            log_entry = dados.copy()
-            log_entry['round_mode'] = self.current_mode
-            log_entry['dealer'] = self.get_current_dealer() # Add Dealer
-            log_entry['result'] = {'points': pontos_ramsch, 'total_factor': multiplicadores_totais, 'base_score': pontos_inseridos}
-            self.game_history.append(log_entry)
+            self._registrar_jogada(dados, pontos_ramsch, multiplicadores_totais, pontos_inseridos, dealer=True)
 
             # Retornar os valores para o frontend (pontos_ramsch já é negativo)
             return pontos_ramsch, multiplicadores_totais, pontos_inseridos
-        
-        if game_name == "durchmarsch":          
-            try:
-                base_score = 120
-                info = dados.get("info", {})
-                skat_empurrado = info.get("skat_empurrado", 0)  # default 0 se não existir
-
-                if self.current_mode == "Ramsch":
-                    multiplicador = 2 ** skat_empurrado
-                else:
-                    multiplicador = skat_empurrado if skat_empurrado > 0 else 1
-
-                pontos = base_score * multiplicador
-
-                print(f"   📝 Pontos base: {base_score}")
-                print(f"   📤 Skat empurrado: {skat_empurrado} (multiplicador: {multiplicador})")
-
-                # Aplicar Bock se estiver em Bock
-                if self.current_mode == "Bock":
-                    multiplicador *= 2 # Atualiza o multiplicador total
-                    print("   🔥 Bock ativo (x2)")
-                
-                pontos = base_score * multiplicador
-                self.scores[jogador_nome] += pontos
-
-                print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos}")
-
-                self.last_game_name = "durchmarsch"
-                self.last_scoring_player = jogador_nome
-                self.last_was_bonus = False
-                self.display_scoreboard()
 
-                # Salva o resultado no histórico
-                log_entry = dados.copy()
-                log_entry['round_mode'] = self.current_mode
-                log_entry['result'] = {'points': pontos, 'total_factor': multiplicador, 'base_score': base_score}
-                self.game_history.append(log_entry)
-
-                return pontos, multiplicador, base_score
-            # O estado final será salvo no final do método calculate_score
-            
+        if game_name == "durchmarsch":
+            try:
+                skat_empurrado = dados.get("info", {}).get("skat_empurrado", 0)  # default 0 se não existir
+                base_score, multiplicador, pontos = pontuar(
+                    chave_jogada(game_name, self.current_mode, dados, skat_empurrado=skat_empurrado))
+                print(f"   📤 Skat empurrado: {skat_empurrado}")
             except Exception as e:
                 print(f"[ERROR] Erro no cálculo do Durchmarsch: {e}")
                 # Em caso de erro, definir valores padrão
-                base_score = 120
-                multiplicador = 1
-                pontos = base_score
-                
-                self.scores[jogador_nome] += pontos
-                self.last_game_name = "durchmarsch"
-                self.last_scoring_player = jogador_nome
-                self.last_was_bonus = False
-                self.display_scoreboard()
+                base_score, multiplicador, pontos = 120, 1, 120
 
-                # Salva o resultado no histórico
-                log_entry = dados.copy()
-                log_entry['round_mode'] = self.current_mode
-                log_entry['result'] = {'points': pontos, 'total_factor': multiplicador, 'base_score': base_score}
-                self.game_history.append(log_entry)
-                
-                return pontos, multiplicador, base_score
-            # O estado final será salvo no final do método calculate_score
+            print(f"   📝 Pontos base: {base_score}")
+            print(f"   🔢 Multiplicadores: {multiplicador}")
+            print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos}")
 
-        # Jogos Ouros, Copas, Espadas, Paus, Grand
-        com_sem = dados.get("com_sem")
-        schneider = dados.get("schneider", False)
-        schneider_announced = dados.get("schneider_anunciado", False)
-        schwarz = dados.get("schwartz", False)
-        schwarz_announced = dados.get("schwartz_anunciado", False)
-        is_ouvert = dados.get("ouvert", False)
-
-        if game_name == "grand" and is_ouvert:
-            base_score = 36
-        else:
-            base_score = self.base_scores.get(game_name, 0)
-
-        # Tratamento especial para jogos NULL
-        if game_name in ["null", "null revolution"]:
-            if game_name == "null revolution":
-                base_score = 92
-                game_type_log = "NULL REVOLUTION"
-                print(f"   🎯 Tipo: {game_type_log}")
-            else: # Jogo "null" normal
-                is_hand = dados.get("hand", False)
-                is_ouvert = dados.get("ouvert", False)
-            # Definir pontuação base correta para Null
-                if is_hand and is_ouvert:
-                    base_score = 59
-                    game_type_log = "NULL HAND OUVERT"
-                    print(f"   🎯 Tipo: {game_type_log}")
-                elif is_hand:
-                    base_score = 35
-                    game_type_log = "NULL HAND"
-                    print(f"   🎯 Tipo: {game_type_log}")
-                elif is_ouvert:
-                    base_score = 46
-                    game_type_log = "NULL OUVERT"
-                    print(f"   🎯 Tipo: {game_type_log}")
-                else:
-                    base_score = 23
-                    game_type_log = "NULL"
-                    print(f"   🎯 Tipo: {game_type_log}")
-
-            # Multiplicadores aplicáveis (Kontra, Reh, Rursch, Bock)
-            multiplicador = 1
-            if dados.get("kontra", False): 
-                multiplicador *= 2
-                print("   ⚔️  KONTRA!")
-            if dados.get("reh", False): 
-                multiplicador *= 2
-                print("   🔥 REH!")
-            if dados.get("bock", False):
-                multiplicador *= 2
-                print("   💥 BOCK!")
-            if dados.get("rursch", False):
-                multiplicador *= 2
-                print("   🌪️  RURSCH!")
-
-            #Multiplicação pela rodada de Bock
-            if self.current_mode == "Bock":
-                multiplicador *= 2
-                print("   🔥 Bock ativo (x2)")
-
-            # Se o jogador perdeu, a pontuação vira negativa
-            if jogador_perdedor:
-                is_hand = dados.get("hand", False) # Precisamos verificar o hand aqui também
-                if is_hand:
-                    multiplicador *= -1 #Se perdeu com Hand, multiplica por -1
-                    print("   ❌ PERDEU (Hand: x-1)")
-                else:
-                    multiplicador *= -2 #Se perdeu sem Hand, multiplica por -2
-                    print("   ❌ PERDEU (Sem Hand: x-2)")
-            else:
-                print("   ✅ GANHOU!")
+            self.scores[jogador_nome] += pontos
+            self.last_game_name = "durchmarsch"
+            self.last_scoring_player = jogador_nome
+            self.last_was_bonus = False
+            self.display_scoreboard()
 
-            pontos = base_score * multiplicador
+            # Salva o resultado no histórico
+            self._registrar_jogada(dados, pontos, multiplicador, base_score)
 
+            return pontos, multiplicador, base_score
+            # O estado final será salvo no final do método calculate_score
+
+        # Tratamento especial para jogos NULL (a base depende de Hand/Ouvert)
+        if game_name in JOGOS_NULL:
+            game_type_log = tipo_null(game_name, dados.get("hand", False), dados.get("ouvert", False))
+            base_score, multiplicador, pontos = pontuar(chave_jogada(game_name, self.current_mode, dados))
+
+            print(f"   🎯 Tipo: {game_type_log}")
             print(f"   🔢 Multiplicadores: {multiplicador}")
-            print(f"   📝 Pontos base: {base_score}")                         
+            print(f"   📝 Pontos base: {base_score}")
+            print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos}")
 
             self.scores[jogador_nome] += pontos
-            print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos}")
 
             self.last_game_name = "null"
             self.last_scoring_player = jogador_nome
             self.display_scoreboard()
 
-            # Salva o resultado no histórico
-            log_entry = dados.copy()
-            log_entry['game_type_log'] = game_type_log # Salva o tipo específico de Null
-            log_entry['round_mode'] = self.current_mode
-            log_entry['result'] = {'points': pontos, 'total_factor': multiplicador, 'base_score': base_score}
-            self.game_history.append(log_entry)
-            
-            return pontos, multiplicador, base_score
-        # O estado final será salvo no final do método calculate_score
-        
-        if game_name == "grand hand":
-            # Ajustes especiais para Grand Hand
-            base_score = 24  # Base de Grand normal
-            is_hand = True  # Sempre Hand
-            is_ouvert = dados.get("ouvert", False)  # Ouvert ainda pode ser perguntado
-            jogador_perdedor = dados.get("perdeu", False)
+            # Salva o resultado no histórico, com o tipo específico de Null
+            self._registrar_jogada(dados, pontos, multiplicador, base_score, game_type_log=game_type_log)
 
-            if is_ouvert:
-                base_score = 36  # Se foi Ouvert, base é 36
-                print("   🎯 GRAND HAND OUVERT")
+            return pontos, multiplicador, base_score
 
+        if game_name == "grand hand":
+            # Hand automático; Bock da rodada não conta e a derrota é só x-1
             try:
                 com_sem = int(dados.get("com_sem", 1))
             except (TypeError, ValueError):
                 com_sem = 1
-
-            factor = com_sem + 1 #Exemplo com_sem = 1 - Factor 2
-            factor += 1 #Hand automático
+            base_score, fator_total, pontos = pontuar(
+                chave_jogada(game_name, self.current_mode, dados, com_sem=com_sem))
 
             print(f"   📝 Com/Sem: {com_sem}")
-            print(f"   ✋ Hand automático (+1)")
-
-            # Adicionar fatores de Schneider e Schwarz
-            if dados.get("schneider", False):
-                factor += 1
-                print("   🎯 Schneider (+1)")
-            if dados.get("schneider_anunciado", False):
-                factor += 1
-                print("   📢 Schneider anunciado (+1)")
-            if dados.get("schwartz", False):
-                factor += 1
-                print("   ⚫ Schwarz (+1)")
-            if dados.get("schwartz_anunciado", False):
-                factor += 1
-                print("   📢 Schwarz anunciado (+1)")
-
-            multiplicadores = 1
-            if dados.get("kontra", False): 
-                multiplicadores *= 2
-                print("   ⚔️  KONTRA!")
-            if dados.get("reh", False): 
-                multiplicadores *= 2
-                print("   🔥 REH!")
-            if dados.get("bock", False): 
-                multiplicadores *= 2 # Bock declarado
-                print("   💥 BOCK (declarado)!")
-            if dados.get("rursch", False): 
-                multiplicadores *= 2
-                print("   🌪️  RURSCH!")
-
-            # Cálculo final
-            pontos = base_score * factor * multiplicadores
-            fator_total = factor * multiplicadores
-
-            # Se perdeu, multiplica apenas por -1 (nunca -2 para Grand Hand)
-            if jogador_perdedor:
-                pontos *= -1
-                fator_total *= -1 # Aplica a penalidade ao fator total também
-                print("   ❌ PERDEU (x-1)")
-            else:
-                print("   ✅ GANHOU!")
             print(f"   📝 Pontos base: {base_score}")
+            print(f"   🔢 Fator Total: {fator_total}")
+            print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos}")
 
             self.scores[jogador_nome] += pontos
 
-            print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos}")
-
             self.last_game_name = "grand hand"
             self.last_scoring_player = jogador_nome
             self.last_was_bonus = True #Garante que o contador de rodada de Ramsch não avance
             # Se for Grand Hand durante uma rodada de Ramsch, o dealer não muda.
             if self.current_mode == "Ramsch":
                 print("Grand Hand em rodada de Ramsch. Dealer não avança.")
-                self.last_was_bonus = True
 
             # Salva o resultado no histórico
-            log_entry = dados.copy()
-            log_entry['round_mode'] = self.current_mode
-            log_entry['result'] = {'points': pontos, 'total_factor': fator_total, 'base_score': base_score}
-            self.game_history.append(log_entry)
+            self._registrar_jogada(dados, pontos, fator_total, base_score)
 
             self.display_scoreboard()
-            
-            return pontos, fator_total, base_score
-        # O estado final será salvo no final do método calculate_score
-
-        else:
-            # Validação para jogos que exigem 'com_sem'
-            if not com_sem:
-                raise ValueError("Para este tipo de jogo, o valor 'Com ou Sem' é obrigatório.")
-
-            try:
-                factor = int(com_sem) + 1
-            except (TypeError, ValueError):
-                factor = 1
-
-        print(f"   📝 Com/Sem: {com_sem} (fator base: {factor})")
-
-        if is_hand:
-            factor += 1
-            print("   ✋ Hand (+1)")
-
-        if is_ouvert and game_name != "grand":
-            factor += 1
-            print("   👁️  Ouvert (+1)")
-        elif is_ouvert and game_name == "grand":
-            print("   👁️  grand ouvert: Apenas base muda para 36 (sem +1 no fator).")
-
-        if schneider:
-            factor += 1
-            print("   🎯 Schneider (+1)")
-
-        if schneider_announced:
-            factor += 1
-            print("   📢 Schneider anunciado (+1)")
 
-        if schwarz:
-            factor += 1
-            print("   ⚫ Schwarz (+1)")
+            return pontos, fator_total, base_score
 
-        if schwarz_announced:
-            factor += 1
-            print("   📢 Schwarz anunciado (+1)")
-        
-        # APLICANDO A NOVA LÓGICA DE CÁLCULO SEQUENCIAL
-        # Os multiplicadores agora afetam o 'factor' diretamente em cadeia.
-        if kontra:
-            factor *= 2
-            print("   ⚔️  KONTRA!")
-        if reh:
-            factor *= 2
-            print("   🔥 REH!")
-        if bock:
-            factor *= 2
-            print("   💥 BOCK!")
-        if rursch:
-            factor *= 2
-            print("   🌪️  RURSCH!")
-
-        # Bock (independente do Bock declarado)
-        if self.current_mode == "Bock":
-            factor *= 2
-            print("   🔥 Bock ativo (x2)")
-
-        # Se o jogador perdeu, aplicamos o fator negativo
-        if jogador_perdedor:
-            if is_hand:
-                factor *= -1
-                print("   ❌ PERDEU (Hand: x-1)")                
-            else:
-                factor *= -2
-                print("   ❌ PERDEU (Sem Hand: x-2)")
-        else:
-            print("   ✅ GANHOU!")
+        # Jogos Ouros, Copas, Espadas, Paus, Grand
+        # Validação para jogos que exigem 'com_sem'
+        com_sem = dados.get("com_sem")
+        if not com_sem:
+            raise ValueError("Para este tipo de jogo, o valor 'Com ou Sem' é obrigatório.")
 
-        # O fator total agora é o próprio 'factor' após todas as operações
-        fator_total = factor
-        pontos = base_score * fator_total
+        try:
+            com_sem = int(com_sem)
+        except (TypeError, ValueError):
+            com_sem = 0  # Fator base 1
+        base_score, fator_total, pontos = pontuar(chave_jogada(game_name, self.current_mode, dados, com_sem=com_sem))
 
+        print(f"   📝 Com/Sem: {com_sem}")
         print(f"   📝 Pontos base: {base_score}")
-        print(f"   🔢 Fator Total: {fator_total}")        
+        print(f"   🔢 Fator Total: {fator_total}")
+        print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos}")
 
         # Salva nos scores
         self.scores[jogador_nome] += pontos
 
-        print(f"   ➡️  Pontos finais para {jogador_nome}: {pontos}")
-
         # Marcar jogo como último jogado
         self.last_game_name = game_name
         self.last_scoring_player = jogador_nome
@@ -611,15 +862,24 @@ class RauberskatScorekeeper:
         self.display_scoreboard()
 
         # Salva o resultado no histórico para jogos normais
+        self._registrar_jogada(dados, pontos, fator_total, base_score, dealer=True)
+
+        # Retornar valores finais ao frontend
+        return pontos, fator_total, base_score
+
+    def _registrar_jogada(self, dados, pontos, fator_total, base_score, dealer=False, game_type_log=None):
+        """Acrescenta a jogada ao histórico: payload, rodada, (dealer), resultado e placar acumulado."""
         log_entry = dados.copy()
+        if game_type_log is not None:
+            log_entry['game_type_log'] = game_type_log
         log_entry['round_mode'] = self.current_mode
-        log_entry['dealer'] = self.get_current_dealer() # Add Dealer
+        if dealer:
+            log_entry['dealer'] = self.get_current_dealer()
         log_entry['result'] = {'points': pontos, 'total_factor': fator_total, 'base_score': base_score}
+        # Placar de todos depois da jogada: os clientes desenham a linha sem somar o histórico
+        log_entry['totais'] = dict(self.scores)
         self.game_history.append(log_entry)
 
-        # Retornar valores finais ao frontend
-        return pontos, fator_total, base_score
-
     def apply_empates(self, dados, pontos_ramsch):
         """
         Atualiza o placar dos jogadores que empataram no Ramsch.
@@ -768,11 +1028,49 @@ class RauberskatScorekeeper:
             
             if getattr(self, 'last_was_bonus', False):
                 self.last_was_bonus = False
-        self._save_state() # Salva o estado após a transição
 
     def processar_decisao_ramsch(self, jogador, deseja_nova_rodada, decisao_em_grupo=False):
         if not self.awaiting_ramsch_decision or not self.ramsch_candidates:
             return  # Não está aguardando decisão
+        self._registrar_evento("decisao_ramsch", jogador=jogador, deseja_nova_rodada=deseja_nova_rodada,
+                               decisao_em_grupo=decisao_em_grupo)
+
+        # A decisão faz parte da última jogada: desfazê-la também desfaz a decisão.
+        antes = self._capturar_estado() if self._estado_antes is None else None
+        try:
+            with medir("transicao"):
+                self._decidir_ramsch(jogador, deseja_nova_rodada, decisao_em_grupo)
+        finally:
+            if antes is not None:
+                self._mesclar_no_ultimo_delta(antes)
+
+    def _mesclar_no_ultimo_delta(self, antes):
+        """Estende o delta da última jogada para cobrir alterações feitas depois dela."""
+        if self.game_history:
+            ultima = self.game_history[-1].get("undo")
+        elif self._historico_desde > 0:
+            seq = self._historico_desde - 1
+            jogada = self._carregar_jogada(seq) or {}
+            ultima = jogada.get("undo")
+            if ultima is not None:
+                # Só o delta do registro é regravado, junto com o estado
+                self._undo_atualizado[seq] = ultima
+        else:
+            ultima = None
+        if ultima is None:
+            return
+        depois = self._capturar_estado()
+        for campo, valor in antes.items():
+            if valor == depois[campo] or campo in ultima["campos"]:
+                continue  # Sem mudança, ou a entrada já guarda o valor de antes da jogada
+            if campo in ultima["chaves"]:
+                valor = dict(valor)
+                valor.update(ultima["chaves"].pop(campo))
+            parcial = self._calcular_delta({campo: valor}, {campo: depois[campo]})
+            ultima["campos"].update(parcial["campos"])
+            ultima["chaves"].update(parcial["chaves"])
+
+    def _decidir_ramsch(self, jogador, deseja_nova_rodada, decisao_em_grupo):
 
         if not deseja_nova_rodada:
             # Se qualquer jogador recusar, a rodada de Bock começa imediatamente.
@@ -785,7 +1083,6 @@ class RauberskatScorekeeper:
             self._reset_to_bock_round()
             self.awaiting_ramsch_decision = False
             self.ramsch_candidates = []
-            self._save_state() # Salva a mudança para Bock
             return
 
         # Decisão em grupo (Atomicidade) - Se todos aceitaram via flag ou jogador especial
@@ -811,7 +1108,6 @@ class RauberskatScorekeeper:
             self.ramsch_scores_count = {p: 0 for p in self.scores.keys()}
             self.dealer_turns_count = {p: 0 for p in self.scores.keys()} # Zera também o contador de turnos de dealer
             self.awaiting_ramsch_decision = False
-            self._save_state() # Salva o reinício da rodada Ramsch
 
     def _reset_to_bock_round(self):
         self.current_mode = "Bock"
@@ -846,7 +1142,6 @@ class RauberskatScorekeeper:
 
             self.dealer_index = (self.dealer_index + 1) % len(self.scores)
             print(f"Novo dealer: {self.player_names[self.dealer_index]}")
-        self._save_state() # Adicionado para garantir que a mudança do dealer seja salva no DB
         #Se o jogo atual não for Grand Hand, resetar last_game_name
         if self.last_game_name != "grand hand":
             self.last_game_name = ""
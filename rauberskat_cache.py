@@ -0,0 +1,224 @@
+import copy
+import threading
+import collections
+
+from rauberskat_storage import GameStore, MemoryGameStore, _tamanho
+
+# Limites padrão do cache (RAUBERSKAT_CACHE e RAUBERSKAT_CACHE_MB na API)
+MAX_PARTIDAS = 256
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class _Entrada:
+    """Uma partida no cache: versão, tamanho estimado e se todas as jogadas já estão em memória."""
+
+    def __init__(self, versao, bytes_documento):
+        self.versao = versao
+        self.bytes_documento = bytes_documento
+        self.bytes_jogadas = 0
+        self._tamanhos = {}  # seq -> bytes
+        self.jogadas_completas = False
+
+    @property
+    def bytes(self):
+        return self.bytes_documento + self.bytes_jogadas
+
+    def guardar_jogada(self, jogada):
+        self.remover_jogada(jogada["seq"])
+        self._tamanhos[jogada["seq"]] = _tamanho(jogada)
+        self.bytes_jogadas += self._tamanhos[jogada["seq"]]
+
+    def remover_jogada(self, seq):
+        self.bytes_jogadas -= self._tamanhos.pop(seq, 0)
+
+
+class CacheDePartidas(GameStore):
+    """
+    Cache LRU de partidas na frente de outro armazenamento (Firestore/SQLite).
+
+    Guarda o documento e as jogadas das partidas usadas por último, limitado
+    por quantidade de partidas e por bytes (JSON compacto). Cada gravação
+    bem-sucedida é aplicada também à cópia em cache, então o worker que
+    gravou continua acertando nas leituras seguintes.
+
+    Com vários workers, outro processo pode ter gravado a partida:
+    - leituras (GET) conferem antes só a versão do documento, que é bem
+      mais barato que o documento inteiro mais as jogadas (o GET com ETag
+      já a leu e a entrega em conferida());
+    - alterações (sem_validacao(), usado pelo serializador) nem isso: a
+      gravação já é condicional à versão, e um ConflitoDeVersao descarta a
+      partida do cache, então a nova tentativa lê do armazenamento. A
+      exceção é o desfazer, que não pode ser repetido depois de um
+      conflito: o serializador usa para ele a visão que confere a versão.
+    """
+
+    def __init__(self, store, max_partidas=MAX_PARTIDAS, max_bytes=MAX_BYTES):
+        self.store = store
+        self.max_partidas = max_partidas
+        self.max_bytes = max_bytes
+        self.validar = True
+        self._versoes = {}  # game_id -> versão já lida pelo chamador (visão conferida())
+        self._memoria = MemoryGameStore()
+        self._entradas = collections.OrderedDict()  # game_id -> _Entrada, da menos para a mais recente
+        self._lock = threading.Lock()
+        self._contadores = {"acertos": 0, "faltas": 0, "invalidacoes": 0, "descartes": 0}
+
+    def sem_validacao(self):
+        """Mesmo cache, sem conferir a versão antes de usar a cópia (caminho das alterações)."""
+        visao = copy.copy(self)
+        visao.validar = False
+        return visao
+
+    def conferida(self, game_id, versao):
+        """
+        Mesmo cache, validando a partida pela versão que o chamador acabou de
+        ler (GET com ETag): um acerto não lê a versão de novo.
+        """
+        visao = copy.copy(self)
+        visao._versoes = {game_id: versao}
+        return visao
+
+    def estatisticas(self):
+        """Contadores de acertos e faltas, e a ocupação atual."""
+        with self._lock:
+            return dict(self._contadores, partidas=len(self._entradas),
+                        bytes=sum(entrada.bytes for entrada in self._entradas.values()),
+                        max_partidas=self.max_partidas, max_bytes=self.max_bytes)
+
+    # --- Controle das entradas ---
+
+    def _descartar(self, game_id, contador="invalidacoes"):
+        with self._lock:
+            if self._entradas.pop(game_id, None) is not None:
+                self._contadores[contador] += 1
+            self._memoria.descartar(game_id)
+
+    def _reduzir(self):
+        """Remove as partidas usadas há mais tempo até caber nos limites (com o lock)."""
+        while self._entradas and (len(self._entradas) > self.max_partidas
+                                  or sum(entrada.bytes for entrada in self._entradas.values()) > self.max_bytes):
+            game_id, _ = self._entradas.popitem(last=False)
+            self._memoria.descartar(game_id)
+            self._contadores["descartes"] += 1
+
+    def _entrada_valida(self, game_id):
+        """Entrada da partida, se existir e (validando) ainda estiver na versão do armazenamento."""
+        with self._lock:
+            entrada = self._entradas.get(game_id)
+        if entrada is None:
+            return None
+        if self.validar:
+            atual = self._versoes[game_id] if game_id in self._versoes else self.store.carregar_versao(game_id)
+            if atual != entrada.versao:
+                self._descartar(game_id)
+                return None
+        with self._lock:
+            if self._entradas.get(game_id) is not entrada:
+                return None
+            self._entradas.move_to_end(game_id)
+        return entrada
+
+    # --- GameStore ---
+
+    def criar_partida(self, estado):
+        return self.store.criar_partida(estado)
+
+    def carregar_partida(self, game_id):
+        if self._entrada_valida(game_id) is not None:
+            documento = self._memoria.carregar_partida(game_id)
+            if documento is not None:
+                with self._lock:
+                    self._contadores["acertos"] += 1
+                return documento
+        with self._lock:
+            self._contadores["faltas"] += 1
+        documento = self.store.carregar_partida(game_id)
+        if documento is not None:
+            with self._lock:
+                self._memoria.descartar(game_id)
+                self._memoria.gravar(game_id, documento=documento)
+                self._entradas[game_id] = _Entrada(documento.get("version", 0), _tamanho(documento))
+                self._reduzir()
+        return documento
+
+    def carregar_versao(self, game_id):
+        return self.store.carregar_versao(game_id)
+
+    def carregar_jogada(self, game_id, seq):
+        with self._lock:
+            entrada = self._entradas.get(game_id)
+        if entrada is not None and entrada.jogadas_completas:
+            return self._memoria.carregar_jogada(game_id, seq)
+        return self.store.carregar_jogada(game_id, seq)
+
+    def listar_jogadas(self, game_id, desde=0, ate=None):
+        # Chamado logo depois de carregar_partida (já validada): a entrada vale
+        with self._lock:
+            entrada = self._entradas.get(game_id)
+        if entrada is not None and entrada.jogadas_completas:
+            return self._memoria.listar_jogadas(game_id, desde, ate)
+        versao = entrada.versao if entrada is not None else None
+        jogadas = self.store.listar_jogadas(game_id, desde, ate)
+        documento = self._memoria.carregar_partida(game_id) if entrada is not None else None
+        # Só a lista desde o início até a última jogada completa o cache, e
+        # só se nenhuma gravação mudou a partida durante a consulta
+        if documento is not None and desde == 0 and (ate is None or ate >= documento.get("play_count", 0)):
+            with self._lock:
+                if self._entradas.get(game_id) is entrada and entrada.versao == versao:
+                    self._memoria.gravar(game_id, jogadas=jogadas)
+                    for jogada in jogadas:
+                        entrada.guardar_jogada(jogada)
+                    entrada.jogadas_completas = True
+                    self._reduzir()
+        return jogadas
+
+    def buscar_jogadas(self, game_id, cursor=None, limite=50, decrescente=False, filtros=None):
+        # Páginas filtradas vão direto aos índices do armazenamento
+        return self.store.buscar_jogadas(game_id, cursor, limite, decrescente, filtros)
+
+    def listar_eventos(self, game_id, desde=0, ate=None):
+        return self.store.listar_eventos(game_id, desde, ate)
+
+    def observar(self, game_id, avisar):
+        return self.store.observar(game_id, avisar)
+
+    def carregar_checkpoint(self, game_id, ate=None):
+        return self.store.carregar_checkpoint(game_id, ate)
+
+    def gravar(self, game_id, documento=None, campos=None, jogadas=(), removidas=(), undos=None, versao=None,
+               eventos=(), checkpoint=None):
+        try:
+            self.store.gravar(game_id, documento=documento, campos=campos, jogadas=jogadas, removidas=removidas,
+                              undos=undos, versao=versao, eventos=eventos, checkpoint=checkpoint)
+        except Exception:
+            # Conflito (outro worker gravou antes) ou falha: a cópia não é mais confiável
+            self._descartar(game_id)
+            raise
+        with self._lock:
+            entrada = self._entradas.get(game_id)
+            if entrada is None:
+                return
+            # Mesma alteração na cópia em memória (eventos e checkpoints não ficam em cache)
+            self._memoria.gravar(game_id, documento=documento, campos=campos, jogadas=jogadas,
+                                 removidas=removidas, undos=undos)
+            atual = self._memoria.carregar_partida(game_id)
+            entrada.versao = atual.get("version", 0)
+            entrada.bytes_documento = _tamanho(atual)
+            for seq in removidas:
+                entrada.remover_jogada(seq)
+            for jogada in jogadas:
+                entrada.guardar_jogada(jogada)
+            self._entradas.move_to_end(game_id)
+            self._reduzir()
+
+    def listar_para_arquivar(self, inativas_ate, encerradas_ate, legado=False):
+        return self.store.listar_para_arquivar(inativas_ate, encerradas_ate, legado)
+
+    def exportar_partida(self, game_id):
+        return self.store.exportar_partida(game_id)
+
+    def substituir_por_lapide(self, game_id, lapide, versao):
+        try:
+            self.store.substituir_por_lapide(game_id, lapide, versao)
+        finally:
+            self._descartar(game_id)
@@ -0,0 +1,262 @@
+"""
+Codificação compacta das jogadas gravadas no armazenamento.
+
+Cada jogada do histórico é o payload do frontend (chaves longas, muitos
+"false", nomes de jogadores repetidos) mais round_mode, dealer, result e o
+delta de desfazer. No armazenamento ela vira um registro versionado e curto:
+
+    {"v": 1, "seq": 12, "j": 0, "g": 4, "m": 0, "d": 2, "f": 5, "c": 2,
+     "r": [144, 6, 24], "t": [144, -20, 36, 0], "undo": {"c": {"6": 1}, "k": {"0": {"0": 0}}}}
+
+- jogadores (jogador, dealer, empates) viram índices em player_names, e o
+  placar acumulado ("totais") uma lista na mesma ordem;
+- o jogo, a rodada e os campos do delta viram códigos de listas fixas (o
+  delta continua na chave "undo", que o armazenamento regrava sozinha);
+- as flags booleanas viram bits de "f" (só as verdadeiras);
+- só entram os campos diferentes do padrão; "a" marca os campos ausentes;
+- valores fora do formato esperado e chaves desconhecidas vão sem alteração
+  em "x", então a decodificação devolve exatamente o mesmo JSON.
+
+As listas abaixo só podem crescer no final: os códigos já gravados dependem
+da posição. Mudanças de formato exigem uma nova VERSAO_CODIFICACAO.
+"""
+import copy
+
+VERSAO_CODIFICACAO = 1
+
+# Bit i de "f" = FLAGS[i]
+FLAGS = [
+    "hand", "ouvert", "schneider", "schneider_anunciado", "schwartz", "schwartz_anunciado",
+    "kontra", "reh", "bock", "rursch", "jungfrau", "perdeu", "houve_empate",
+]
+
+JOGOS = [
+    "ouros", "copas", "espadas", "paus", "grand", "grand hand", "null", "null hand",
+    "null ouvert", "null hand ouvert", "null revolution", "durchmarsch", "ramsch",
+]
+
+MODOS = ["Bock", "Ramsch"]
+
+# Campos do delta de desfazer ("undo"), na ordem dos códigos
+CAMPOS_DELTA = [
+    "scores", "current_mode", "bock_rounds_played", "ramsch_rounds_played", "last_game_name",
+    "last_scoring_player", "dealer_index", "awaiting_ramsch_decision", "ramsch_candidates",
+    "ramsch_losses", "ramsch_scores_count", "ramsch_ramsch_count", "dealer_turns_count",
+    "bonus_turns", "last_was_bonus",
+]
+
+CHAVES_RESULTADO = ["points", "total_factor", "base_score"]
+
+# Valores do delta que viram códigos: campo -> lista de valores ("jogadores" = player_names)
+VALORES_DELTA = {
+    "current_mode": MODOS,
+    "last_game_name": JOGOS,
+    "last_scoring_player": "jogadores",
+    "ramsch_candidates": "jogadores",
+}
+
+# Campos conhecidos da jogada; o bit i de "a" indica que CAMPOS[i] não veio
+CAMPOS = [
+    "jogador", "jogo", "com_sem", "pontos_ramsch", "empates", "info",
+    "round_mode", "dealer", "result",
+] + FLAGS + ["totais"]
+
+_NAO_CODIFICAVEL = object()
+
+
+def _numero_texto(valor, jogadores=None):
+    # "3" -> 3; só textos que voltam idênticos com str()
+    if isinstance(valor, str) and valor.isascii() and valor.isdigit() and str(int(valor)) == valor:
+        return int(valor)
+    return _NAO_CODIFICAVEL
+
+
+def _indice(lista, valor):
+    if isinstance(valor, str) and valor in lista:
+        return lista.index(valor)
+    return _NAO_CODIFICAVEL
+
+
+def _skat_empurrado(valor, jogadores=None):
+    if isinstance(valor, dict) and list(valor) == ["skat_empurrado"] and type(valor["skat_empurrado"]) is int:
+        return valor["skat_empurrado"]
+    return _NAO_CODIFICAVEL
+
+
+def _resultado(valor, jogadores=None):
+    if isinstance(valor, dict) and list(valor) == CHAVES_RESULTADO:
+        return [valor[chave] for chave in CHAVES_RESULTADO]
+    return _NAO_CODIFICAVEL
+
+
+def _totais(valor, jogadores):
+    # Placar acumulado na ordem de player_names
+    if isinstance(valor, dict) and list(valor) == list(jogadores):
+        return list(valor.values())
+    return _NAO_CODIFICAVEL
+
+
+def _e_padrao_info(valor):
+    return _skat_empurrado(valor) == 0 and valor["skat_empurrado"] is not False
+
+
+# Campos não booleanos, na ordem de CAMPOS:
+# (campo, chave curta, codificar, decodificar, é o padrão?, valor padrão)
+# Sem valor padrão, o campo só é devolvido se veio no registro.
+_TABELA = [
+    ("jogador", "j", lambda v, js: _indice(js, v), lambda c, js: js[c], None, None),
+    ("jogo", "g", lambda v, js: _indice(JOGOS, v), lambda c, js: JOGOS[c], None, None),
+    ("com_sem", "c", _numero_texto, lambda c, js: str(c), lambda v: v == "", lambda: ""),
+    ("pontos_ramsch", "p", _numero_texto, lambda c, js: str(c), lambda v: v == "", lambda: ""),
+    ("empates", "e", lambda v, js: _indice(js, v), lambda c, js: js[c], lambda v: v is None, lambda: None),
+    ("info", "s", _skat_empurrado, lambda c, js: {"skat_empurrado": c}, _e_padrao_info,
+     lambda: {"skat_empurrado": 0}),
+    ("round_mode", "m", lambda v, js: _indice(MODOS, v), lambda c, js: MODOS[c], None, None),
+    ("dealer", "d", lambda v, js: _indice(js, v), lambda c, js: js[c], None, None),
+    ("result", "r", _resultado, lambda c, js: dict(zip(CHAVES_RESULTADO, c)), None, None),
+    ("totais", "t", _totais, lambda c, js: dict(zip(js, c)), None, None),
+]
+_TABELA = [(1 << CAMPOS.index(linha[0]),) + linha for linha in _TABELA]
+# Flags: (bit em "a", bit em "f", nome)
+_TABELA_FLAGS = [(1 << CAMPOS.index(flag), 1 << i, flag) for i, flag in enumerate(FLAGS)]
+_CONHECIDOS = set(CAMPOS) | {"seq", "undo"}
+
+
+def codificar_delta(delta, jogadores):
+    """
+    Delta de desfazer compacto: códigos de campo e índices de jogador.
+    Deltas fora do formato {"campos", "chaves"} conhecido vão inteiros em "x".
+    """
+    if not isinstance(delta, dict) or set(delta) != {"campos", "chaves"}:
+        return {"x": delta}
+    if any(campo not in CAMPOS_DELTA for campo in list(delta["campos"]) + list(delta["chaves"])):
+        return {"x": delta}
+    chaves = {}
+    for campo, valores in delta["chaves"].items():
+        if any(jogador not in jogadores for jogador in valores):
+            return {"x": delta}
+        chaves[str(CAMPOS_DELTA.index(campo))] = {str(jogadores.index(j)): v for j, v in valores.items()}
+    campos, codigos = {}, {}
+    for campo, valor in delta["campos"].items():
+        codigo = _codificar_valor_delta(campo, valor, jogadores)
+        if codigo is _NAO_CODIFICAVEL:
+            campos[str(CAMPOS_DELTA.index(campo))] = valor
+        else:
+            codigos[str(CAMPOS_DELTA.index(campo))] = codigo
+    codificado = {}
+    if campos:
+        codificado["c"] = campos
+    if codigos:
+        codificado["n"] = codigos
+    if chaves:
+        codificado["k"] = chaves
+    return codificado
+
+
+def _codificar_valor_delta(campo, valor, jogadores):
+    lista = VALORES_DELTA.get(campo)
+    if lista is None:
+        return _NAO_CODIFICAVEL
+    lista = jogadores if lista == "jogadores" else lista
+    if isinstance(valor, list):
+        indices = [_indice(lista, v) for v in valor]
+        return _NAO_CODIFICAVEL if any(i is _NAO_CODIFICAVEL for i in indices) else indices
+    return _indice(lista, valor)
+
+
+def _decodificar_valor_delta(campo, codigo, jogadores):
+    lista = VALORES_DELTA[campo]
+    lista = jogadores if lista == "jogadores" else lista
+    if isinstance(codigo, list):
+        return [lista[i] for i in codigo]
+    return lista[codigo]
+
+
+def decodificar_delta(codificado, jogadores):
+    """Inverso de codificar_delta (deltas no formato longo são devolvidos como estão)."""
+    if "x" in codificado:
+        return codificado["x"]
+    if "campos" in codificado:
+        return codificado
+    campos = {CAMPOS_DELTA[int(i)]: v for i, v in codificado.get("c", {}).items()}
+    for i, codigo in codificado.get("n", {}).items():
+        campos[CAMPOS_DELTA[int(i)]] = _decodificar_valor_delta(CAMPOS_DELTA[int(i)], codigo, jogadores)
+    return {
+        "campos": campos,
+        "chaves": {CAMPOS_DELTA[int(i)]: {jogadores[int(j)]: v for j, v in valores.items()}
+                   for i, valores in codificado.get("k", {}).items()},
+    }
+
+
+def codificar_jogada(jogada, jogadores):
+    """Converte uma jogada (payload + resultado) no registro compacto. "seq" é mantido."""
+    registro = {"v": VERSAO_CODIFICACAO}
+    if "seq" in jogada:
+        registro["seq"] = jogada["seq"]
+    if "undo" in jogada:
+        registro["undo"] = codificar_delta(jogada["undo"], jogadores)
+    flags = ausentes = 0
+    extras = {}
+    for bit, campo, chave, codificar, _, e_padrao, _ in _TABELA:
+        if campo not in jogada:
+            ausentes |= bit
+            continue
+        valor = jogada[campo]
+        if e_padrao is not None and e_padrao(valor):
+            continue
+        compacto = codificar(valor, jogadores)
+        if compacto is _NAO_CODIFICAVEL:
+            extras[campo] = valor
+        else:
+            registro[chave] = compacto
+    for bit_ausente, bit, flag in _TABELA_FLAGS:
+        valor = jogada.get(flag, _NAO_CODIFICAVEL)
+        if valor is True:
+            flags |= bit
+        elif valor is _NAO_CODIFICAVEL:
+            ausentes |= bit_ausente
+        elif valor is not False:
+            extras[flag] = valor
+    for campo, valor in jogada.items():
+        if campo not in _CONHECIDOS:
+            extras[campo] = valor
+    if flags:
+        registro["f"] = flags
+    if ausentes:
+        registro["a"] = ausentes
+    if extras:
+        registro["x"] = copy.deepcopy(extras)
+    return registro
+
+
+def decodificar_jogada(registro, jogadores):
+    """Inverso de codificar_jogada. Registros antigos (sem "v") são devolvidos como estão."""
+    if registro is None or "v" not in registro:
+        return registro
+    if registro["v"] != VERSAO_CODIFICACAO:
+        raise ValueError(f"Versão de codificação de jogada desconhecida: {registro['v']}.")
+    flags = registro.get("f", 0)
+    ausentes = registro.get("a", 0)
+    extras = registro.get("x") or {}
+    jogada = {}
+    for bit, campo, chave, _, decodificar, _, padrao in _TABELA:
+        if ausentes & bit:
+            continue
+        if campo in extras:
+            jogada[campo] = copy.deepcopy(extras[campo])
+        elif chave in registro:
+            jogada[campo] = decodificar(registro[chave], jogadores)
+        elif padrao is not None:
+            jogada[campo] = padrao()
+    for bit_ausente, bit, flag in _TABELA_FLAGS:
+        if ausentes & bit_ausente:
+            continue
+        jogada[flag] = copy.deepcopy(extras[flag]) if flag in extras else bool(flags & bit)
+    for campo, valor in extras.items():
+        if campo not in _CONHECIDOS:
+            jogada[campo] = copy.deepcopy(valor)
+    if "seq" in registro:
+        jogada["seq"] = registro["seq"]
+    if "undo" in registro:
+        jogada["undo"] = decodificar_delta(registro["undo"], jogadores)
+    return jogada
@@ -0,0 +1,139 @@
+"""
+Medição por requisição: o que foi armazenamento e o que foi Python.
+
+Cada requisição da API abre uma Medicao (ativar) e, no fim, a devolve no
+header Server-Timing (o DevTools mostra na aba Timing) e numa linha de log
+"METRICAS {json}" (lida pelo analisar_logs.py). Ela conta e cronometra:
+- leituras e gravações do armazenamento (StoreMedido, logo acima do
+  Firestore/SQLite: acertos do cache não contam como leitura);
+- bytes serializados nas gravações (JSON de cada escrita);
+- pontuação (calculate_score) e transição (rodada, dealer, Ramsch).
+
+A medição ativa fica num ContextVar: cada thread do gunicorn e cada tarefa
+do asyncio têm a sua. No group commit (rauberskat_serializer.py) o thread
+líder aplica os pedidos dos outros; ele ativa a medição de cada pedido
+enquanto o aplica, e a carga e o commit do lote contam para todos os
+pedidos que esperaram por eles. Sem medição ativa (app desktop, threads
+do canal ao vivo), medir não faz nada.
+"""
+import json
+import time
+import contextlib
+import contextvars
+
+# Chamadas do GameStore medidas, e como cada uma conta
+CHAMADAS = {
+    "carregar_partida": "leitura", "carregar_versao": "leitura", "carregar_jogada": "leitura",
+    "listar_jogadas": "leitura", "buscar_jogadas": "leitura", "listar_eventos": "leitura",
+    "carregar_checkpoint": "leitura", "exportar_partida": "leitura", "listar_para_arquivar": "leitura",
+    "criar_partida": "escrita", "gravar": "escrita", "substituir_por_lapide": "escrita",
+    "importar_partida": "escrita",
+}
+# Ordem das etapas no Server-Timing e no log
+ETAPAS = ("leitura", "escrita", "pontuacao", "transicao")
+
+_ativas = contextvars.ContextVar("rauberskat_medicoes", default=())
+
+
+class Medicao:
+    """Contagem e tempo de cada etapa de uma requisição."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = {}  # etapa -> [vezes, segundos]
+        self.bytes = 0
+
+    def somar(self, etapa, segundos, vezes=1):
+        entrada = self.etapas.setdefault(etapa, [0, 0.0])
+        entrada[0] += vezes
+        entrada[1] += segundos
+
+    def total(self):
+        return time.perf_counter() - self.inicio
+
+    def server_timing(self):
+        """Valor do header Server-Timing (durações em ms)."""
+        partes = []
+        for etapa in ETAPAS:
+            if etapa in self.etapas:
+                vezes, segundos = self.etapas[etapa]
+                descricao = f"{vezes}x" + (f", {self.bytes} bytes" if etapa == "escrita" and self.bytes else "")
+                partes.append(f'{etapa};dur={segundos * 1000:.2f};desc="{descricao}"')
+        partes.append(f"total;dur={self.total() * 1000:.2f}")
+        return ", ".join(partes)
+
+    def linha_de_log(self, **requisicao):
+        """Linha "METRICAS {json}" com os dados da requisição (rota, status...) e as etapas."""
+        dados = dict(requisicao, total_ms=round(self.total() * 1000, 2))
+        for etapa in ETAPAS:
+            vezes, segundos = self.etapas.get(etapa, (0, 0.0))
+            dados[etapa] = vezes
+            dados[f"{etapa}_ms"] = round(segundos * 1000, 2)
+        dados["bytes"] = self.bytes
+        return "METRICAS " + json.dumps(dados, separators=(",", ":"), default=str)
+
+
+def ativar(*medicoes):
+    """Torna as medições ativas neste thread/tarefa; retorna o token para desativar."""
+    return _ativas.set(medicoes)
+
+
+def desativar(token):
+    _ativas.reset(token)
+
+
+def atuais():
+    """Medições ativas (tupla, vazia fora de uma requisição)."""
+    return _ativas.get()
+
+
+@contextlib.contextmanager
+def ativas(*medicoes):
+    token = ativar(*medicoes)
+    try:
+        yield
+    finally:
+        desativar(token)
+
+
+@contextlib.contextmanager
+def medir(etapa):
+    """Soma o tempo do bloco à etapa em todas as medições ativas (também se ele falhar)."""
+    medicoes = _ativas.get()
+    if not medicoes:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        for medicao in medicoes:
+            medicao.somar(etapa, segundos)
+
+
+def contar_bytes(quantidade):
+    """Bytes serializados por uma gravação (chamado pelos armazenamentos)."""
+    for medicao in _ativas.get():
+        medicao.bytes += quantidade
+
+
+class StoreMedido:
+    """
+    Conta e cronometra as chamadas a um GameStore (CHAMADAS) nas medições
+    ativas. Fica por fora da LatenciaSimulada, que conta como armazenamento.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, nome):
+        metodo = getattr(self.store, nome)
+        etapa = CHAMADAS.get(nome)
+        if etapa is None:
+            return metodo
+
+        def medido(*args, **kwargs):
+            with medir(etapa):
+                return metodo(*args, **kwargs)
+        return medido
@@ -0,0 +1,162 @@
+"""
+Tabela de pontuação do Räuberskat, montada uma vez na importação.
+
+O resultado de uma jogada (pontos base, fator total e pontos) depende só do
+jogo, da rodada (Bock/Ramsch), das flags, do "com/sem" e do skat empurrado.
+A chave já entra resumida:
+- com/sem, Hand, Ouvert e Schneider/Schwarz (anunciados ou não) somam ao
+  fator: basta a soma;
+- Kontra/Reh/Bock/Rürsch dobram cada uma: basta a quantidade ("dobras");
+- flags que o jogo não usa ficam de fora (Ramsch não olha Hand, etc.).
+
+TABELA[chave] = (base, fator, pontos). No Ramsch a base são os pontos
+inseridos pelo usuário, então a entrada guarda o fator e os pontos por
+ponto inserido. Chaves fora da tabela (com/sem acima de 11, valores de
+tipo inesperado vindos do payload) são calculadas pela mesma regra, com
+memória das últimas usadas.
+"""
+import functools
+
+PONTOS_BASE = {
+    "ouros": 9,
+    "grand hand": 24,
+    "copas": 10,
+    "espadas": 11,
+    "paus": 12,
+    "null": 23,
+    "grand": 24,
+    "null hand": 35,
+    "null ouvert": 46,
+    "null hand ouvert": 59,
+    "null revolution": 92,
+    "durchmarsch": 120,
+}
+
+ADITIVOS = ("schneider", "schneider_anunciado", "schwartz", "schwartz_anunciado")
+DOBRAS = ("kontra", "reh", "bock", "rursch")
+JOGOS_NULL = ("null", "null revolution")
+JOGOS_NORMAIS = ("ouros", "copas", "espadas", "paus", "grand", "null hand", "null ouvert", "null hand ouvert")
+MODOS = ("Bock", "Ramsch")
+
+# Faixas pré-calculadas
+MAX_COM_SEM = 11
+MAX_SKAT_EMPURRADO = 3
+
+
+def tipo_null(jogo, hand, ouvert):
+    """Nome do tipo de Null gravado no histórico ("game_type_log")."""
+    if jogo == "null revolution":
+        return "NULL REVOLUTION"
+    return " ".join(["NULL"] + (["HAND"] if hand else []) + (["OUVERT"] if ouvert else []))
+
+
+def _regra(jogo, *resto):
+    """Regras de pontuação sobre a chave já normalizada. Retorna (base, fator, pontos)."""
+    if jogo == "ramsch":
+        modo, jungfrau, skat = resto
+        fator = 2 ** skat  # 0 → 1, 1 → 2, 2 → 4, 3 → 8
+        if jungfrau:
+            fator *= 2
+        if modo == "Bock":
+            fator *= 2
+        return 1, fator, -fator  # Por ponto inserido, sempre negativo
+
+    if jogo == "durchmarsch":
+        modo, skat = resto
+        if modo == "Ramsch":
+            fator = 2 ** skat
+        else:
+            fator = skat if skat > 0 else 1
+        if modo == "Bock":
+            fator *= 2
+        return 120, fator, 120 * fator
+
+    if jogo in JOGOS_NULL:
+        modo, hand, ouvert, dobras, perdeu = resto
+        if jogo == "null revolution":
+            base = 92
+        else:
+            base = {(True, True): 59, (True, False): 35, (False, True): 46}.get((hand, ouvert), 23)
+        fator = 2 ** dobras
+        if modo == "Bock":
+            fator *= 2
+        if perdeu:
+            fator *= -1 if hand else -2
+        return base, fator, base * fator
+
+    if jogo == "grand hand":
+        # Hand automático, sem Bock da rodada e derrota só x-1
+        ouvert, soma, dobras, perdeu = resto
+        base = 36 if ouvert else 24
+        fator = soma * 2 ** dobras
+        if perdeu:
+            fator *= -1
+        return base, fator, base * fator
+
+    # Ouros, Copas, Espadas, Paus, Grand (Grand Ouvert só muda a base para 36)
+    modo, grand_ouvert, soma, dobras, derrota = resto
+    base = 36 if grand_ouvert else PONTOS_BASE.get(jogo, 0)
+    fator = soma * 2 ** dobras
+    if modo == "Bock":
+        fator *= 2
+    if derrota:
+        fator *= -derrota
+    return base, fator, base * fator
+
+
+def chave_jogada(jogo, modo, dados, com_sem=0, skat_empurrado=0):
+    """
+    Chave da tabela para uma jogada. "jogo" já em minúsculas e "com_sem" já
+    convertido para int (no Grand Hand e nos jogos normais). As somas do
+    fator e a derrota (x-1 com Hand, x-2 sem) já entram calculadas.
+    """
+    hand = bool(dados.get("hand", False))
+    ouvert = bool(dados.get("ouvert", False))
+    perdeu = bool(dados.get("perdeu", False))
+    aditivos = sum(bool(dados.get(flag, False)) for flag in ADITIVOS)
+    dobras = sum(bool(dados.get(flag, False)) for flag in DOBRAS)
+    if jogo == "ramsch":
+        return (jogo, modo, bool(dados.get("jungfrau", False)), skat_empurrado)
+    if jogo == "durchmarsch":
+        return (jogo, modo, skat_empurrado)
+    if jogo in JOGOS_NULL:
+        return (jogo, modo, hand, ouvert and jogo == "null", dobras, perdeu)
+    if jogo == "grand hand":
+        return (jogo, ouvert, com_sem + 2 + aditivos, dobras, perdeu)
+    soma = com_sem + 1 + hand + (ouvert and jogo != "grand") + aditivos
+    derrota = (1 if hand else 2) if perdeu else 0
+    return (jogo, modo, ouvert and jogo == "grand", soma, dobras, derrota)
+
+
+def _montar_tabela():
+    booleanos = (False, True)
+    dobras = range(len(DOBRAS) + 1)
+    skats = range(MAX_SKAT_EMPURRADO + 1)
+    somas = range(1, MAX_COM_SEM + len(ADITIVOS) + 4)  # com/sem + 1 + Hand + Ouvert + aditivos
+    chaves = [("grand hand", ouvert, soma, d, perdeu)
+              for ouvert in booleanos for soma in somas for d in dobras for perdeu in booleanos]
+    for modo in MODOS:
+        chaves += [("ramsch", modo, jungfrau, skat) for jungfrau in booleanos for skat in skats]
+        chaves += [("durchmarsch", modo, skat) for skat in skats]
+        chaves += [(jogo, modo, hand, ouvert and jogo == "null", d, perdeu) for jogo in JOGOS_NULL
+                   for hand in booleanos for ouvert in booleanos for d in dobras for perdeu in booleanos]
+        chaves += [(jogo, modo, grand_ouvert, soma, d, derrota) for jogo in JOGOS_NORMAIS
+                   for grand_ouvert in ((False, True) if jogo == "grand" else (False,))
+                   for soma in somas for d in dobras for derrota in (0, 1, 2)]
+    return {chave: _regra(*chave) for chave in chaves}
+
+
+TABELA = _montar_tabela()
+
+# Fora da tabela: mesma regra, lembrando as chaves usadas por último (typed: 1.0 não vira 1)
+_regra_memorizada = functools.lru_cache(maxsize=1024, typed=True)(_regra)
+
+
+def pontuar(chave):
+    """(base, fator, pontos) da jogada. Erros de tipo no payload sobem como na regra."""
+    # Skat empurrado 1.0 acharia a entrada do 1, mas o resultado tem de sair float
+    if type(chave[-1]) is not float:
+        resultado = TABELA.get(chave)
+        if resultado is not None:
+            return resultado
+    return _regra_memorizada(*chave)
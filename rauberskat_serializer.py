@@ -0,0 +1,212 @@
+import copy
+import time
+import random
+import threading
+
+from rauberskat_backend_oficial import RauberskatScorekeeper
+from rauberskat_storage import ConflitoDeVersao, _tamanho
+from rauberskat_metricas import ativas, atuais
+
+# Quantas vezes um lote é refeito quando outro processo grava a partida antes
+TENTATIVAS_CONFLITO = 8
+# Máximo de pedidos da mesma partida gravados num único commit
+LIMITE_LOTE = 64
+# Orçamento de um commit: o lote para de receber pedidos quando os eventos
+# (jogadas, decisões, desfazer) ou os bytes das jogadas e eventos novos
+# passam disso. A gravação condicional é uma transação só, e o Firestore
+# limita a requisição a 10 MiB (o checkpoint também vai nela)
+LIMITE_EVENTOS_COMMIT = 1000
+LIMITE_BYTES_COMMIT = 2 * 1024 * 1024
+
+
+class _Pedido:
+    """Uma alteração na fila de uma partida, com o resultado para quem a enviou."""
+
+    def __init__(self, operacao, repetivel):
+        self.operacao = operacao
+        self.repetivel = repetivel
+        self.medicoes = atuais()  # Medição da requisição (rauberskat_metricas.py), também no thread líder
+        self.resultado = None
+        self.erro = None
+        self.feito = False
+
+
+class _FilaPartida:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pendentes = []
+        self.ocupada = False  # Algum thread está processando um lote desta partida
+        self.usuarios = 0     # Threads usando a fila; sem nenhum, ela é descartada
+
+
+class SerializadorDePartidas:
+    """
+    Serializa, dentro do processo, as alterações de uma mesma partida.
+
+    Os threads do gunicorn enfileiram seus pedidos por game_id. O primeiro da
+    fila vira o "líder": carrega a partida uma vez, aplica em ordem todos os
+    pedidos pendentes sobre o mesmo estado em memória e grava tudo num único
+    commit (group commit). Os demais só esperam o resultado. Partidas
+    diferentes têm filas diferentes e seguem em paralelo.
+
+    Entre processos (vários workers, ou a Vercel) continua valendo o controle
+    de versão: em conflito, o lote é refeito sobre o estado novo.
+
+    Um lote tem até limite_lote pedidos, e para antes se passar do orçamento
+    de um commit (LIMITE_EVENTOS_COMMIT, LIMITE_BYTES_COMMIT): os pedidos que
+    sobraram voltam para o início da fila e vão no commit seguinte.
+
+    ao_gravar(game_id), se informado, é chamado depois de cada commit (o canal
+    ao vivo avisa quem acompanha a partida sem esperar a próxima consulta).
+
+    store_validado, se informado, é o mesmo armazenamento conferindo a versão
+    antes de usar a cópia em cache (o store principal, cache.sem_validacao(),
+    não confere). Lotes com pedidos não repetíveis partem dele: um desfazer
+    não pode ser refeito, então não pode começar de um estado velho.
+    """
+
+    def __init__(self, store, limite_lote=LIMITE_LOTE, ao_gravar=None, store_validado=None):
+        self.store = store
+        self.store_validado = store_validado
+        self.limite_lote = limite_lote
+        self.ao_gravar = ao_gravar
+        self._filas = {}
+        self._lock = threading.Lock()
+
+    def executar(self, game_id, operacao, repetivel=True):
+        """
+        Aplica operacao(scorekeeper) na partida e retorna o que ela retornar,
+        depois de gravado. Exceções da operação são repassadas a quem chamou.
+        repetivel=False (desfazer): em conflito com outro processo, o pedido
+        falha com ConflitoDeVersao em vez de ser refeito sobre outro estado.
+        """
+        pedido = _Pedido(operacao, repetivel)
+        fila = self._entrar(game_id)
+        try:
+            with fila.cond:
+                fila.pendentes.append(pedido)
+            while True:
+                with fila.cond:
+                    while fila.ocupada and not pedido.feito:
+                        fila.cond.wait()
+                    if pedido.feito:
+                        break
+                    fila.ocupada = True
+                    lote = fila.pendentes[:self.limite_lote]
+                    del fila.pendentes[:len(lote)]
+                sobra = []
+                try:
+                    # Carga e commit do lote contam para todos os pedidos que esperaram por eles
+                    with ativas(*(medicao for outro in lote for medicao in outro.medicoes)):
+                        sobra = self._processar_lote(game_id, lote)
+                finally:
+                    with fila.cond:
+                        fila.pendentes[:0] = sobra  # Fora do orçamento: primeiros do próximo lote
+                        fila.ocupada = False
+                        fila.cond.notify_all()
+        finally:
+            self._sair(game_id, fila)
+
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+    def _entrar(self, game_id):
+        with self._lock:
+            fila = self._filas.setdefault(game_id, _FilaPartida())
+            fila.usuarios += 1
+            return fila
+
+    def _sair(self, game_id, fila):
+        with self._lock:
+            fila.usuarios -= 1
+            if fila.usuarios == 0:
+                del self._filas[game_id]
+
+    def _processar_lote(self, game_id, lote):
+        """Aplica e grava o lote; retorna os pedidos que ficaram fora do orçamento do commit."""
+        sobra = []
+        try:
+            store = self.store
+            if self.store_validado is not None and any(not pedido.repetivel for pedido in lote):
+                store = self.store_validado
+            for tentativa in range(TENTATIVAS_CONFLITO):
+                scorekeeper, aceitos, restantes = self._aplicar(RauberskatScorekeeper(store, game_id), lote)
+                if restantes:
+                    sobra = restantes + sobra
+                    lote = [pedido for pedido in lote if pedido not in restantes]
+                if not aceitos:
+                    return sobra  # Todos os pedidos falharam (ex.: lote de jogadas inválido): nada a gravar
+                try:
+                    scorekeeper._save_state()  # Um único commit para o lote inteiro
+                except ConflitoDeVersao as e:
+                    print(f"⚠️  {e} Tentativa {tentativa + 1} de {TENTATIVAS_CONFLITO}.")
+                    for pedido in lote:
+                        pedido.resultado = None
+                        if not pedido.repetivel and pedido.erro is None:
+                            pedido.erro = e
+                    if tentativa == TENTATIVAS_CONFLITO - 1:
+                        for pedido in aceitos:
+                            pedido.erro = e
+                    time.sleep(random.uniform(0, 0.005 * 2 ** min(tentativa, 5)))  # Espera curta e aleatória antes de repetir
+                    continue
+                for pedido in aceitos:
+                    if not isinstance(pedido.resultado, dict) or "version" not in pedido.resultado:
+                        continue
+                    if pedido is aceitos[-1]:
+                        # O estado gravado: a resposta leva o que só a gravação define
+                        # (a versão gravada, o horário e o último checkpoint)
+                        pedido.resultado.update(version=scorekeeper.version, updated_at=scorekeeper.updated_at,
+                                                checkpoint=scorekeeper.checkpoint)
+                    else:
+                        # Estado do meio do lote: nenhuma versão gravada corresponde a ele.
+                        # Fica com a versão lida (o estado gravado, pelo canal ao vivo ou
+                        # pelo GET, é mais novo) e avisa o cliente para buscá-lo
+                        pedido.resultado["intermediaria"] = True
+                if self.ao_gravar is not None:
+                    self.ao_gravar(game_id)
+                return sobra
+        except Exception as e:
+            # Partida não encontrada ou falha do armazenamento: vale para o lote todo
+            for pedido in lote:
+                if pedido.erro is None:
+                    pedido.erro = e
+        finally:
+            for pedido in lote:
+                pedido.feito = True
+        return sobra
+
+    def _aplicar(self, scorekeeper, lote):
+        """
+        Aplica em ordem os pedidos ainda válidos do lote. Se um deles falhar, o
+        estado em memória pode ter ficado pela metade: a partida é recarregada e
+        os pedidos anteriores são reaplicados, sem o que falhou.
+        Para quando o que vai ser gravado passa do orçamento do commit (o
+        primeiro pedido sempre entra). Retorna (scorekeeper, aceitos, restantes),
+        com restantes os pedidos ainda não aplicados.
+        """
+        aceitos = []
+        eventos = bytes_novos = 0
+        for indice, pedido in enumerate(lote):
+            if aceitos and (eventos >= LIMITE_EVENTOS_COMMIT or bytes_novos >= LIMITE_BYTES_COMMIT):
+                restantes = [outro for outro in lote[indice:] if outro.erro is None]
+                for outro in restantes:
+                    outro.resultado = None
+                return scorekeeper, aceitos, restantes
+            if pedido.erro is not None:
+                continue
+            antes = len(scorekeeper._eventos_novos), len(scorekeeper.game_history)
+            try:
+                with ativas(*pedido.medicoes):
+                    # Cópia: o estado retornado compartilha dicts (placar...) com o
+                    # scorekeeper, que os próximos pedidos do lote ainda alteram
+                    pedido.resultado = copy.deepcopy(pedido.operacao(scorekeeper))
+            except Exception as e:
+                pedido.erro = e
+                return self._aplicar(RauberskatScorekeeper(scorekeeper.store, scorekeeper.game_id), lote)
+            aceitos.append(pedido)
+            # O que este pedido acrescentou à gravação (o desfazer pode encurtar o histórico)
+            novos = scorekeeper._eventos_novos[antes[0]:] + scorekeeper.game_history[antes[1]:]
+            eventos += len(scorekeeper._eventos_novos) - antes[0]
+            bytes_novos += sum(_tamanho(registro) for registro in novos)
+        return scorekeeper, aceitos, []
@@ -0,0 +1,864 @@
+import os
+import copy
+import datetime
+import json
+import time
+import threading
+import contextlib
+
+from rauberskat_metricas import contar_bytes
+
+# Escritas por lote (batch) nas gravações sem versão (importação, arquivo
+# frio). As condicionais vão numa transação só, limitada pelo tamanho da
+# requisição (10 MiB) e não por esta contagem.
+LIMITE_ESCRITAS_LOTE = 500
+# Limite do Firestore por documento. O tamanho é medido como JSON compacto,
+# uma aproximação (um pouco acima) do cálculo do próprio Firestore.
+LIMITE_DOCUMENTO = 1024 * 1024
+# Escritas acima disso geram um aviso no log (RAUBERSKAT_AVISO_BYTES)
+AVISO_BYTES = int(os.environ.get("RAUBERSKAT_AVISO_BYTES", 256 * 1024))
+# Checkpoints acima disso têm as jogadas mais antigas movidas para partes de transbordo
+LIMITE_TRANSBORDO = 512 * 1024
+
+
+class ConflitoDeVersao(Exception):
+    """A partida foi gravada por outra requisição depois de ter sido lida."""
+
+    def __init__(self, game_id, esperada, atual):
+        super().__init__(f"Partida '{game_id}' mudou durante a requisição (versão {esperada}, agora {atual}).")
+        self.game_id = game_id
+        self.esperada = esperada
+        self.atual = atual
+
+
+class PartidaArquivada(ValueError):
+    """A partida foi movida para o arquivo frio; no armazenamento só ficou a lápide."""
+
+    def __init__(self, game_id, lapide):
+        super().__init__(f"Partida '{game_id}' foi arquivada e não aceita mais alterações.")
+        self.game_id = game_id
+        self.lapide = lapide
+
+
+def _versao(documento):
+    # Partidas anteriores ao controle de versão contam como versão 0
+    return (documento or {}).get("version", 0)
+
+
+# Campos de busca das jogadas (GET /plays): coluna -> (chave no registro
+# compacto, chave no registro antigo). O compacto guarda códigos (índice do
+# jogador, do jogo e da rodada); o antigo, os nomes.
+CAMPOS_BUSCA = {"jogador": ("j", "jogador"), "jogo": ("g", "jogo"), "round_mode": ("m", "round_mode")}
+
+
+def _campos_busca(registro):
+    """Valores dos campos de busca de um registro de jogada."""
+    indice = 0 if "v" in registro else 1
+    return {coluna: registro.get(chaves[indice]) for coluna, chaves in CAMPOS_BUSCA.items()}
+
+
+def _tamanho(dados):
+    return len(json.dumps(dados, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def _medir(game_id, descricao, dados):
+    """Tamanho de uma escrita; avisa no log quando passa de AVISO_BYTES."""
+    tamanho = _tamanho(dados)
+    if tamanho > AVISO_BYTES:
+        print(f"⚠️  Partida '{game_id}': {descricao} com {tamanho} bytes "
+              f"(aviso a partir de {AVISO_BYTES}, limite {LIMITE_DOCUMENTO}).")
+    return tamanho
+
+
+def _lotes(operacoes):
+    """Divide as operações de uma gravação sem versão em lotes de commit."""
+    return [operacoes[inicio:inicio + LIMITE_ESCRITAS_LOTE] for inicio in range(0, len(operacoes), LIMITE_ESCRITAS_LOTE)]
+
+
+def _dividir_checkpoint(checkpoint, limite=LIMITE_TRANSBORDO):
+    """
+    Checkpoints de sessões longas crescem com as jogadas vivas (e seus deltas
+    de desfazer). Acima do limite, as jogadas mais antigas vão para partes de
+    até 'limite' bytes; o checkpoint fica com o estado, as jogadas recentes e
+    "partes" (quantas). Retorna (checkpoint, partes).
+    """
+    if _tamanho(checkpoint) <= limite:
+        return checkpoint, []
+    partes, atual, tamanho = [], [], 0
+    for jogada in checkpoint["jogadas"]:
+        tamanho_jogada = _tamanho(jogada) + 1
+        if atual and tamanho + tamanho_jogada > limite:
+            partes.append(atual)
+            atual, tamanho = [], 0
+        atual.append(jogada)
+        tamanho += tamanho_jogada
+    if atual and _tamanho(dict(checkpoint, jogadas=atual)) > limite:
+        partes.append(atual)
+        atual = []
+    principal = dict(checkpoint, jogadas=atual, partes=len(partes))
+    return principal, [{"n": checkpoint["n"], "parte": i, "jogadas": jogadas} for i, jogadas in enumerate(partes)]
+
+
+def _juntar_checkpoint(principal, partes):
+    """Inverso de _dividir_checkpoint: devolve o checkpoint com todas as jogadas."""
+    if principal is None or "partes" not in principal:
+        return principal
+    partes = sorted((p for p in partes if p["parte"] < principal["partes"]), key=lambda p: p["parte"])
+    antigas = [jogada for parte in partes for jogada in parte["jogadas"]]
+    checkpoint = dict(principal, jogadas=antigas + principal["jogadas"])
+    del checkpoint["partes"]
+    return checkpoint
+
+
+class GameStore:
+    """
+    Interface de armazenamento das partidas usada pelo RauberskatScorekeeper.
+
+    Cada partida tem um documento principal (estado vivo + play_count) e um
+    registro por jogada, identificado pela sequência "seq" (0, 1, 2, ...).
+    Os registros de jogada carregam o delta de desfazer no campo "undo".
+
+    A fonte da verdade é o fluxo de eventos da partida (jogada, decisão de
+    Ramsch, desfazer), numerados por "n" e nunca alterados, com checkpoints
+    periódicos do estado. Documento e jogadas são projeções gravadas no
+    mesmo commit dos eventos, para as leituras continuarem rápidas.
+    """
+
+    def criar_partida(self, estado):
+        """Grava o documento de uma partida nova e retorna o ID gerado."""
+        raise NotImplementedError
+
+    def carregar_partida(self, game_id):
+        """Retorna o documento principal da partida, ou None se não existir."""
+        raise NotImplementedError
+
+    def carregar_versao(self, game_id):
+        """Retorna só a versão ("version") do documento, ou None se a partida não existir."""
+        documento = self.carregar_partida(game_id)
+        return None if documento is None else _versao(documento)
+
+    def carregar_jogada(self, game_id, seq):
+        """Retorna um único registro de jogada, ou None."""
+        raise NotImplementedError
+
+    def listar_jogadas(self, game_id, desde=0, ate=None):
+        """Retorna os registros de jogada com desde <= seq < ate, em ordem."""
+        raise NotImplementedError
+
+    def buscar_jogadas(self, game_id, cursor=None, limite=50, decrescente=False, filtros=None):
+        """
+        Uma página de registros de jogada em ordem de "seq", a partir de
+        cursor (inclusive; decrescente: do cursor para trás), com até limite
+        registros. filtros: {coluna de CAMPOS_BUSCA: valores aceitos}.
+        Esta versão percorre todas as jogadas; SQLite e Firestore usam índices.
+        """
+        jogadas = self.listar_jogadas(game_id)
+        if decrescente:
+            jogadas.reverse()
+        pagina = []
+        for jogada in jogadas:
+            if cursor is not None and (jogada["seq"] > cursor if decrescente else jogada["seq"] < cursor):
+                continue
+            valores = _campos_busca(jogada)
+            if all(valores[coluna] in aceitos for coluna, aceitos in (filtros or {}).items()):
+                pagina.append(jogada)
+                if len(pagina) == limite:
+                    break
+        return pagina
+
+    def listar_eventos(self, game_id, desde=0, ate=None):
+        """Retorna os eventos com desde <= n < ate, em ordem."""
+        raise NotImplementedError
+
+    def observar(self, game_id, avisar):
+        """
+        Assina as alterações da partida: avisar() é chamado (em outro thread)
+        quando ela pode ter mudado. Retorna a função que cancela a assinatura,
+        ou None se o armazenamento não avisa (quem assina consulta a versão).
+        """
+        return None
+
+    def carregar_checkpoint(self, game_id, ate=None):
+        """Retorna o checkpoint mais recente com n <= ate (ou o último), ou None."""
+        raise NotImplementedError
+
+    def gravar(self, game_id, documento=None, campos=None, jogadas=(), removidas=(), undos=None, versao=None,
+               eventos=(), checkpoint=None):
+        """
+        Aplica, de uma vez, as alterações de uma requisição:
+        - documento: regrava o documento principal inteiro (criação/migração);
+        - campos: atualiza só esses campos do documento principal;
+        - jogadas: registros novos (cada um com "seq");
+        - removidas: sequências de jogadas desfeitas;
+        - undos: {seq: delta} para regravar o delta de jogadas já salvas;
+        - versao: se informada, só grava se o documento ainda estiver nessa
+          versão ("version"); senão levanta ConflitoDeVersao sem gravar nada;
+        - eventos: eventos novos (cada um com "n"), só acrescentados;
+        - checkpoint: estado derivado após o evento checkpoint["n"].
+        """
+        raise NotImplementedError
+
+    # --- Arquivo frio (rauberskat_arquivo.py) ---
+
+    def listar_para_arquivar(self, inativas_ate, encerradas_ate, legado=False):
+        """
+        IDs das partidas sem alteração ("updated_at") desde inativas_ate, ou
+        encerradas ("finished_at") e sem alteração desde encerradas_ate.
+        Datas em ISO 8601 (UTC); lápides ficam de fora.
+
+        Partidas gravadas antes do campo "updated_at" só entram com legado=True:
+        no Firestore vale o horário da última escrita do documento; nos outros
+        armazenamentos elas contam como paradas desde sempre.
+        """
+        raise NotImplementedError
+
+    def exportar_partida(self, game_id):
+        """
+        Tudo o que a partida tem, para o arquivo frio:
+        {"documento", "jogadas", "eventos", "checkpoints"}, ou None.
+        O documento é lido primeiro: se algo mudar durante a exportação, a
+        versão dele já é antiga e substituir_por_lapide falha.
+        """
+        raise NotImplementedError
+
+    def substituir_por_lapide(self, game_id, lapide, versao):
+        """
+        Troca o documento pela lápide e apaga jogadas, eventos e checkpoints,
+        se a partida ainda estiver na versão lida (senão, ConflitoDeVersao).
+        """
+        raise NotImplementedError
+
+    def importar_partida(self, game_id, pacote):
+        """Grava uma partida exportada por exportar_partida (leitura do arquivo frio)."""
+        self.gravar(game_id, documento=pacote["documento"], jogadas=pacote["jogadas"], eventos=pacote["eventos"])
+        for checkpoint in pacote["checkpoints"]:
+            self.gravar(game_id, checkpoint=checkpoint)
+
+
+class MemoryGameStore(GameStore):
+    """Partidas só em memória (app desktop e testes). Nada é persistido."""
+
+    def __init__(self):
+        self._partidas = {}
+        self._jogadas = {}
+        self._eventos = {}
+        self._checkpoints = {}
+        self._lock = threading.Lock()
+
+    def criar_partida(self, estado):
+        game_id = os.urandom(10).hex()
+        with self._lock:
+            self._partidas[game_id] = copy.deepcopy(estado)
+            self._jogadas[game_id] = {}
+        return game_id
+
+    def carregar_partida(self, game_id):
+        with self._lock:
+            return copy.deepcopy(self._partidas.get(game_id))
+
+    def carregar_jogada(self, game_id, seq):
+        with self._lock:
+            return copy.deepcopy(self._jogadas.get(game_id, {}).get(seq))
+
+    def listar_jogadas(self, game_id, desde=0, ate=None):
+        with self._lock:
+            jogadas = self._jogadas.get(game_id, {})
+            seqs = sorted(s for s in jogadas if s >= desde and (ate is None or s < ate))
+            return [copy.deepcopy(jogadas[s]) for s in seqs]
+
+    def listar_eventos(self, game_id, desde=0, ate=None):
+        with self._lock:
+            eventos = self._eventos.get(game_id, {})
+            return [copy.deepcopy(eventos[n]) for n in sorted(eventos) if n >= desde and (ate is None or n < ate)]
+
+    def carregar_checkpoint(self, game_id, ate=None):
+        with self._lock:
+            checkpoints = self._checkpoints.get(game_id, {})
+            validos = [n for n in checkpoints if ate is None or n <= ate]
+            return copy.deepcopy(checkpoints[max(validos)]) if validos else None
+
+    def gravar(self, game_id, documento=None, campos=None, jogadas=(), removidas=(), undos=None, versao=None,
+               eventos=(), checkpoint=None):
+        with self._lock:
+            if versao is not None and _versao(self._partidas.get(game_id)) != versao:
+                raise ConflitoDeVersao(game_id, versao, _versao(self._partidas.get(game_id)))
+            for evento in eventos:
+                self._eventos.setdefault(game_id, {})[evento["n"]] = copy.deepcopy(evento)
+            if checkpoint is not None:
+                self._checkpoints.setdefault(game_id, {})[checkpoint["n"]] = copy.deepcopy(checkpoint)
+            registros = self._jogadas.setdefault(game_id, {})
+            for seq in removidas:
+                registros.pop(seq, None)
+            for jogada in jogadas:
+                registros[jogada["seq"]] = copy.deepcopy(jogada)
+            for seq, entrada in (undos or {}).items():
+                if seq in registros:
+                    registros[seq]["undo"] = copy.deepcopy(entrada)
+            if documento is not None:
+                self._partidas[game_id] = copy.deepcopy(documento)
+            elif campos:
+                if game_id not in self._partidas:
+                    raise ValueError(f"Partida com ID '{game_id}' não encontrada.")
+                self._partidas[game_id].update(copy.deepcopy(campos))
+
+    def listar_para_arquivar(self, inativas_ate, encerradas_ate, legado=False):
+        with self._lock:
+            return [game_id for game_id, documento in self._partidas.items()
+                    if "arquivada" not in documento and (legado or documento.get("updated_at") is not None)
+                    and ((documento.get("updated_at") or "") < inativas_ate
+                         or (documento.get("finished_at") and (documento.get("updated_at") or "") < encerradas_ate))]
+
+    def exportar_partida(self, game_id):
+        documento = self.carregar_partida(game_id)
+        if documento is None:
+            return None
+        with self._lock:
+            checkpoints = self._checkpoints.get(game_id, {})
+            checkpoints = [copy.deepcopy(checkpoints[n]) for n in sorted(checkpoints)]
+        return {"documento": documento, "jogadas": self.listar_jogadas(game_id),
+                "eventos": self.listar_eventos(game_id), "checkpoints": checkpoints}
+
+    def substituir_por_lapide(self, game_id, lapide, versao):
+        with self._lock:
+            if _versao(self._partidas.get(game_id)) != versao:
+                raise ConflitoDeVersao(game_id, versao, _versao(self._partidas.get(game_id)))
+            self._partidas[game_id] = copy.deepcopy(lapide)
+            for registros in (self._jogadas, self._eventos, self._checkpoints):
+                registros.pop(game_id, None)
+
+    def descartar(self, game_id):
+        """Esquece a partida (usado pelo cache de partidas)."""
+        with self._lock:
+            for registros in (self._partidas, self._jogadas, self._eventos, self._checkpoints):
+                registros.pop(game_id, None)
+
+
+# Esquema do SQLite. A tabela de jogadas é normalizada: os campos mais
+# consultados viram colunas, o restante da jogada fica em "dados" (JSON)
+# e o delta de desfazer numa coluna própria, regravável sem tocar na jogada.
+ESQUEMA_SQLITE = """
+    CREATE TABLE IF NOT EXISTS partidas (
+        game_id   TEXT PRIMARY KEY,
+        documento TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS jogadas (
+        game_id    TEXT    NOT NULL,
+        seq        INTEGER NOT NULL,
+        jogador    TEXT,
+        jogo       TEXT,
+        round_mode TEXT,
+        pontos     INTEGER,
+        dados      TEXT    NOT NULL,
+        undo       TEXT,
+        PRIMARY KEY (game_id, seq)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS eventos (
+        game_id TEXT    NOT NULL,
+        n       INTEGER NOT NULL,
+        tipo    TEXT    NOT NULL,
+        dados   TEXT    NOT NULL,
+        PRIMARY KEY (game_id, n)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        game_id TEXT    NOT NULL,
+        n       INTEGER NOT NULL,
+        dados   TEXT    NOT NULL,
+        PRIMARY KEY (game_id, n)
+    ) WITHOUT ROWID;
+"""
+
+# Índices das buscas filtradas de jogadas (GET /plays), um por campo de busca
+INDICES_SQLITE = "".join(f"""
+    CREATE INDEX IF NOT EXISTS jogadas_{coluna} ON jogadas (game_id, {coluna}, seq);""" for coluna in CAMPOS_BUSCA)
+# Do mais para o menos seletivo: 13 jogos, até 4 jogadores, 2 modos de rodada
+ORDEM_SELETIVIDADE = ("jogo", "jogador", "round_mode")
+
+# Comandos fixos: o sqlite3 guarda cada um já compilado (cache por conexão)
+SQL_INSERIR_PARTIDA = "INSERT INTO partidas (game_id, documento) VALUES (?, ?)"
+SQL_CARREGAR_PARTIDA = "SELECT documento FROM partidas WHERE game_id = ?"
+SQL_CARREGAR_VERSAO = "SELECT coalesce(json_extract(documento, '$.version'), 0) FROM partidas WHERE game_id = ?"
+SQL_GRAVAR_PARTIDA = "UPDATE partidas SET documento = ? WHERE game_id = ?"
+SQL_CARREGAR_JOGADA = "SELECT seq, dados, undo FROM jogadas WHERE game_id = ? AND seq = ?"
+SQL_LISTAR_JOGADAS = "SELECT seq, dados, undo FROM jogadas WHERE game_id = ? AND seq >= ? AND seq < ? ORDER BY seq"
+SQL_INSERIR_JOGADA = ("INSERT OR REPLACE INTO jogadas (game_id, seq, jogador, jogo, round_mode, pontos, dados, undo) "
+                      "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+SQL_REMOVER_JOGADA = "DELETE FROM jogadas WHERE game_id = ? AND seq = ?"
+SQL_GRAVAR_UNDO = "UPDATE jogadas SET undo = ? WHERE game_id = ? AND seq = ?"
+SQL_LISTAR_EVENTOS = "SELECT dados FROM eventos WHERE game_id = ? AND n >= ? AND n < ? ORDER BY n"
+SQL_INSERIR_EVENTO = "INSERT INTO eventos (game_id, n, tipo, dados) VALUES (?, ?, ?, ?)"
+SQL_CARREGAR_CHECKPOINT = "SELECT dados FROM checkpoints WHERE game_id = ? AND n <= ? ORDER BY n DESC LIMIT 1"
+SQL_INSERIR_CHECKPOINT = "INSERT OR REPLACE INTO checkpoints (game_id, n, dados) VALUES (?, ?, ?)"
+SQL_LISTAR_CHECKPOINTS = "SELECT dados FROM checkpoints WHERE game_id = ? ORDER BY n"
+# Com legado (3º parâmetro = 1), "updated_at" ausente conta como parada desde sempre
+SQL_LISTAR_PARA_ARQUIVAR = """
+    SELECT game_id FROM partidas
+    WHERE json_extract(documento, '$.arquivada') IS NULL
+      AND (json_extract(documento, '$.updated_at') IS NOT NULL OR ?3)
+      AND (COALESCE(json_extract(documento, '$.updated_at'), '') < ?1
+           OR (json_extract(documento, '$.finished_at') IS NOT NULL
+               AND COALESCE(json_extract(documento, '$.updated_at'), '') < ?2))
+"""
+SQL_APAGAR_PARTIDA = ["DELETE FROM jogadas WHERE game_id = ?", "DELETE FROM eventos WHERE game_id = ?",
+                      "DELETE FROM checkpoints WHERE game_id = ?"]
+
+
+class SQLiteGameStore(GameStore):
+    """
+    Partidas num arquivo SQLite local, sem dependência de nuvem (servidor do clube).
+
+    Usa WAL (leitores não bloqueiam o escritor), uma conexão por thread do
+    gunicorn e uma transação por requisição. O caminho precisa ser um arquivo:
+    o WAL não funciona com bancos ":memory:".
+    """
+
+    def __init__(self, caminho="rauberskat.db"):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._conexao().executescript(ESQUEMA_SQLITE + INDICES_SQLITE)
+
+    def _conexao(self):
+        """Conexão da thread atual (o sqlite3 não compartilha conexões entre threads com segurança)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3  # Só quem usa SQLite paga a importação
+            # isolation_level=None: as transações são abertas explicitamente em _transacao()
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Seguro com WAL; só o último commit pode se perder numa queda de energia
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transacao(self):
+        """BEGIN IMMEDIATE: reserva a escrita já no início e evita deadlock entre threads."""
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _linha_jogada(game_id, jogada):
+        dados = {k: v for k, v in jogada.items() if k not in ("seq", "undo")}
+        undo = jogada.get("undo")
+        # Registro compacto (rauberskat_codec): as colunas guardam os códigos
+        # (índice do jogador, código do jogo e da rodada); no antigo, os nomes
+        pontos = (dados.get("r") or [None])[0] if "v" in dados else (dados.get("result") or {}).get("points")
+        colunas = tuple(_campos_busca(dados).values()) + (pontos,)
+        return (game_id, jogada["seq"], *colunas, json.dumps(dados, separators=(",", ":")),
+                json.dumps(undo, separators=(",", ":")) if undo is not None else None)
+
+    @staticmethod
+    def _jogada_da_linha(linha):
+        seq, dados, undo = linha
+        jogada = json.loads(dados)
+        jogada["seq"] = seq
+        if undo is not None:
+            jogada["undo"] = json.loads(undo)
+        return jogada
+
+    def criar_partida(self, estado):
+        game_id = os.urandom(10).hex()
+        dados = json.dumps(estado)
+        contar_bytes(len(dados))
+        with self._transacao() as conn:
+            conn.execute(SQL_INSERIR_PARTIDA, (game_id, dados))
+        return game_id
+
+    def carregar_partida(self, game_id):
+        linha = self._conexao().execute(SQL_CARREGAR_PARTIDA, (game_id,)).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def carregar_versao(self, game_id):
+        linha = self._conexao().execute(SQL_CARREGAR_VERSAO, (game_id,)).fetchone()
+        return linha[0] if linha else None
+
+    def carregar_jogada(self, game_id, seq):
+        linha = self._conexao().execute(SQL_CARREGAR_JOGADA, (game_id, seq)).fetchone()
+        return self._jogada_da_linha(linha) if linha else None
+
+    def listar_jogadas(self, game_id, desde=0, ate=None):
+        linhas = self._conexao().execute(SQL_LISTAR_JOGADAS,
+                                         (game_id, desde, ate if ate is not None else 2 ** 62)).fetchall()
+        return [self._jogada_da_linha(linha) for linha in linhas]
+
+    def buscar_jogadas(self, game_id, cursor=None, limite=50, decrescente=False, filtros=None):
+        # Poucas variações de texto (quais filtros vieram e a ordem): todas ficam no cache de comandos
+        filtros = filtros or {}
+        condicoes, parametros = ["game_id = ?"], [game_id]
+        if cursor is not None:
+            condicoes.append("seq <= ?" if decrescente else "seq >= ?")
+            parametros.append(cursor)
+        for coluna in CAMPOS_BUSCA:
+            if coluna in filtros:
+                condicoes.append(f"{coluna} IN ({', '.join('?' * len(filtros[coluna]))})")
+                parametros += filtros[coluna]
+        # Sem estatísticas, o planejador prefere a chave primária (já na ordem
+        # de seq) e percorre a partida toda; o índice do filtro mais seletivo
+        # lê só as jogadas que passam nele
+        indice = next((f" INDEXED BY jogadas_{coluna}" for coluna in ORDEM_SELETIVIDADE if coluna in filtros), "")
+        comando = (f"SELECT seq, dados, undo FROM jogadas{indice} WHERE {' AND '.join(condicoes)} "
+                   f"ORDER BY seq {'DESC' if decrescente else 'ASC'} LIMIT ?")
+        linhas = self._conexao().execute(comando, parametros + [limite]).fetchall()
+        return [self._jogada_da_linha(linha) for linha in linhas]
+
+    def listar_eventos(self, game_id, desde=0, ate=None):
+        linhas = self._conexao().execute(SQL_LISTAR_EVENTOS,
+                                         (game_id, desde, ate if ate is not None else 2 ** 62)).fetchall()
+        return [json.loads(linha[0]) for linha in linhas]
+
+    def carregar_checkpoint(self, game_id, ate=None):
+        linha = self._conexao().execute(SQL_CARREGAR_CHECKPOINT,
+                                        (game_id, ate if ate is not None else 2 ** 62)).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def gravar(self, game_id, documento=None, campos=None, jogadas=(), removidas=(), undos=None, versao=None,
+               eventos=(), checkpoint=None):
+        with self._transacao() as conn:  # Uma transação por requisição (por jogada)
+            if versao is not None or (documento is None and campos):
+                linha = conn.execute(SQL_CARREGAR_PARTIDA, (game_id,)).fetchone()
+                if not linha:
+                    raise ValueError(f"Partida com ID '{game_id}' não encontrada.")
+                atual = json.loads(linha[0])
+                if versao is not None and _versao(atual) != versao:
+                    raise ConflitoDeVersao(game_id, versao, _versao(atual))
+                if documento is None and campos:
+                    documento = atual
+                    documento.update(campos)
+            # JSON só com ASCII: o tamanho do texto é o número de bytes
+            serializados = 0
+            if documento is not None:
+                dados = json.dumps(documento)
+                serializados += len(dados)
+                if conn.execute(SQL_GRAVAR_PARTIDA, (dados, game_id)).rowcount == 0:
+                    conn.execute(SQL_INSERIR_PARTIDA, (game_id, dados))
+            conn.executemany(SQL_REMOVER_JOGADA, [(game_id, seq) for seq in removidas])
+            linhas = [self._linha_jogada(game_id, j) for j in jogadas]
+            serializados += sum(len(linha[-2]) + len(linha[-1] or "") for linha in linhas)
+            conn.executemany(SQL_INSERIR_JOGADA, linhas)
+            linhas = [(json.dumps(entrada), game_id, seq) for seq, entrada in (undos or {}).items()]
+            serializados += sum(len(linha[0]) for linha in linhas)
+            conn.executemany(SQL_GRAVAR_UNDO, linhas)
+            linhas = [(game_id, evento["n"], evento["tipo"], json.dumps(evento)) for evento in eventos]
+            serializados += sum(len(linha[-1]) for linha in linhas)
+            conn.executemany(SQL_INSERIR_EVENTO, linhas)
+            if checkpoint is not None:
+                dados = json.dumps(checkpoint)
+                serializados += len(dados)
+                conn.execute(SQL_INSERIR_CHECKPOINT, (game_id, checkpoint["n"], dados))
+            contar_bytes(serializados)
+
+    def listar_para_arquivar(self, inativas_ate, encerradas_ate, legado=False):
+        # Varredura da tabela de partidas: roda de vez em quando, fora do caminho das jogadas
+        parametros = (inativas_ate, encerradas_ate, int(legado))
+        return [linha[0] for linha in self._conexao().execute(SQL_LISTAR_PARA_ARQUIVAR, parametros)]
+
+    def exportar_partida(self, game_id):
+        documento = self.carregar_partida(game_id)
+        if documento is None:
+            return None
+        checkpoints = [json.loads(linha[0]) for linha in self._conexao().execute(SQL_LISTAR_CHECKPOINTS, (game_id,))]
+        return {"documento": documento, "jogadas": self.listar_jogadas(game_id),
+                "eventos": self.listar_eventos(game_id), "checkpoints": checkpoints}
+
+    def substituir_por_lapide(self, game_id, lapide, versao):
+        with self._transacao() as conn:
+            linha = conn.execute(SQL_CARREGAR_PARTIDA, (game_id,)).fetchone()
+            if not linha:
+                raise ValueError(f"Partida com ID '{game_id}' não encontrada.")
+            if _versao(json.loads(linha[0])) != versao:
+                raise ConflitoDeVersao(game_id, versao, _versao(json.loads(linha[0])))
+            conn.execute(SQL_GRAVAR_PARTIDA, (json.dumps(lapide), game_id))
+            for comando in SQL_APAGAR_PARTIDA:
+                conn.execute(comando, (game_id,))
+
+
+class ClientePreguicoso:
+    """
+    Cria o cliente do banco (criar()) só quando ele é usado pela primeira vez,
+    uma única vez por processo, mesmo com vários threads pedindo ao mesmo
+    tempo. O cold start não importa o SDK nem lê credenciais. Se criar()
+    falhar, o erro sobe para o pedido que tentou e o próximo tenta de novo.
+    """
+
+    def __init__(self, criar):
+        self._criar = criar
+        self._cliente = None
+        self._lock = threading.Lock()
+
+    @property
+    def conectado(self):
+        return self._cliente is not None
+
+    def __call__(self):
+        cliente = self._cliente
+        if cliente is None:
+            with self._lock:
+                if self._cliente is None:
+                    self._cliente = self._criar()
+                cliente = self._cliente
+        return cliente
+
+
+class FirestoreGameStore(GameStore):
+    """
+    Partidas no Firestore: documento em partidas/<id> e uma jogada por
+    documento na subcoleção partidas/<id>/jogadas.
+
+    Cada documento tem limite de 1 MiB: toda escrita é medida (aviso acima
+    de AVISO_BYTES) e checkpoints grandes são divididos em partes em
+    partidas/<id>/checkpoints/<n>/partes/<k>, remontadas na leitura.
+    """
+
+    def __init__(self, db):
+        # O cliente, ou um ClientePreguicoso que só o cria no primeiro uso
+        self._db = db
+
+    @property
+    def db(self):
+        return self._db() if isinstance(self._db, ClientePreguicoso) else self._db
+
+    def _game_ref(self, game_id):
+        return self.db.collection('partidas').document(game_id)
+
+    def _jogada_ref(self, game_id, seq):
+        # ID com zeros à esquerda: a ordem lexicográfica é a ordem das jogadas
+        return self._game_ref(game_id).collection('jogadas').document(f"{seq:06d}")
+
+    # partidas/<id>/eventos/<n> e partidas/<id>/checkpoints/<n>, com o mesmo esquema de IDs
+    def _evento_ref(self, game_id, n):
+        return self._game_ref(game_id).collection('eventos').document(f"{n:06d}")
+
+    def _checkpoint_ref(self, game_id, n):
+        return self._game_ref(game_id).collection('checkpoints').document(f"{n:06d}")
+
+    def _parte_ref(self, game_id, n, parte):
+        return self._checkpoint_ref(game_id, n).collection('partes').document(f"{parte:03d}")
+
+    @staticmethod
+    def _checkpoint_do_doc(doc):
+        """Remonta o checkpoint lido, buscando as partes de transbordo se houver."""
+        checkpoint = doc.to_dict()
+        if checkpoint is not None and "partes" in checkpoint:
+            partes = doc.reference.collection('partes').order_by('parte').stream()
+            checkpoint = _juntar_checkpoint(checkpoint, [parte.to_dict() for parte in partes])
+        return checkpoint
+
+    def criar_partida(self, estado):
+        contar_bytes(_tamanho(estado))
+        update_time, game_ref = self.db.collection('partidas').add(estado)
+        return game_ref.id
+
+    def carregar_partida(self, game_id):
+        return self._game_ref(game_id).get().to_dict()
+
+    def carregar_versao(self, game_id):
+        # Só o campo "version" trafega (a leitura ainda conta como uma no Firestore)
+        doc = self._game_ref(game_id).get(field_paths=["version"])
+        return _versao(doc.to_dict()) if doc.exists else None
+
+    def carregar_jogada(self, game_id, seq):
+        return self._jogada_ref(game_id, seq).get().to_dict()
+
+    def listar_jogadas(self, game_id, desde=0, ate=None):
+        consulta = self._game_ref(game_id).collection('jogadas').where('seq', '>=', desde)
+        if ate is not None:
+            consulta = consulta.where('seq', '<', ate)
+        return [doc.to_dict() for doc in consulta.order_by('seq').stream()]
+
+    def buscar_jogadas(self, game_id, cursor=None, limite=50, decrescente=False, filtros=None):
+        consulta = self._consulta_jogadas(game_id, cursor, decrescente, filtros)
+        if consulta is None:
+            return []
+        return [doc.to_dict() for doc in consulta.limit(limite).stream()]
+
+    def _consulta_jogadas(self, game_id, cursor, decrescente, filtros):
+        """
+        Consulta de buscar_jogadas, ou None se nenhum registro pode passar.
+        Igualdade nos campos do registro compacto + ordem por seq: índices
+        compostos de firestore.indexes.json. Registros antigos (nomes em vez
+        de códigos) só aparecem nas buscas sem filtro.
+        """
+        consulta = self._game_ref(game_id).collection('jogadas')
+        for coluna, aceitos in (filtros or {}).items():
+            codigos = [valor for valor in aceitos if type(valor) is int]
+            if not codigos:
+                return None
+            consulta = consulta.where(CAMPOS_BUSCA[coluna][0], '==', codigos[0])
+        if cursor is not None:
+            consulta = consulta.where('seq', '<=' if decrescente else '>=', cursor)
+        if decrescente:
+            return consulta.order_by('seq', direction='DESCENDING')
+        return consulta.order_by('seq')
+
+    def observar(self, game_id, avisar):
+        # Listener em tempo real do documento: o SDK mantém a conexão e chama
+        # avisar a cada alteração (e uma vez logo ao assinar)
+        watch = self._game_ref(game_id).on_snapshot(lambda documentos, mudancas, quando: avisar())
+        return watch.unsubscribe
+
+    def listar_eventos(self, game_id, desde=0, ate=None):
+        consulta = self._game_ref(game_id).collection('eventos').where('n', '>=', desde)
+        if ate is not None:
+            consulta = consulta.where('n', '<', ate)
+        return [doc.to_dict() for doc in consulta.order_by('n').stream()]
+
+    def carregar_checkpoint(self, game_id, ate=None):
+        consulta = self._game_ref(game_id).collection('checkpoints')
+        if ate is not None:
+            consulta = consulta.where('n', '<=', ate)
+        for doc in consulta.order_by('n', direction='DESCENDING').limit(1).stream():
+            return self._checkpoint_do_doc(doc)
+        return None
+
+    def gravar(self, game_id, documento=None, campos=None, jogadas=(), removidas=(), undos=None, versao=None,
+               eventos=(), checkpoint=None):
+        operacoes = self._operacoes(game_id, documento, campos, jogadas, removidas, undos, eventos, checkpoint)
+        if versao is not None:
+            # Condicional: a versão e todas as escritas numa única transação.
+            # Dividida em lotes, os primeiros seriam gravados sem a conferência.
+            self._commit_condicional(game_id, versao, operacoes)
+            return
+        for lote in _lotes(operacoes):
+            batch = self.db.batch()
+            self._aplicar(batch, lote)
+            batch.commit()
+
+    def _operacoes(self, game_id, documento, campos, jogadas, removidas, undos, eventos, checkpoint):
+        """Operações de uma gravação (já medidas); o documento principal vai por último."""
+        operacoes = []
+        for seq in removidas:
+            operacoes.append(("delete", self._jogada_ref(game_id, seq), None))
+        for jogada in jogadas:
+            operacoes.append(("set", self._jogada_ref(game_id, jogada["seq"]), jogada))
+        for seq, entrada in (undos or {}).items():
+            operacoes.append(("update", self._jogada_ref(game_id, seq), {"undo": entrada}))
+        for evento in eventos:
+            operacoes.append(("set", self._evento_ref(game_id, evento["n"]), evento))
+        if checkpoint is not None:
+            checkpoint, partes = _dividir_checkpoint(checkpoint)
+            for parte in partes:
+                operacoes.append(("set", self._parte_ref(game_id, parte["n"], parte["parte"]), parte))
+            operacoes.append(("set", self._checkpoint_ref(game_id, checkpoint["n"]), checkpoint))
+        if documento is not None:
+            operacoes.append(("set", self._game_ref(game_id), documento))
+        elif campos:
+            operacoes.append(("update", self._game_ref(game_id), campos))
+        contar_bytes(sum(_medir(game_id, f"{tipo} em {ref.id}", dados)
+                         for tipo, ref, dados in operacoes if dados is not None))
+        return operacoes
+
+    def listar_para_arquivar(self, inativas_ate, encerradas_ate, legado=False):
+        # Duas consultas de um campo só (índices automáticos do Firestore)
+        partidas = self.db.collection('partidas')
+        ids = [doc.id for doc in partidas.where('updated_at', '<', inativas_ate).stream()]
+        for doc in partidas.where('finished_at', '>', '').stream():
+            atualizada = doc.get('updated_at')
+            if doc.id not in ids and atualizada is not None and atualizada < encerradas_ate:
+                ids.append(doc.id)
+        if legado:
+            # Consultas não acham documentos sem o campo: lê a coleção inteira
+            # (só três campos) e usa o horário da última escrita do documento
+            for doc in partidas.select(['updated_at', 'finished_at', 'arquivada']).stream():
+                dados = doc.to_dict()
+                if "updated_at" in dados or "arquivada" in dados or doc.id in ids:
+                    continue
+                escrita = doc.update_time.astimezone(datetime.timezone.utc).isoformat(timespec="seconds")
+                if escrita < inativas_ate or (dados.get("finished_at") and escrita < encerradas_ate):
+                    ids.append(doc.id)
+        return ids
+
+    def exportar_partida(self, game_id):
+        documento = self.carregar_partida(game_id)
+        if documento is None:
+            return None
+        checkpoints = self._game_ref(game_id).collection('checkpoints').order_by('n').stream()
+        return {"documento": documento, "jogadas": self.listar_jogadas(game_id),
+                "eventos": self.listar_eventos(game_id),
+                "checkpoints": [self._checkpoint_do_doc(doc) for doc in checkpoints]}
+
+    def substituir_por_lapide(self, game_id, lapide, versao):
+        # Primeiro a lápide (condicional à versão); depois as subcoleções, em
+        # lotes. Se a limpeza for interrompida, sobram registros que ninguém lê.
+        self._commit_condicional(game_id, versao, [("set", self._game_ref(game_id), lapide)])
+        refs = []
+        for colecao in ('jogadas', 'eventos', 'checkpoints'):
+            for doc in self._game_ref(game_id).collection(colecao).stream():
+                if colecao == 'checkpoints' and "partes" in doc.to_dict():
+                    refs += [parte.reference for parte in doc.reference.collection('partes').stream()]
+                refs.append(doc.reference)
+        for inicio in range(0, len(refs), LIMITE_ESCRITAS_LOTE):
+            batch = self.db.batch()
+            for ref in refs[inicio:inicio + LIMITE_ESCRITAS_LOTE]:
+                batch.delete(ref)
+            batch.commit()
+
+    @staticmethod
+    def _aplicar(escritor, operacoes):
+        """Registra as operações num lote (batch) ou numa transação."""
+        for tipo, ref, dados in operacoes:
+            if tipo == "delete":
+                escritor.delete(ref)
+            else:
+                getattr(escritor, tipo)(ref, dados)
+
+    def _commit_condicional(self, game_id, versao, operacoes):
+        """
+        Grava as operações numa transação que antes confere a versão do
+        documento: custa uma leitura a mais, mas não bloqueia outras partidas.
+        """
+        from firebase_admin import firestore
+        game_ref = self._game_ref(game_id)
+
+        @firestore.transactional
+        def aplicar(transacao):
+            atual = game_ref.get(transaction=transacao).to_dict()
+            if atual is None:
+                raise ValueError(f"Partida com ID '{game_id}' não encontrada.")
+            if _versao(atual) != versao:
+                raise ConflitoDeVersao(game_id, versao, _versao(atual))
+            FirestoreGameStore._aplicar(transacao, operacoes)
+
+        aplicar(self.db.transaction())
+
+
+class LatenciaSimulada:
+    """
+    Espera fixa antes de cada chamada ao armazenamento, só para benchmarks
+    (RAUBERSKAT_LATENCIA_MS): SQLite ou memória com as idas e voltas de um
+    banco remoto como o Firestore.
+    """
+
+    def __init__(self, store, segundos):
+        self.store = store
+        self.segundos = segundos
+
+    def __getattr__(self, nome):
+        metodo = getattr(self.store, nome)
+
+        def com_espera(*args, **kwargs):
+            time.sleep(self.segundos)
+            return metodo(*args, **kwargs)
+        return com_espera
+
+
+def criar_store(tipo=None, db=None, caminho=None):
+    """
+    Cria o armazenamento configurado.
+    tipo: "firestore", "sqlite" ou "memory" (padrão: variável RAUBERSKAT_STORAGE,
+    ou "firestore"). O SQLite usa o arquivo de RAUBERSKAT_SQLITE_PATH.
+    """
+    tipo = (tipo or os.environ.get("RAUBERSKAT_STORAGE", "firestore")).lower()
+    if tipo == "memory":
+        return MemoryGameStore()
+    if tipo == "sqlite":
+        return SQLiteGameStore(caminho or os.environ.get("RAUBERSKAT_SQLITE_PATH", "rauberskat.db"))
+    if tipo == "firestore":
+        if db is None:
+            raise ValueError("O armazenamento Firestore precisa de um cliente (db) inicializado.")
+        return FirestoreGameStore(db)
+    raise ValueError(f"Armazenamento desconhecido: '{tipo}'. Use firestore, sqlite ou memory.")
@@ -0,0 +1,86 @@
+"""
+Verificação do fluxo de eventos: reconstruir(ate=n) contra o estado ao vivo.
+
+Joga partidas aleatórias em memória (jogadas, decisões de Ramsch e
+desfazer, cada uma gravada como numa requisição da API), guarda o estado
+depois de cada evento e depois reconstrói a partida em cada ponto a partir
+dos checkpoints e dos eventos. O intervalo de checkpoint é reduzido para
+que desfazer logo depois de um checkpoint aconteça com frequência.
+
+Sai com código 1 se algum ponto divergir, então serve de verificação no CI.
+
+Uso:
+    python verificar_eventos.py [partidas] [acoes_por_partida] [intervalo_checkpoint]
+"""
+import contextlib
+import io
+import random
+import sys
+
+import rauberskat_backend_oficial
+from rauberskat_backend_oficial import RauberskatScorekeeper
+from rauberskat_storage import MemoryGameStore
+from bench_storage import jogada_aleatoria
+
+# Campos comparados: o estado das regras (sem versão, horários e checkpoint)
+CAMPOS = ["scores", "current_mode", "dealer_index", "bock_rounds_played", "ramsch_rounds_played",
+          "last_game_name", "ramsch_losses", "ramsch_scores_count", "ramsch_ramsch_count",
+          "dealer_turns_count", "last_scoring_player", "awaiting_ramsch_decision", "ramsch_candidates",
+          "last_was_bonus", "play_count"]
+
+
+def estado(scorekeeper):
+    atual = scorekeeper.get_state()
+    return {campo: atual[campo] for campo in CAMPOS}
+
+
+def jogar(semente, acoes):
+    """Uma partida aleatória; retorna (store, game_id, {event_count: estado ao vivo})."""
+    rng = random.Random(semente)
+    nomes = ["Ana", "Bruno", "Carla", "Davi"]
+    store = MemoryGameStore()
+    game_id = RauberskatScorekeeper.iniciar_jogo(store, nomes)
+    estados = {0: estado(RauberskatScorekeeper(store, game_id))}
+    for _ in range(acoes):
+        scorekeeper = RauberskatScorekeeper(store, game_id)
+        if scorekeeper.awaiting_ramsch_decision:
+            scorekeeper.processar_decisao_ramsch(scorekeeper.ramsch_candidates[0], rng.random() < 0.5)
+        elif rng.random() < 0.25:
+            scorekeeper.undo_last_game()
+        else:
+            try:
+                scorekeeper.processar_jogada(jogada_aleatoria(rng, nomes))
+            except Exception:
+                continue  # Jogada inválida: nada gravado
+        scorekeeper._save_state()
+        estados[scorekeeper.event_count] = estado(scorekeeper)
+    return store, game_id, estados
+
+
+def main():
+    partidas = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    acoes = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    rauberskat_backend_oficial.INTERVALO_CHECKPOINT = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    pontos = erros = 0
+    for semente in range(partidas):
+        with contextlib.redirect_stdout(io.StringIO()):  # As regras imprimem o placar a cada jogada
+            store, game_id, estados = jogar(semente, acoes)
+            reconstruidos = {n: estado(RauberskatScorekeeper.reconstruir(store, game_id, n)) for n in estados}
+        for n, esperado in estados.items():
+            pontos += 1
+            if reconstruidos[n] != esperado:
+                erros += 1
+                if erros <= 5:
+                    diferentes = [campo for campo in CAMPOS if reconstruidos[n][campo] != esperado[campo]]
+                    print(f"❌ Partida {semente}, evento {n}: {', '.join(diferentes)} divergem "
+                          f"(ao vivo {esperado['scores']}, reconstruída {reconstruidos[n]['scores']})")
+
+    if erros:
+        print(f"\n❌ {erros} de {pontos} pontos do fluxo de eventos divergem do estado ao vivo")
+        sys.exit(1)
+    print(f"✅ {pontos} pontos do fluxo de eventos conferem com o estado ao vivo")
+
+
+if __name__ == "__main__":
+    main()